@@ -0,0 +1,86 @@
+import json
+import os
+
+import utils
+from config import ABI_DIR
+
+ETHERSCAN_ABI_URL = 'https://api.etherscan.io/api?module=contract&action=getabi&address='
+
+
+def _event(name, inputs):
+  return {'anonymous': False, 'name': name, 'type': 'event',
+          'inputs': [{'indexed': indexed, 'internalType': kind, 'name': arg, 'type': kind}
+                     for arg, kind, indexed in inputs]}
+
+
+def _view(name, outputs, inputs=()):
+  return {'constant': True, 'name': name, 'payable': False, 'stateMutability': 'view', 'type': 'function',
+          'inputs': [{'internalType': kind, 'name': arg, 'type': kind} for arg, kind in inputs],
+          'outputs': [{'internalType': kind, 'name': arg, 'type': kind} for arg, kind in outputs]}
+
+
+# Events and views of the UniswapV2Pair contract used here, sushiswap pairs share it
+UNIV2_PAIR_ABI = [
+  _event('Approval', [('owner', 'address', True), ('spender', 'address', True), ('value', 'uint256', False)]),
+  _event('Burn', [('sender', 'address', True), ('amount0', 'uint256', False), ('amount1', 'uint256', False),
+                  ('to', 'address', True)]),
+  _event('Mint', [('sender', 'address', True), ('amount0', 'uint256', False), ('amount1', 'uint256', False)]),
+  _event('Swap', [('sender', 'address', True), ('amount0In', 'uint256', False), ('amount1In', 'uint256', False),
+                  ('amount0Out', 'uint256', False), ('amount1Out', 'uint256', False), ('to', 'address', True)]),
+  _event('Sync', [('reserve0', 'uint112', False), ('reserve1', 'uint112', False)]),
+  _event('Transfer', [('from', 'address', True), ('to', 'address', True), ('value', 'uint256', False)]),
+  _view('totalSupply', [('', 'uint256')]),
+  _view('balanceOf', [('', 'uint256')], [('', 'address')]),
+  _view('decimals', [('', 'uint8')]),
+  _view('getReserves', [('_reserve0', 'uint112'), ('_reserve1', 'uint112'), ('_blockTimestampLast', 'uint32')]),
+  _view('token0', [('', 'address')]),
+  _view('token1', [('', 'address')]),
+]
+
+# keccak of the event signatures, topic0 of the logs
+EVENT_TOPICS = {
+  'Approval': '0x8c5be1e5ebec7d5bd14f71427d1e84f3dd0314c0f7b2291e5b200ac8c7c3b925',
+  'Burn': '0xdccd412f0b1252819cb1fd330b93224ca42612892bb3f4f789976e6d81936496',
+  'Mint': '0x4c209b5fc8ad50758f13e2e1088ba56a560dff690a1c6fef26394f4c03821c4f',
+  'Swap': '0xd78ad95fa46c994b6551d0da85fc275fe613ce37657fb8d5e3d130840159d822',
+  'Sync': '0x1c411e9a96e071241c2f21f7726b17ae89e3cab4c78be50e062b03a9fffbbad1',
+  'Transfer': '0xddf252ad1be2c89b69c2b068fc378daa952ba7f163c4a11628f55a4df523b3ef',
+}
+
+
+def getABI(contract_address, path=ABI_DIR, default=UNIV2_PAIR_ABI, session=None):
+  """
+  ABI of a contract from the on-disk registry, downloaded from etherscan the first time only
+  :param contract_address: contract address
+  :param path: folder of the registry, one <address>.json per contract
+  :param default: ABI used for contracts etherscan has no verified source for, the UniV2 pair by default
+  :param session: requests session to reuse
+  :return: ABI as a list of entries
+  """
+  file = os.path.join(path, contract_address.lower() + '.json')
+  try:
+    with open(file) as f:
+      return json.load(f)
+  except (FileNotFoundError, ValueError):
+    pass
+  session = session or utils.httpSession()
+  res = session.get(ETHERSCAN_ABI_URL + contract_address)
+  result = res.json()['result']
+  try:
+    abi = json.loads(result)
+  except ValueError:
+    # e.g. 'Contract source code not verified' or a rate limit message, not saved
+    return default
+  registerABI(contract_address, abi, path)
+  return abi
+
+
+def registerABI(contract_address, abi, path=ABI_DIR):
+  """
+  Saves the ABI of a contract in the registry
+  """
+  os.makedirs(path, exist_ok=True)
+  file = os.path.join(path, contract_address.lower() + '.json')
+  with open(file + '.tmp', 'w') as f:
+    json.dump(abi, f)
+  os.replace(file + '.tmp', file)
@@ -0,0 +1,90 @@
+import json
+import time
+
+import pandas as pd
+import requests
+
+import instrument
+import utils
+from config import RPC_BATCH_SIZE, RPC_RETRIES
+
+TOTAL_SUPPLY_SELECTOR = '0x18160ddd'
+
+
+class BatchCallError(Exception):
+  pass
+
+
+def batchCall(url, calls, batch_size=RPC_BATCH_SIZE, retries=RPC_RETRIES, session=None, pool=None):
+  """
+  Sends JSON-RPC calls as batch arrays, several calls per http request. Calls answered with
+  an error are sent again in the next round, alone with the other failures
+  :param url: node url
+  :param calls: list of (method, params)
+  :param batch_size: calls per http request
+  :param retries: rounds before giving up on the failing calls
+  :param session: requests session to reuse, the shared one by default
+  :param pool: ProviderPool sending the batches instead of url, see archive_node.providers
+  :return: list of results in the order of calls
+  """
+  session = session or utils.httpSession()
+  results = [None] * len(calls)
+  todo = list(range(len(calls)))
+  errors = {}
+  for attempt in range(retries):
+    failed = []
+    for start in range(0, len(todo), batch_size):
+      ids = todo[start:start + batch_size]
+      payload = [{'jsonrpc': '2.0', 'id': i, 'method': calls[i][0], 'params': calls[i][1]} for i in ids]
+      try:
+        if pool is None:
+          response = session.post(url, json=payload, timeout=60)
+          response.raise_for_status()
+          answer = response.json()
+        else:
+          answer = pool.post(json.dumps(payload).encode())
+      except (requests.RequestException, ValueError, ConnectionError) as e:
+        errors.update({i: str(e) for i in ids})
+        failed += ids
+        continue
+      if isinstance(answer, dict):
+        # the whole batch refused with a single error object
+        errors.update({i: answer.get('error', answer) for i in ids})
+        failed += ids
+        continue
+      answers = {a['id']: a for a in answer}
+      for i in ids:
+        answer = answers.get(i, {'error': 'missing from the batch answer'})
+        if 'result' in answer:
+          results[i] = answer['result']
+        else:
+          errors[i] = answer['error']
+          failed.append(i)
+    todo = failed
+    if len(todo) == 0:
+      return results
+    instrument.count(instrument.endpointName(url), retries=len(todo), backoff_s=2 ** attempt)
+    time.sleep(2 ** attempt)
+  raise BatchCallError('%d calls failed, first: %s %s' % (len(todo), calls[todo[0]], errors[todo[0]]))
+
+
+def totalSupplies(url, contract_address, blocks, batch_size=RPC_BATCH_SIZE, retries=RPC_RETRIES, pool=None):
+  """
+  Historical totalSupply of a token read with batched eth_calls
+  :param url: archive node url
+  :param contract_address: token contract
+  :param blocks: blocks to read the supply at
+  :param batch_size: eth_calls per http request
+  :param retries: rounds before giving up on the failing calls
+  :param pool: ProviderPool sending the batches instead of url
+  :return: dataframe indexed by block (int64) with the exact supply as python ints in 'Supply', 0 before the
+  contract was deployed
+  """
+  blocks = [int(b) for b in blocks]
+  calls = [('eth_call', [{'to': contract_address, 'data': TOTAL_SUPPLY_SELECTOR}, hex(b)]) for b in blocks]
+  results = batchCall(url, calls, batch_size=batch_size, retries=retries, pool=pool)
+  # an empty result is a call to a contract not deployed yet at that block, which has no supply
+  supply = pd.DataFrame({'Supply': pd.Series([int(r, 16) if r not in ('0x', '') else 0 for r in results],
+                                             index=blocks, dtype=object)})
+  supply.index = pd.Index(blocks, dtype='int64', name='block')
+  return supply
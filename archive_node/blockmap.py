@@ -0,0 +1,180 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import utils
+from config import BLOCK_DATE_MAP, BLOCK_HEADER_CACHE, RPC_BATCH_SIZE, REORG_DEPTH
+from archive_node.batch import batchCall
+from archive_node.node import provider, latestBlock
+from archive_node.providers import PooledProvider
+
+# a search step that does not halve the bracket is followed by a bisection step
+MIN_SHRINK = 0.5
+# blocks probed on both sides of an interpolation guess, as a fraction of the bracket, so that a guess
+# a little off still closes a narrow bracket around the target
+SEARCH_MARGIN = 64
+
+
+class HeaderCache:
+  def __init__(self, path=BLOCK_HEADER_CACHE):
+    """
+    Timestamps of every block header read by the map builder, kept on disk so that later searches start
+    from brackets already narrow. Headers within REORG_DEPTH of the head are only kept in memory
+    :param path: tab separated Block/Timestamp file, None to keep the cache in memory
+    """
+    self.path = path
+    self.times = {}
+    if path is not None and os.path.exists(path):
+      saved = pd.read_csv(path, sep='\t')
+      self.times = dict(zip(saved['Block'].tolist(), saved['Timestamp'].tolist()))
+    self.saved = set(self.times)
+    self._sorted = None
+
+  def sorted(self):
+    """
+    :return: cached blocks and their timestamps, sorted
+    """
+    if self._sorted is None:
+      blocks = np.fromiter(sorted(self.times), dtype='int64', count=len(self.times))
+      self._sorted = blocks, np.array([self.times[b] for b in blocks.tolist()], dtype='int64')
+    return self._sorted
+
+  def fetch(self, blocks, node=None, batch_size=RPC_BATCH_SIZE):
+    """
+    Reads the headers not cached yet with batched eth_getBlockByNumber calls
+    :param blocks: block numbers
+    :param node: web3 connection, provider() if None
+    :param batch_size: calls per http request
+    :return: timestamps of the blocks
+    """
+    missing = sorted(set(int(b) for b in blocks) - set(self.times))
+    if len(missing) > 0:
+      node = provider() if node is None else node
+      pool = node.provider.pool if isinstance(node.provider, PooledProvider) else None
+      headers = batchCall(node.provider.endpoint_uri, [('eth_getBlockByNumber', [hex(b), False]) for b in missing],
+                          batch_size=batch_size, pool=pool)
+      for block, header in zip(missing, headers):
+        if header is None:
+          raise ValueError('block %d is after the head' % block)
+        self.times[block] = int(header['timestamp'], 16)
+      self._sorted = None
+      instrument.count('block headers', headers=len(missing))
+    return np.array([self.times[int(b)] for b in blocks], dtype='int64')
+
+  def save(self, head):
+    """
+    Writes the headers out of reach of reorgs
+    :param head: chain head
+    """
+    if self.path is None:
+      return
+    final = {b for b in self.times if b <= head - REORG_DEPTH}
+    if final <= self.saved:
+      return
+    blocks, times = self.sorted()
+    keep = blocks <= head - REORG_DEPTH
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+    pd.DataFrame({'Block': blocks[keep], 'Timestamp': times[keep]}).to_csv(self.path + '.tmp', sep='\t', index=False)
+    os.replace(self.path + '.tmp', self.path)
+    self.saved = final
+
+
+def lastBlocksBefore(timestamps, node=None, cache=None, head=None):
+  """
+  Last block mined strictly before each timestamp. Every target keeps a bracket of cached blocks, one before and
+  one at or after it, and probes where the timestamp falls by linear interpolation in it, the next block so that
+  an exact guess closes the bracket at once, and a block on each side of the guess so that a guess a little off
+  leaves a narrow bracket. A step that does not halve the bracket is followed by a bisection step. The probes
+  of all targets of a round go out in one batch, and narrow the brackets of the neighbouring targets too
+  :param timestamps: unix times, before the head timestamp
+  :param node: web3 connection, provider() if None
+  :param cache: HeaderCache, in memory if None
+  :param head: chain head, read from the node if None
+  :return: array of block numbers
+  """
+  node = provider() if node is None else node
+  cache = HeaderCache(None) if cache is None else cache
+  head = latestBlock(node) if head is None else head
+  targets = np.asarray(timestamps, dtype='int64')
+  first_time, head_time = cache.fetch([0, head], node)
+  if (targets > head_time).any() or (targets <= first_time).any():
+    raise ValueError('timestamps out of the chain, from block 0 to the head block %d' % head)
+  width = np.full(len(targets), np.inf)
+  while True:
+    blocks, times = cache.sorted()
+    hi = np.searchsorted(times, targets, side='left')
+    lo = hi - 1
+    lo_block, hi_block = blocks[lo], blocks[hi]
+    todo = hi_block - lo_block > 1
+    if not todo.any():
+      return lo_block
+    bisect = todo & (hi_block - lo_block > MIN_SHRINK * width)
+    width = np.where(todo, hi_block - lo_block, width)
+    guess = lo_block + (targets - times[lo]) * (hi_block - lo_block) // np.maximum(times[hi] - times[lo], 1)
+    guess = np.where(bisect, (lo_block + hi_block) // 2, guess)[todo]
+    lo_block, hi_block, margin = lo_block[todo], hi_block[todo], np.maximum(width[todo] // SEARCH_MARGIN, 1)
+    probes = np.concatenate([guess, guess + 1, guess - margin, guess + margin])
+    probes = np.clip(probes, np.tile(lo_block + 1, 4), np.tile(hi_block - 1, 4))
+    cache.fetch(np.unique(probes), node)
+
+
+def dayTimestamps(days):
+  """
+  :param days: datetime64[D] array
+  :return: unix time of the UTC midnight starting each day
+  """
+  return np.asarray(days, dtype='datetime64[D]').astype('datetime64[s]').astype('int64')
+
+
+@instrument.timed('block map')
+def buildBlockMap(start_day=None, end_day=None, node=None, path=BLOCK_DATE_MAP, cache=None, rebuild=False):
+  """
+  Extends the block map to a range of days, each day gets the last block before its UTC midnight so that
+  BlockDateIndex maps the blocks after it to the day. The days between the range and the rows already in the
+  map are added too so that it has no gap
+  :param start_day: first day, the first day of the map if None
+  :param end_day: last day, the last day whose midnight is out of reach of reorgs if None
+  :param node: web3 connection, provider() if None
+  :param path: tab separated Day/Block map, created if missing
+  :param cache: HeaderCache, the one in BLOCK_HEADER_CACHE if None
+  :param rebuild: search the days already in the map again
+  :return: number of days written
+  """
+  node = provider() if node is None else node
+  cache = HeaderCache() if cache is None else cache
+  head = latestBlock(node)
+  existing = pd.read_csv(path, index_col=0, sep='\t') if os.path.exists(path) else \
+      pd.DataFrame({'Block': pd.Series(dtype='int64')}, index=pd.Index([], name='Day'))
+  known = existing.index.to_numpy(dtype='datetime64[D]')
+  if end_day is None:
+    safe_time = cache.fetch([max(head - REORG_DEPTH, 0)], node)[0]
+    end_day = np.datetime64(int(safe_time // 86400), 'D')
+  if start_day is None and len(known) == 0:
+    raise ValueError('%s is missing, a start_day is needed to create it' % path)
+  start_day = np.datetime64(start_day, 'D') if start_day is not None else known.min()
+  end_day = np.datetime64(end_day, 'D')
+  if len(known) > 0:
+    start_day, end_day = min(start_day, known.min()), max(end_day, known.max())
+  days = np.arange(start_day, end_day + np.timedelta64(1, 'D'))
+  if not rebuild:
+    days = days[~np.isin(days, known)]
+  if len(days) > 0:
+    found = pd.DataFrame({'Block': lastBlocksBefore(dayTimestamps(days), node, cache, head)},
+                         index=pd.Index(np.datetime_as_string(days), name='Day'))
+    existing = pd.concat([existing[~existing.index.isin(found.index)], found]).sort_index()
+    existing.to_csv(path + '.tmp', sep='\t')
+    os.replace(path + '.tmp', path)
+    # the index of the map is loaded once per process
+    utils.blockDateIndex.cache_clear()
+  cache.save(head)
+  return len(days)
+
+
+def updateBlockMap(node=None, path=BLOCK_DATE_MAP, cache=None):
+  """
+  Adds the days after the last one of the map, up to the current day once its midnight is out of reach of reorgs
+  :return: number of days added
+  """
+  return buildBlockMap(node=node, path=path, cache=cache)
@@ -0,0 +1,107 @@
+import numpy as np
+import pandas as pd
+import web3
+
+import instrument
+import numeric
+from archive_node.abi import UNIV2_PAIR_ABI
+
+# event name -> (indexed argument names, non indexed argument names), from the pair ABI
+LAYOUTS = {e['name']: ([i['name'] for i in e['inputs'] if i['indexed']],
+                       [i['name'] for i in e['inputs'] if not i['indexed']])
+           for e in UNIV2_PAIR_ABI if e['type'] == 'event'}
+
+# hex digit value of each character code
+_NIBBLES = np.zeros(128, dtype='int64')
+_NIBBLES[ord('0'):ord('9') + 1] = np.arange(10)
+_NIBBLES[ord('a'):ord('f') + 1] = np.arange(10, 16)
+_NIBBLES[ord('A'):ord('F') + 1] = np.arange(10, 16)
+
+
+def hexQuantities(values):
+  """
+  Parses 0x hex quantities (block numbers, log indexes) without a python int per value
+  :param values: list of '0x..' strings of at most 16 digits
+  :return: int64 array
+  """
+  chars = np.array(values, dtype='U18')
+  codes = chars.view(np.uint32).reshape(len(chars), 18)
+  lengths = np.char.str_len(chars)
+  out = np.zeros(len(chars), dtype='int64')
+  for position in range(2, 18):
+    valid = position < lengths
+    out = np.where(valid, out * 16 + _NIBBLES[codes[:, position] & 127], out)
+  return out
+
+
+def dataWords(logs, nb_words):
+  """
+  :param logs: raw eth_getLogs entries sharing the same data layout
+  :param nb_words: 32 bytes words in the data of each log
+  :return: uint64 array (logs, words, 4) of big-endian limbs, most significant first
+  """
+  raw = bytes.fromhex(''.join(l['data'][2:] for l in logs))
+  return np.frombuffer(raw, dtype='>u8').reshape(len(logs), nb_words, 4).astype('uint64')
+
+
+def wordsToFloat(limbs):
+  """
+  :param limbs: uint64 array (..., 4) of big-endian limbs
+  :return: float64 values, rounded to 53 bits of mantissa
+  """
+  scale = np.array([2.0 ** 192, 2.0 ** 128, 2.0 ** 64, 1.0])
+  return (limbs.astype('float64') * scale).sum(axis=-1)
+
+
+def wordsToInt(limbs):
+  """
+  :param limbs: uint64 array (n, 4) of big-endian limbs
+  :return: object array of exact python ints, as web3 decodes them
+  """
+  raw = limbs.astype('>u8').tobytes()
+  return np.array([int.from_bytes(raw[i:i + 32], 'big') for i in range(0, len(raw), 32)], dtype=object)
+
+
+def _addresses(topics):
+  """
+  :param topics: 32 bytes topics holding an address
+  :return: checksummed addresses, computed once per distinct address
+  """
+  unique, inverse = np.unique(np.array(topics, dtype='U66'), return_inverse=True)
+  checksummed = np.array([web3.Web3.toChecksumAddress('0x' + t[26:]) for t in unique], dtype=object)
+  return checksummed[inverse]
+
+
+@instrument.timed('decode')
+def decodeLogs(logs, event_name, exact=True, decimals=None):
+  """
+  Decodes raw UniV2 pair logs of one event type in bulk, giving the same columns as cleanLog
+  on web3 decoded events. Hashes are kept as 0x hex strings
+  :param logs: raw eth_getLogs entries
+  :param event_name: 'Swap', 'Sync', 'Mint', 'Burn', 'Transfer' or 'Approval'
+  :param exact: uint fields as exact python ints like web3, otherwise float64
+  :param decimals: dict of uint field -> token decimals, those fields are given in token units as float64
+  straight from the raw words, see numeric.scaleUnits
+  :return: dataframe, one row per log
+  """
+  if len(logs) == 0:
+    return pd.DataFrame()
+  indexed, fields = LAYOUTS[event_name]
+  columns = {
+    'address': _addresses(['0x' + '0' * 24 + l['address'][2:] for l in logs]),
+    'blockHash': np.array([l['blockHash'] for l in logs], dtype=object),
+    'blockNumber': hexQuantities([l['blockNumber'] for l in logs]),
+    'event': np.full(len(logs), event_name, dtype=object),
+    'logIndex': hexQuantities([l['logIndex'] for l in logs]),
+    'transactionHash': np.array([l['transactionHash'] for l in logs], dtype=object),
+    'transactionIndex': hexQuantities([l['transactionIndex'] for l in logs]),
+  }
+  for i, name in enumerate(indexed):
+    columns[name] = _addresses([l['topics'][i + 1] for l in logs])
+  words = dataWords(logs, len(fields))
+  for i, name in enumerate(fields):
+    if decimals is not None and name in decimals:
+      columns[name] = numeric.scaleUnits(numeric.limbsFromWords(words[:, i]), decimals[name])
+    else:
+      columns[name] = wordsToInt(words[:, i]) if exact else wordsToFloat(words[:, i])
+  return pd.DataFrame(columns)
@@ -1,107 +1,292 @@
-import requests
-import time
+import hashlib
+import os
+from functools import lru_cache
+import numpy as np
 import pandas as pd
-from config import PROVIDER_URL
+import instrument
+import utils
+from config import PROVIDER_URLS, SCAN_CHECKPOINT_DIR, RPC_BATCH_SIZE
+from archive_node.abi import getABI, EVENT_TOPICS
+from archive_node.batch import totalSupplies
+from archive_node.decode import decodeLogs, LAYOUTS
+from archive_node.providers import ProviderPool, PooledProvider
+from archive_node.scanner import LogScanner, Checkpoint, TooManyResults, isTooManyResults
 import web3
 
-w3 = web3.Web3(web3.HTTPProvider(PROVIDER_URL))
-LATEST_BLOCK=w3.eth.get_block_number()
+ZERO_ADDRESS = '0x0000000000000000000000000000000000000000'
+
+
+class SessionHTTPProvider(web3.HTTPProvider):
+  """
+  HTTPProvider posting through the shared utils.httpSession from every thread, web3 otherwise
+  opens one session per thread, which the scanner workers would not share
+  """
+
+  def make_request(self, method, params):
+    kwargs = self.get_request_kwargs()
+    kwargs.setdefault('timeout', 60)
+    response = utils.httpSession().post(self.endpoint_uri, data=self.encode_rpc_request(method, params), **kwargs)
+    response.raise_for_status()
+    return self.decode_rpc_response(response.content)
+
+
+@lru_cache(maxsize=None)
+def provider(url=None):
+  """
+  web3 connection, created on first use so that importing the module needs no network
+  :param url: node url, None for a ProviderPool over PROVIDER_URLS
+  :return: web3.Web3
+  """
+  if url is None:
+    return web3.Web3(PooledProvider(ProviderPool(PROVIDER_URLS)))
+  return web3.Web3(SessionHTTPProvider(url))
+
+
+def latestBlock(node=None):
+  """
+  :param node: web3 connection, provider() if None
+  :return: current head block number
+  """
+  if node is None:
+    node = provider()
+  return node.eth.get_block_number()
+
 
 def get_ABI(contract_address):
   """
-  get the contract ABi
+  get the contract ABi, from the registry in ABI_DIR once it has been downloaded. Contracts without
+  verified source get the UniV2 pair ABI
   :param contract_address:
   :return:
   """
-  res = requests.get("https://api.etherscan.io/api?module=contract&action=getabi&address="+contract_address)
-  POOL_ABI = res.json()['result']
-  if POOL_ABI=='Contract source code not verified':
-    time.sleep(10)
-    res = requests.get("https://api.etherscan.io/api?module=contract&action=getabi&address=0x8ad599c3a0ff1de082011efddc58f1908eb6e6d8")
-    POOL_ABI = res.json()['result']
-    print(POOL_ABI)
-    return(POOL_ABI)
-  else:
-    return (POOL_ABI)
+  return getABI(contract_address)
 
 
-def _getEvents(contract_address, event_name, start_block, end_block, pool_abi,node=w3):
+def _getEvents(contract_address, event_name, start_block, end_block, pool_abi,node=None,argument_filters=None,
+               fast=True,decimals=None):
+  if node is None:
+    node = provider()
   myContract = node.eth.contract(address=web3.Web3.toChecksumAddress(contract_address), abi=pool_abi)
-  filter_builder = myContract.events[event_name].build_filter()
+  event = myContract.events[event_name]()
+  filter_builder = event.build_filter()
+  for arg, value in (argument_filters or {}).items():
+    filter_builder.args[arg].match_single(value)
   filter_builder.fromBlock = start_block
   filter_builder.toBlock = end_block
-  print('check:', type(start_block), type(end_block))
-  ff = filter_builder.deploy(w3=node)
+  if fast and event_name in LAYOUTS:
+    # raw request, the logs are decoded in bulk instead of going through web3 formatters
+    params = dict(filter_builder.filter_params, fromBlock=hex(start_block), toBlock=hex(end_block))
+    response = node.provider.make_request('eth_getLogs', [params])
+    if 'error' in response:
+      if isTooManyResults(response['error']):
+        raise TooManyResults("too many results")
+      raise ValueError(response['error'])
+    return decodeLogs(response['result'], event_name, decimals=decimals)
   try:
-    df_data = ff.get_all_entries()
-  except:
-    raise ValueError("too many results")
-  else:
-    df = pd.DataFrame(df_data)
-    return cleanLog(df)
-
+    logs = node.eth.get_logs(filter_builder.filter_params)
+  except Exception as e:
+    if isTooManyResults(e):
+      raise TooManyResults("too many results") from e
+    raise
+  df = cleanLog(pd.DataFrame([event.processLog(log) for log in logs]))
+  for column, column_decimals in (decimals or {}).items():
+    if column in df:
+      df[column] = (df[column] / 10 ** int(column_decimals)).astype('float64')
+  return df
 
-def getEvents(contract_address, pool_abi,event_name='Mint', start_block=9000000, end_block=LATEST_BLOCK,node=w3):
-  df = pd.DataFrame()
-  # we need to check how many instances we need to retrieve per query as they are limited to 10000
-  step = 100000
-  download = True
 
+@instrument.timed('log scan')
+def getEvents(contract_address, pool_abi,event_name='Mint', start_block=9000000, end_block="latest",node=None,
+              checkpoint=True,argument_filters=None,fast=True,decimals=None):
+  """
+  Scans the event logs of a contract chunk by chunk, see LogScanner
+  :param contract_address: contract emitting the events
+  :param pool_abi: contract ABI
+  :param event_name: event to extract
+  :param start_block: first block scanned
+  :param end_block: last block scanned, "latest" for the chain head
+  :param node: web3 connection, provider() if None
+  :param checkpoint: keep finished chunks under SCAN_CHECKPOINT_DIR so an interrupted scan resumes
+  :param argument_filters: dict of indexed event argument -> value the logs must match
+  :param fast: decode UniV2 pair events in bulk with decodeLogs rather than with web3
+  :param decimals: dict of uint argument -> token decimals, those columns are in token units (float64)
+  rather than raw python ints, see numeric.scaleUnits
+  :return: decoded logs sorted by block
+  """
+  if node is None:
+    node = provider()
+  latest = latestBlock(node)
   if end_block == "latest":
-    eblock = LATEST_BLOCK
+    eblock = latest
   else:
-    eblock = min(end_block, LATEST_BLOCK)
-  sblock = int(max(start_block, eblock - step))
-  print(sblock, eblock)
-
-  while download:
-    print("download:", sblock, eblock, step)
-    try:
-      df1 = _getEvents(contract_address, event_name, sblock, eblock, pool_abi,node=node)
-    except ValueError:
-      print("wrong")
-      step = int(step / 2)
-      print(step)
-      sblock = max(0, eblock - step)
-      time.sleep(5)  # to avoid hitting API limit
-    else:
-      print("success", len(df1))
-      if len(df1) > 0:
-        df = df1.append(df)
-        # update the step so we have 90% capacity
-        step = int(step * 10000 / len(df1) * 0.9)
-        eblock = sblock - 1
-        sblock = max(start_block, max(0, eblock - step))
-        time.sleep(5)
-
-        if eblock < sblock:
-          download = False
-        else:
-          download = True
-
-      else:
-        download = False
+    eblock = min(end_block, latest)
+  path = None
+  if checkpoint:
+    name = contract_address.lower() + '_' + event_name
+    for arg, value in sorted((argument_filters or {}).items()):
+      name += '_' + arg + '-' + str(value).lower()
+    if not fast:
+      name += '_web3'  # hashes are not stored in the same format
+    for column, column_decimals in sorted((decimals or {}).items()):
+      name += '_' + column + '-e' + str(int(column_decimals))
+    path = os.path.join(SCAN_CHECKPOINT_DIR, name)
+  scanner = LogScanner(lambda s, e: _getEvents(contract_address, event_name, s, e, pool_abi, node=node,
+                                               argument_filters=argument_filters, fast=fast, decimals=decimals),
+                       checkpoint=Checkpoint(path))
+  return scanner.scan(start_block, eblock)
 
-  return df
+def _getUniverseEvents(addresses, event_names, start_block, end_block, node=None, decimals=None):
+  """
+  One eth_getLogs for the events of many contracts, decoded in bulk per event and contract
+  :return: decoded logs of every contract and event, an 'event' column tells them apart
+  """
+  if node is None:
+    node = provider()
+  topics = {EVENT_TOPICS[name]: name for name in event_names}
+  params = {'address': [web3.Web3.toChecksumAddress(a) for a in addresses], 'topics': [list(topics)],
+            'fromBlock': hex(start_block), 'toBlock': hex(end_block)}
+  response = node.provider.make_request('eth_getLogs', [params])
+  if 'error' in response:
+    if isTooManyResults(response['error']):
+      raise TooManyResults("too many results")
+    raise ValueError(response['error'])
+  groups = {}
+  for log in response['result']:
+    groups.setdefault((log['topics'][0], log['address'].lower()), []).append(log)
+  frames = [decodeLogs(logs, topics[topic], decimals=(decimals or {}).get(address))
+            for (topic, address), logs in groups.items()]
+  if len(frames) == 0:
+    return pd.DataFrame()
+  return pd.concat(frames, ignore_index=True)
+
+
+def universeCheckpoint(addresses, event_names=('Swap', 'Sync'), decimals=None):
+  """
+  :return: checkpoint folder of the getUniverseEvents scan of this exact set of pairs, events and scaling
+  """
+  addresses = sorted(set(a.lower() for a in addresses))
+  decimals = {a.lower(): d for a, d in (decimals or {}).items()}
+  key = repr((addresses, sorted(event_names), sorted((a, sorted(d.items())) for a, d in decimals.items())))
+  return os.path.join(SCAN_CHECKPOINT_DIR, 'universe_' + hashlib.sha1(key.encode()).hexdigest()[:16])
 
-def extractSwap(contract_address, pool_abi,start_block=900000,node=w3):
 
-  swap = getEvents(contract_address, pool_abi,'Swap', start_block, LATEST_BLOCK,node=node)
-  print('swap positions extracted')
+@instrument.timed('log scan')
+def getUniverseEvents(addresses, event_names=('Swap', 'Sync'), start_block=900000, end_block="latest", node=None,
+                      checkpoint=True, decimals=None):
+  """
+  Scans the events of many UniV2 pairs together: each block range is one eth_getLogs filtering on the list
+  of addresses and of event topics, so the number of calls depends on the block ranges and not on
+  pools x events. Events with argument filters (mints and burns of extractMintBurn) are not scanned this way
+  :param addresses: pair addresses
+  :param event_names: events of LAYOUTS without argument filters, e.g. 'Swap', 'Sync', 'Mint', 'Burn'
+  :param start_block: first block scanned
+  :param end_block: last block scanned, "latest" for the chain head
+  :param node: web3 connection, provider() if None
+  :param checkpoint: keep finished chunks under SCAN_CHECKPOINT_DIR so an interrupted scan resumes
+  :param decimals: dict of address -> {uint argument: token decimals}, see getEvents
+  :return: dict of (lower case address, event name) -> decoded logs sorted by block, like getEvents returns.
+  Pairs without logs of an event get an empty dataframe
+  """
+  if node is None:
+    node = provider()
+  latest = latestBlock(node)
+  eblock = latest if end_block == "latest" else min(end_block, latest)
+  addresses = sorted(set(a.lower() for a in addresses))
+  decimals = {a.lower(): d for a, d in (decimals or {}).items()}
+  path = universeCheckpoint(addresses, event_names, decimals) if checkpoint else None
+  scanner = LogScanner(lambda s, e: _getUniverseEvents(addresses, event_names, s, e, node=node, decimals=decimals),
+                       checkpoint=Checkpoint(path))
+  logs = scanner.scan(start_block, eblock)
+  events = {(address, name): pd.DataFrame() for address in addresses for name in event_names}
+  if len(logs) > 0:
+    for (address, name), df in logs.groupby([logs['address'].str.lower(), 'event'], sort=False):
+      # columns of the other events are all missing
+      events[(address, name)] = df.dropna(axis=1, how='all').reset_index(drop=True)
+  return events
+
+
+def extractSwap(contract_address, pool_abi,start_block=900000,node=None,decimals=None):
+  """
+  :param decimals: (token0 decimals, token1 decimals) to get the amounts in token units, raw ints if None
+  """
+  swap = getEvents(contract_address, pool_abi,'Swap', start_block, "latest",node=node,
+                   decimals=None if decimals is None else {'amount0In': decimals[0], 'amount0Out': decimals[0],
+                                                           'amount1In': decimals[1], 'amount1Out': decimals[1]})
   return swap
 
 
-def extractSync(contract_address, pool_abi,start_block=900000,node=w3):
+def extractSync(contract_address, pool_abi,start_block=900000,node=None):
   """
   Extracts uni v2 Reserves
   :param contract_address:
   :param start_block:
   :return:
   """
-  reserves = getEvents(contract_address, pool_abi, event_name='Sync', start_block=start_block,end_block= "latest",node=w3)
-  print('swap positions extracted')
+  reserves = getEvents(contract_address, pool_abi, event_name='Sync', start_block=start_block,end_block= "latest",node=node)
   return reserves  # [TO_KEEP_SWAP]
 
+
+def extractMintBurn(contract_address, pool_abi,start_block=900000,node=None):
+  """
+  Extracts the LP token Transfer events from and to the zero address, i.e. the mints and burns
+  :param contract_address: pair address
+  :param start_block: must be before the pair creation for the ledger to start from a 0 supply
+  :return: mints, burns
+  """
+  mints = getEvents(contract_address, pool_abi, event_name='Transfer', start_block=start_block, end_block="latest",
+                    node=node, argument_filters={'from': ZERO_ADDRESS})
+  burns = getEvents(contract_address, pool_abi, event_name='Transfer', start_block=start_block, end_block="latest",
+                    node=node, argument_filters={'to': ZERO_ADDRESS})
+  return mints, burns
+
+
+def supplyLedger(mints, burns):
+  """
+  Rebuilds the LP token supply from its mints and burns
+  :param mints: Transfer logs from the zero address
+  :param burns: Transfer logs to the zero address
+  :return: dataframe indexed by block with the supply at the end of each block where it changed
+  """
+  changes = [mints[['blockNumber', 'value']]] if len(mints) > 0 else []
+  if len(burns) > 0:
+    # the MINIMUM_LIQUIDITY locked at the first mint goes from and to the zero address, it is a mint only
+    burns = burns[burns['from'] != ZERO_ADDRESS]
+    changes.append(pd.DataFrame({'blockNumber': burns['blockNumber'], 'value': -burns['value'].astype(object)}))
+  if len(changes) == 0:
+    return pd.DataFrame(columns=['Supply'], index=pd.Index([], dtype='int64', name='block'))
+  changes = pd.concat(changes).astype({'blockNumber': 'int64', 'value': object})
+  ledger = changes.groupby('blockNumber')['value'].sum().cumsum().to_frame('Supply')
+  ledger.index.name = 'block'
+  return ledger
+
+
+@instrument.timed('supply')
+def supplyFromEvents(contract_address,list_block,pool_abi,start_block=900000,spot_checks=3,node=None,seed=None):
+  """
+  Historical total supply rebuilt from mint and burn events, so it works on a non-archive node
+  :param contract_address: pair address
+  :param list_block: array of block we want the supply at
+  :param start_block: first block scanned, before the pair creation
+  :param spot_checks: number of blocks also read with totalSupply on the node, 0 to skip on a non-archive node
+  :param seed: seed of the spot check sample, e.g. an int or a SeedSequence, fresh entropy if None
+  :return: dataframe indexed by block with the supply in 'Supply', like supply
+  """
+  ledger = supplyLedger(*extractMintBurn(contract_address, pool_abi, start_block=start_block, node=node))
+  list_block = np.asarray(list_block, dtype='int64')
+  # supply at the end of each requested block is the last ledger entry at or before it
+  pos = np.searchsorted(ledger.index.to_numpy(), list_block, side='right') - 1
+  values = np.where(pos >= 0, ledger['Supply'].to_numpy()[np.maximum(pos, 0)], 0)
+  sup = pd.DataFrame({'Supply': pd.Series(values, dtype=object).to_numpy()},
+                     index=pd.Index(list_block, dtype='int64', name='block'))
+  if spot_checks > 0 and len(list_block) > 0:
+    sample = np.random.default_rng(seed).choice(list_block, size=min(spot_checks, len(list_block)), replace=False)
+    archive = supply(contract_address, sample, node=node)
+    mismatch = archive['Supply'] != sup.loc[archive.index, 'Supply']
+    if mismatch.any():
+      raise ValueError('event ledger supply differs from totalSupply at blocks %s, spot checked blocks %s'
+                       % (list(archive.index[mismatch]), sorted(sample.tolist())))
+  return sup
+
 def cleanLog(df_data):
   if len(df_data)>0:
     df = pd.DataFrame(df_data)
@@ -114,25 +299,20 @@ def cleanLog(df_data):
   else:
     return pd.DataFrame()
 
-def _supply(contract_address,block,pool_abi,node=w3):
-  """
-
-  :param contract_address: contract address to query
-  :param list_block: block we want to query
-  :return:
-  """
-  myContract = node.eth.contract(address=web3.Web3.toChecksumAddress(contract_address), abi=pool_abi)
-  try:
-    total=myContract.functions.totalSupply().call(block_identifier=int(block))
-  except:
-    total=0
-  return pd.DataFrame(total,index=[int(block)],columns=['Supply'])
-
-def supply(contract_address,list_block,pool_abi):
+@instrument.timed('supply')
+def supply(contract_address,list_block,pool_abi=None,node=None,batch_size=RPC_BATCH_SIZE):
   """
-
+  Historical total supply, read with batched eth_calls. Raises BatchCallError if some blocks
+  still fail after retries rather than reporting a 0 supply
   :param contract_address: contract address to query
   :param list_block: array of block we want to query
-  :return:
+  :param pool_abi: unused, the totalSupply selector is fixed
+  :param node: web3 connection to an archive node, provider() if None
+  :param batch_size: eth_calls per http request
+  :return: dataframe indexed by block with the supply in 'Supply'
   """
-  return pd.concat([_supply(contract_address,b,pool_abi) for b in list_block])
\ No newline at end of file
+  if node is None:
+    node = provider()
+  pool = node.provider.pool if isinstance(node.provider, PooledProvider) else None
+  return totalSupplies(node.provider.endpoint_uri, web3.Web3.toChecksumAddress(contract_address), list_block,
+                       batch_size=batch_size, pool=pool)
@@ -0,0 +1,189 @@
+import threading
+import time
+
+import pandas as pd
+import requests
+import web3
+
+import instrument
+import utils
+from config import PROVIDER_RATES, PROVIDER_DEFAULT_RATE, PROVIDER_MIN_RATE, PROVIDER_COOLDOWN_SECONDS, \
+  PROVIDER_MAX_COOLDOWN_SECONDS
+
+# error messages of providers refusing a request because of its rate, as opposed to the size of its result
+RATE_LIMITED = ['rate limit', 'rate exceeded', 'too many requests', 'compute units per second', 'exceeded its capacity',
+                'throughput']
+# weight of the last request in the latency average
+LATENCY_WEIGHT = 0.2
+
+
+class NoProviderAvailable(ConnectionError):
+  pass
+
+
+def isRateLimited(error):
+  """
+  :param error: JSON-RPC error or message
+  :return: True if the provider refused the request because of the request rate
+  """
+  message = str(error.get('message', '') if isinstance(error, dict) else error).lower()
+  return any(m in message for m in RATE_LIMITED)
+
+
+class Endpoint:
+  def __init__(self, url, rate):
+    """
+    State of one provider of the pool: token bucket, latency and health
+    :param url: node url
+    :param rate: most requests per second allowed by the provider plan
+    """
+    self.url = url
+    # same name as the counters of the http responses, which get a / path when there is none
+    self.name = instrument.endpointName(requests.Request('POST', url).prepare().url)
+    self.max_rate = rate
+    self.limiter = utils.RateLimiter(rate, burst=max(1, int(rate)), name=self.name)
+    self.latency = 0.0
+    self.requests = 0
+    self.errors = 0
+    self.rate_limited = 0
+    self.failures = 0
+    self.down_until = 0.0
+    self.lock = threading.Lock()
+
+  def available(self, now):
+    return self.down_until <= now
+
+  def cost(self):
+    """
+    :return: expected seconds before an answer, waiting for a token then the round trip
+    """
+    return self.limiter.delay() + self.latency
+
+  def succeeded(self, seconds):
+    # additive increase of the rate back to the plan rate
+    with self.lock:
+      self.requests += 1
+      self.failures = 0
+      self.latency = seconds if self.requests == 1 else (1 - LATENCY_WEIGHT) * self.latency + LATENCY_WEIGHT * seconds
+      self.limiter.rate = min(self.max_rate, self.limiter.rate + 0.05 * self.max_rate)
+
+  def throttled(self, retry_after=None):
+    # multiplicative decrease, the provider is left alone until it accepts requests again
+    with self.lock:
+      self.requests += 1
+      self.rate_limited += 1
+      self.limiter.rate = max(PROVIDER_MIN_RATE, self.limiter.rate / 2)
+      self.down_until = time.monotonic() + (PROVIDER_COOLDOWN_SECONDS if retry_after is None else retry_after)
+    instrument.count(self.name, rate_limited=1)
+
+  def failed(self):
+    # exponential cooldown while the provider keeps failing
+    with self.lock:
+      self.requests += 1
+      self.errors += 1
+      self.failures += 1
+      cooldown = min(PROVIDER_MAX_COOLDOWN_SECONDS, PROVIDER_COOLDOWN_SECONDS * 2 ** (self.failures - 1))
+      self.down_until = time.monotonic() + cooldown
+    instrument.count(self.name, failovers=1)
+
+
+class ProviderPool:
+  def __init__(self, urls, rates=None, session=None, timeout=60):
+    """
+    Spreads JSON-RPC requests over several providers. Each one has a token bucket at the rate of its plan,
+    lowered when it answers that the rate is exceeded and raised back while it accepts requests, so the scan
+    runs at the largest rate allowed rather than sleeping. A request goes to the provider expected to answer
+    first, and fails over to the next one on rate limits, http and connection errors. Errors about the request
+    itself, like too many logs in the range, are answers and are returned
+    :param urls: node urls
+    :param rates: dict of url -> requests per second, PROVIDER_RATES then PROVIDER_DEFAULT_RATE if missing
+    :param session: requests session, by default one without http retries so that failover is immediate
+    :param timeout: seconds before a request is given up on a provider
+    """
+    rates = dict(PROVIDER_RATES, **(rates or {}))
+    self.endpoints = [Endpoint(url, rates.get(url, PROVIDER_DEFAULT_RATE)) for url in urls]
+    self.session = utils.newSession(retries=0) if session is None else session
+    self.timeout = timeout
+
+  def _pick(self):
+    """
+    :return: the available provider expected to answer first, waits when they are all cooling down
+    """
+    while True:
+      now = time.monotonic()
+      available = [e for e in self.endpoints if e.available(now)]
+      if len(available) > 0:
+        return min(available, key=Endpoint.cost)
+      wait = min(e.down_until for e in self.endpoints) - now
+      instrument.count('provider pool', throttle_s=wait)
+      time.sleep(wait)
+
+  def post(self, body, attempts=None):
+    """
+    :param body: encoded JSON-RPC request or batch
+    :param attempts: providers tried before giving up, twice the pool size by default
+    :return: decoded answer of the first provider that served it
+    """
+    attempts = 2 * len(self.endpoints) if attempts is None else attempts
+    last_error = None
+    for _ in range(attempts):
+      endpoint = self._pick()
+      endpoint.limiter.acquire()
+      start = time.monotonic()
+      try:
+        response = self.session.post(endpoint.url, data=body, headers={'Content-Type': 'application/json'},
+                                     timeout=self.timeout)
+      except requests.RequestException as e:
+        endpoint.failed()
+        last_error = e
+        continue
+      seconds = time.monotonic() - start
+      retry_after = response.headers.get('Retry-After')
+      retry_after = float(retry_after) if retry_after is not None and retry_after.isdigit() else None
+      if response.status_code == 429:
+        endpoint.throttled(retry_after)
+        last_error = '%s: http 429' % endpoint.name
+        continue
+      try:
+        response.raise_for_status()
+        answer = response.json()
+      except (requests.RequestException, ValueError) as e:
+        endpoint.failed()
+        last_error = e
+        continue
+      answers = answer if isinstance(answer, list) else [answer]
+      if any(isRateLimited(a['error']) for a in answers if 'error' in a):
+        endpoint.throttled(retry_after)
+        last_error = '%s: %s' % (endpoint.name, next(a['error'] for a in answers if 'error' in a))
+        continue
+      endpoint.succeeded(seconds)
+      return answer
+    raise NoProviderAvailable('no provider answered after %d attempts, last error: %s' % (attempts, last_error))
+
+  def health(self):
+    """
+    :return: dataframe of the state of each provider
+    """
+    now = time.monotonic()
+    return pd.DataFrame([{'endpoint': e.name, 'rate': e.limiter.rate, 'max_rate': e.max_rate,
+                          'latency_ms': 1000 * e.latency, 'requests': e.requests, 'errors': e.errors,
+                          'rate_limited': e.rate_limited, 'available': e.available(now)}
+                         for e in self.endpoints]).set_index('endpoint')
+
+
+class PooledProvider(web3.providers.JSONBaseProvider):
+  def __init__(self, pool):
+    """
+    web3 provider sending every request through a ProviderPool
+    :param pool: ProviderPool
+    """
+    super().__init__()
+    self.pool = pool
+    self.endpoint_uri = ','.join(e.url for e in pool.endpoints)
+
+  def make_request(self, method, params):
+    return self.pool.post(self.encode_rpc_request(method, params))
+
+  def isConnected(self):
+    return True
+
@@ -0,0 +1,173 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import pandas as pd
+
+import instrument
+from config import SCAN_CHUNK_SIZE, SCAN_MAX_WORKERS, SCAN_RETRIES
+
+# error messages of providers refusing a range because it holds too many logs
+TOO_MANY_RESULTS = ['query returned more than', 'more than 10000 results', 'log response size exceeded',
+                    'response size exceeded', 'block range is too wide', 'block range too large']
+
+
+class TooManyResults(ValueError):
+  pass
+
+
+def isTooManyResults(error):
+  """
+  :param error: exception raised by an eth_getLogs call
+  :return: True if the provider refused the range because of its size
+  """
+  message = str(error).lower()
+  return any(m in message for m in TOO_MANY_RESULTS)
+
+
+class Checkpoint:
+  def __init__(self, path=None):
+    """
+    Finished block ranges of a scan, one pickle per range so an interrupted scan resumes
+    :param path: folder of the range files, None keeps them in memory only
+    """
+    self.path = path
+    self.chunks = {}
+    if path is not None:
+      os.makedirs(path, exist_ok=True)
+
+  def ranges(self):
+    """
+    :return: sorted list of (from_block, to_block) already scanned
+    """
+    if self.path is None:
+      return sorted(self.chunks)
+    names = [n[:-4].split('_') for n in os.listdir(self.path) if n.endswith('.pkl')]
+    return sorted((int(lo), int(hi)) for lo, hi in names)
+
+  def save(self, from_block, to_block, df):
+    if self.path is None:
+      self.chunks[(from_block, to_block)] = df
+      return
+    file = os.path.join(self.path, '%d_%d.pkl' % (from_block, to_block))
+    df.to_pickle(file + '.tmp')
+    os.replace(file + '.tmp', file)
+
+  def rollback(self, block):
+    """
+    Forgets the logs from block onwards, e.g. blocks that may be reorganized, they are scanned again next time
+    :param block: first block dropped
+    :return: number of logs dropped
+    """
+    dropped = 0
+    for lo, hi in self.ranges():
+      if hi < block:
+        continue
+      if self.path is None:
+        df = self.chunks.pop((lo, hi))
+      else:
+        file = os.path.join(self.path, '%d_%d.pkl' % (lo, hi))
+        df = pd.read_pickle(file)
+        os.remove(file)
+      kept = df[df['blockNumber'] < block] if len(df) > 0 else df
+      dropped += len(df) - len(kept)
+      if lo < block:
+        self.save(lo, block - 1, kept.reset_index(drop=True))
+    return dropped
+
+  def load(self, from_block, to_block):
+    """
+    :return: logs of the saved ranges between from_block and to_block
+    """
+    frames = []
+    for lo, hi in self.ranges():
+      if hi < from_block or lo > to_block:
+        continue
+      if self.path is None:
+        df = self.chunks[(lo, hi)]
+      else:
+        df = pd.read_pickle(os.path.join(self.path, '%d_%d.pkl' % (lo, hi)))
+      if len(df) > 0:
+        frames.append(df[(df['blockNumber'] >= from_block) & (df['blockNumber'] <= to_block)])
+    if len(frames) == 0:
+      return pd.DataFrame()
+    df = pd.concat(frames, ignore_index=True)
+    df = df.drop_duplicates(subset=['blockNumber', 'logIndex'])
+    return df.sort_values(['blockNumber', 'logIndex']).reset_index(drop=True)
+
+
+class LogScanner:
+  def __init__(self, fetch, chunk_size=SCAN_CHUNK_SIZE, max_workers=SCAN_MAX_WORKERS, retries=SCAN_RETRIES,
+               checkpoint=None, name='eth_getLogs'):
+    """
+    Scans a block range in chunks on a bounded thread pool. A chunk refused for holding too many
+    logs is split in two halves, any other error is retried with exponential backoff
+    :param fetch: function(from_block, to_block) returning the logs of the range as a dataframe,
+    raising TooManyResults when the range must be split
+    :param chunk_size: blocks per initial chunk
+    :param max_workers: chunks fetched at the same time
+    :param retries: attempts on a chunk before giving up
+    :param checkpoint: Checkpoint recording finished chunks
+    :param name: name the retries, backoff and splits are counted under, see instrument.count
+    """
+    self.fetch = fetch
+    self.chunk_size = chunk_size
+    self.max_workers = max_workers
+    self.retries = retries
+    self.checkpoint = Checkpoint() if checkpoint is None else checkpoint
+    self.name = name
+
+  def pending(self, start_block, end_block):
+    """
+    :return: chunks of the range not covered by the checkpoint yet
+    """
+    chunks = []
+    block = start_block
+    for lo, hi in self.checkpoint.ranges() + [(end_block + 1, end_block + 1)]:
+      if hi < block:
+        continue
+      gap_end = min(lo - 1, end_block)
+      while block <= gap_end:
+        chunks.append((block, min(block + self.chunk_size - 1, gap_end)))
+        block = chunks[-1][1] + 1
+      block = max(block, hi + 1)
+      if block > end_block:
+        break
+    return chunks
+
+  def _fetch(self, from_block, to_block):
+    for attempt in range(self.retries):
+      try:
+        return self.fetch(from_block, to_block)
+      except TooManyResults:
+        raise
+      except Exception:
+        if attempt == self.retries - 1:
+          raise
+        instrument.count(self.name, retries=1, backoff_s=2 ** attempt)
+        time.sleep(2 ** attempt)
+
+  def scan(self, start_block, end_block):
+    """
+    :param start_block: first block scanned
+    :param end_block: last block scanned
+    :return: logs of the range sorted by block and log index
+    """
+    with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+      futures = {executor.submit(self._fetch, lo, hi): (lo, hi) for lo, hi in self.pending(start_block, end_block)}
+      while len(futures) > 0:
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+          lo, hi = futures.pop(future)
+          try:
+            df = future.result()
+          except TooManyResults:
+            if lo == hi:
+              raise
+            mid = (lo + hi) // 2
+            instrument.count(self.name, splits=1)
+            futures[executor.submit(self._fetch, lo, mid)] = (lo, mid)
+            futures[executor.submit(self._fetch, mid + 1, hi)] = (mid + 1, hi)
+          else:
+            self.checkpoint.save(lo, hi, df)
+    return self.checkpoint.load(start_block, end_block)
@@ -0,0 +1,373 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+import utils
+from cache import HistoryCache
+from config import IMPORT_BUDGET_SECONDS
+from main import LP, Pools, fetchHistories, fetchHistoriesBatched
+from archive_node.abi import EVENT_TOPICS
+from standin import GraphStandIn, NodeStandIn, poolsFromData, scalePools, syntheticPools, syntheticLogs
+
+
+def benchFetch(concurrency=(1, 2, 4, 8, 16), nb_pools=32, latency=0.2, rate_limit=None):
+    """
+    Throughput of the concurrent history fetch against a local stand-in subgraph
+    :param concurrency: worker counts to try
+    :param nb_pools: pools fetched per run
+    :param latency: simulated network wait per request in seconds
+    :param rate_limit: requests per second allowed on the stand-in endpoint, None for no limit
+    :return: dataframe with the wall time and pools per second for each worker count
+    """
+    results = []
+    with GraphStandIn(syntheticPools(nb_pools=nb_pools, nb_days=400), latency=latency) as standin:
+        url = standin.url('UNI')
+        utils.rateLimiter(url).rate = rate_limit
+        for workers in concurrency:
+            lps = [LP(exchange='UNI', pool_address=address, initial_stake=0.01, fees=0.003, start_ts=0,
+                      graph_api=url) for address in standin.pools]
+            start = time.perf_counter()
+            fetchHistories(lps, max_workers=workers)
+            elapsed = time.perf_counter() - start
+            results.append({'workers': workers, 'seconds': elapsed, 'pools/s': nb_pools / elapsed})
+    return pd.DataFrame(results).set_index('workers')
+
+
+def benchCache(nb_pools=30, nb_days=800, latency=0.2, max_workers=8):
+    """
+    Cold run against an empty history cache then a re-run where only the current day is missing
+    :param nb_pools: pools fetched per run
+    :param nb_days: days of history per pool
+    :param latency: simulated network wait per request in seconds
+    :param max_workers: concurrent fetches
+    :return: dataframe with wall time and request count of each run
+    """
+    results = []
+    with GraphStandIn(syntheticPools(nb_pools=nb_pools, nb_days=nb_days), latency=latency) as standin, \
+            tempfile.TemporaryDirectory() as path:
+        url = standin.url('UNI')
+        history_cache = HistoryCache(path)
+        for run in ['cold', 'warm']:
+            lps = [LP(exchange='UNI', pool_address=address, initial_stake=0.01, fees=0.003, start_ts=0,
+                      graph_api=url, cache=history_cache) for address in standin.pools]
+            requests = standin.requests
+            start = time.perf_counter()
+            fetchHistories(lps, max_workers=max_workers)
+            results.append({'run': run, 'seconds': time.perf_counter() - start,
+                            'requests': standin.requests - requests})
+    return pd.DataFrame(results).set_index('run')
+
+
+def benchBatch(nb_pools=60, nb_days=400, latency=0.2, exchanges=('UNI', 'SUSHI')):
+    """
+    Aliased multi-pair requests against one request per pair, cold and with only the last day missing
+    :param nb_pools: pools fetched per run
+    :param nb_days: days of history per pool
+    :param latency: simulated network wait per request in seconds
+    :param exchanges: subgraph flavours to run
+    :return: dataframe with wall time and request count of each exchange, run and fetcher
+    """
+    results = []
+    with GraphStandIn(syntheticPools(nb_pools=nb_pools, nb_days=nb_days), latency=latency) as standin:
+        # the sushi processing needs a WETH leg
+        addresses = [a for a, rows in standin.pools.items() if 'WETH' in (rows[0]['token0']['symbol'],
+                                                                          rows[0]['token1']['symbol'])]
+        for exchange in exchanges:
+            url = standin.url(exchange)
+            for run in ['cold', 'warm']:
+                for name, fetch in [('per pair', lambda lps: fetchHistories(lps, max_workers=1)),
+                                    ('batched', fetchHistoriesBatched)]:
+                    with tempfile.TemporaryDirectory() as path:
+                        history_cache = HistoryCache(path)
+                        lps = [LP(exchange=exchange, pool_address=address, initial_stake=0.01, fees=0.003,
+                                  start_ts=0, graph_api=url, rewards_api=standin.rewardsUrl(), cache=history_cache)
+                               for address in addresses]
+                        if run == 'warm':
+                            # everything cached but the last day
+                            for lp in lps:
+                                history_cache.put(url, lp.pool_address, 0, standin.pools[lp.pool_address][:-1])
+                        requests = standin.requests
+                        start = time.perf_counter()
+                        fetch(lps)
+                        results.append({'exchange': exchange, 'run': run, 'fetcher': name,
+                                        'seconds': time.perf_counter() - start,
+                                        'requests': standin.requests - requests})
+    return pd.DataFrame(results).set_index(['exchange', 'run', 'fetcher'])
+
+
+def benchBlockToDate(sizes=(1000, 10000, 100000), seed=0):
+    """
+    Per-row blockToDate apply versus the vectorized BlockDateIndex on random blocks of the map range
+    :param sizes: number of blocks to map
+    :param seed: random seed
+    :return: dataframe of timings, the per-row path is extrapolated above 10000 rows
+    """
+    map_table = pd.read_csv(utils.BLOCK_DATE_MAP, index_col=0, sep='\t')
+    index = utils.BlockDateIndex.fromCsv()
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in sizes:
+        blocks = pd.Series(rng.integers(map_table['Block'].min() - 1000, map_table['Block'].max() + 1000, size))
+        sample = blocks.iloc[:10000]
+        start = time.perf_counter()
+        expected = sample.apply(lambda x: utils.blockToDate(x, map_table))
+        apply_seconds = (time.perf_counter() - start) * size / len(sample)
+        start = time.perf_counter()
+        dates = index.toDates(blocks)
+        index_seconds = time.perf_counter() - start
+        assert pd.Series(dates[:len(sample)]).equals(expected)
+        results.append({'rows': size, 'apply_s': apply_seconds, 'index_s': index_seconds,
+                        'speedup': apply_seconds / index_seconds})
+    return pd.DataFrame(results).set_index('rows')
+
+
+def benchDecode(nb_logs=(1000, 10000, 50000), event_name='Swap'):
+    """
+    Bulk decodeLogs versus web3 processLog + cleanLog on synthetic raw logs, checking both agree
+    :param nb_logs: number of logs decoded
+    :param event_name: pair event decoded
+    :return: dataframe of timings
+    """
+    import web3
+    from web3._utils.method_formatters import log_entry_formatter
+    from archive_node.abi import UNIV2_PAIR_ABI
+    from archive_node.decode import decodeLogs
+    from archive_node.node import cleanLog
+    address = '0x%040x' % 0xa000
+    event = web3.Web3().eth.contract(address=web3.Web3.toChecksumAddress(address), abi=UNIV2_PAIR_ABI) \
+        .events[event_name]()
+    topic = EVENT_TOPICS[event_name]
+    results = []
+    for size in nb_logs:
+        logs = [l for l in syntheticLogs([address], logs_per_pool=size * 2) if l['topics'][0] == topic][:size]
+        raw = [dict(l, blockNumber=hex(l['blockNumber']), logIndex=hex(l['logIndex']),
+                    transactionIndex=hex(l['transactionIndex'])) for l in logs]
+        start = time.perf_counter()
+        expected = cleanLog(pd.DataFrame([event.processLog(log_entry_formatter(l)) for l in raw]))
+        web3_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decoded = decodeLogs(raw, event_name)
+        fast_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        decodeLogs(raw, event_name, exact=False)
+        float_seconds = time.perf_counter() - start
+        for column in expected.columns:
+            if column not in ('blockHash', 'transactionHash'):
+                assert (expected[column].to_numpy() == decoded[column].to_numpy()).all(), column
+        results.append({'logs': len(raw), 'web3_s': web3_seconds, 'decode_s': fast_seconds,
+                        'decode_float_s': float_seconds, 'speedup': web3_seconds / fast_seconds})
+    return pd.DataFrame(results).set_index('logs')
+
+
+def benchScale(nb_values=(10000, 100000, 1000000), decimals=18, seed=0):
+    """
+    Throughput of numeric.scaleUnits from raw words against python int division, the former path of Lp2,
+    checking both give the same floats, and the error float32 made on subgraph reserves
+    :param nb_values: number of uint112 values scaled
+    :param decimals: token decimals
+    :param seed: random seed
+    :return: dataframe of timings in values per second and of the float32 max relative error
+    """
+    import random
+    import numeric
+    rng = random.Random(seed)
+    results = []
+    for size in nb_values:
+        values = [rng.getrandbits(112) for _ in range(size)]
+        raw = b''.join(v.to_bytes(32, 'big') for v in values)
+        start = time.perf_counter()
+        python_ints = pd.Series([int.from_bytes(raw[i:i + 32], 'big') for i in range(0, len(raw), 32)],
+                                dtype=object)
+        expected = (python_ints / 10 ** decimals).astype('float64').to_numpy()
+        int_seconds = time.perf_counter() - start
+        start = time.perf_counter()
+        scaled = numeric.scaleUnits(numeric.limbsFromBytes(raw), decimals)
+        limb_seconds = time.perf_counter() - start
+        assert (scaled == expected).all()
+        text = pd.Series(['%.18f' % v for v in expected[:100000]])
+        error = np.abs(text.astype('float32').astype('float64') / numeric.parseDecimals(text) - 1).max()
+        results.append({'values': size, 'python ints/s': size / int_seconds, 'scaleUnits/s': size / limb_seconds,
+                        'speedup': int_seconds / limb_seconds, 'float32 max rel error': error})
+    return pd.DataFrame(results).set_index('values')
+
+
+def benchScreen(nb_pools=(100, 1000, 10000), k=10, repeat=200, seed=0):
+    """
+    Latency of a screening query on the ScreenIndex against filtering and sorting the summary with pandas,
+    checking both return the same pools
+    :param nb_pools: pools in the summary
+    :param k: pools returned
+    :param repeat: queries timed
+    :param seed: random seed
+    :return: dataframe of the mean query time in microseconds
+    """
+    from panel import SUMMARY_COLUMNS
+    from screen import ScreenIndex
+    rng = np.random.default_rng(seed)
+    results = []
+    for size in nb_pools:
+        stats = pd.DataFrame({c: rng.normal(size=size) for c in SUMMARY_COLUMNS},
+                             index=['0x%040x' % i for i in range(size)])
+        stats['TVL_ETH'] = rng.lognormal(5, 2, size)
+        stats['Pair'] = 'WETH_TOKEN'
+        stats['exchange'] = np.where(rng.random(size) < 0.3, 'SUSHI', 'UNI')
+        index = ScreenIndex(stats_path=None)
+        index.update(stats)
+        where = ['TVL_ETH>100', 'exchange==SUSHI']
+        start = time.perf_counter()
+        for _ in range(repeat):
+            top = index.query(where, 'Fees/Vol 30D', k)
+        index_seconds = (time.perf_counter() - start) / repeat
+        start = time.perf_counter()
+        for _ in range(repeat):
+            expected = stats[(stats['TVL_ETH'] > 100) & (stats['exchange'] == 'SUSHI')] \
+                .sort_values('Fees/Vol 30D', ascending=False).head(k)
+        pandas_seconds = (time.perf_counter() - start) / repeat
+        assert list(top.index) == list(expected.index)
+        results.append({'pools': size, 'index us': 1e6 * index_seconds, 'pandas us': 1e6 * pandas_seconds,
+                        'speedup': pandas_seconds / index_seconds})
+    return pd.DataFrame(results).set_index('pools')
+
+
+def benchBlockMap(nb_days=(30, 365), start_day='2021-01-01', head=16500000):
+    """
+    Header reads of the block map builder against the stand-in node, checking every day gets the last
+    block before its midnight
+    :param nb_days: days mapped per run, with an empty header cache
+    :param start_day: first day mapped
+    :param head: head block of the stand-in node
+    :return: dataframe of the headers read per day and http requests per run
+    """
+    from archive_node.blockmap import dayTimestamps, lastBlocksBefore
+    from archive_node.node import provider
+    from standin import blockTimestamp
+    results = []
+    with NodeStandIn(syntheticLogs(['0x%040x' % 0xa000], logs_per_pool=10), head=head) as standin:
+        node = provider(standin.url)
+        for size in nb_days:
+            days = np.arange(np.datetime64(start_day), np.datetime64(start_day) + size)
+            headers, requests = standin.headers, standin.requests
+            start = time.perf_counter()
+            blocks = lastBlocksBefore(dayTimestamps(days), node)
+            elapsed = time.perf_counter() - start
+            assert all(blockTimestamp(b) < t <= blockTimestamp(b + 1) for b, t in zip(blocks, dayTimestamps(days)))
+            results.append({'days': size, 'headers/day': (standin.headers - headers) / size,
+                            'http requests': standin.requests - requests, 'seconds': elapsed})
+    return pd.DataFrame(results).set_index('days')
+
+
+def benchImport(modules=('main', 'main_archive_node', 'archive_node.node', 'utils'), budget=IMPORT_BUDGET_SECONDS,
+                repeat=3):
+    """
+    Import time of each module in a fresh interpreter where any network connection fails
+    :param modules: modules imported
+    :param budget: seconds an import may take
+    :param repeat: imports per module, the fastest is kept
+    :return: dataframe with the seconds and whether each import stays within the budget
+    """
+    code = """
+import socket, time
+def refuse(*args):
+    raise OSError('network access at import')
+socket.socket.connect = refuse
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+"""
+    results = []
+    for module in modules:
+        seconds = min(float(subprocess.run([sys.executable, '-c', code % module], check=True, capture_output=True,
+                                           text=True).stdout.split()[-1]) for _ in range(repeat))
+        results.append({'module': module, 'seconds': seconds, 'within budget': seconds <= budget})
+    return pd.DataFrame(results).set_index('module')
+
+
+def benchSuite(scales=(1, 10, 100), data_path='data', nb_days=400, logs_per_pool=2000, latency=0.0):
+    """
+    Times each stage of both pipelines and their end-to-end runs offline, against stand-ins seeded
+    from the data folder (see poolsFromData), with the pools and the events multiplied by each scale
+    :param scales: multipliers of the number of pools and of the event logs
+    :param data_path: data folder with research_universe.csv, Node/ summaries and block_date_map.csv
+    :param nb_days: days of history of the pools without a node summary
+    :param logs_per_pool: approximate event logs of the scanned pool at scale 1
+    :param latency: simulated network wait per request in seconds
+    :return: dataframe of seconds indexed by scale and stage
+    """
+    import web3
+    from web3._utils.method_formatters import log_entry_formatter
+    import main
+    import main_archive_node
+    from archive_node.abi import UNIV2_PAIR_ABI
+    from archive_node.node import provider, getEvents, cleanLog
+    base, exchanges = poolsFromData(data_path, nb_days=nb_days)
+    block_map = os.path.abspath(os.path.join(data_path, 'block_date_map.csv'))
+    # pair whose events are scanned, it must be in the universe for the archive node run
+    event_pool = next(a for a, rows in base.items() if exchanges[a] == 'UNI' and float(rows[-1]['reserveUSD']) > 5e6)
+    results = []
+    for scale in scales:
+        flavours = {exchange: scalePools({a: rows for a, rows in base.items() if exchanges[a] == exchange}, scale)
+                    for exchange in ['UNI', 'SUSHI']}
+        logs = syntheticLogs([event_pool], logs_per_pool=logs_per_pool * scale)
+        with GraphStandIn(flavours['UNI'], latency) as uni, GraphStandIn(flavours['SUSHI'], latency) as sushi, \
+                NodeStandIn(logs, latency=latency) as node, tempfile.TemporaryDirectory() as path:
+            w3 = provider(node.url)
+
+            def timed(stage, function):
+                start = time.perf_counter()
+                result = function()
+                results.append({'scale': scale, 'stage': stage, 'seconds': time.perf_counter() - start})
+                return result
+
+            timed('Pools.search', lambda: [Pools(url=uni.url('UNI'), to_include=['WETH']).search(),
+                                           Pools(url=sushi.url('SUSHI'), to_include=['WETH'],
+                                                 exchange='SUSHI').search()])
+            lps = [LP(exchange=exchange, pool_address=address, initial_stake=0.01, fees=0.003, start_ts=0,
+                      graph_api=standin.url(exchange), rewards_api=sushi.rewardsUrl())
+                   for exchange, standin in [('UNI', uni), ('SUSHI', sushi)] for address in standin.pools]
+            timed('LP.getHist', lambda: [lp.getHist() for lp in lps])
+            timed('LP.getStats', lambda: [lp.getStats() for lp in lps])
+            swaps = timed('getEvents', lambda: getEvents(event_pool, UNIV2_PAIR_ABI, 'Swap', start_block=12000000,
+                                                         node=w3, checkpoint=False))
+            event = web3.Web3().eth.contract(address=web3.Web3.toChecksumAddress(event_pool), abi=UNIV2_PAIR_ABI) \
+                .events['Swap']()
+            processed = [event.processLog(log_entry_formatter(dict(l, blockNumber=hex(l['blockNumber']),
+                                                                   logIndex=hex(l['logIndex']),
+                                                                   transactionIndex=hex(l['transactionIndex']))))
+                         for l in logs if l['topics'][0] == EVENT_TOPICS['Swap']]
+            timed('cleanLog', lambda: cleanLog(pd.DataFrame(processed)))
+            # the per-row path the index replaced, timed on the same rows, see benchBlockToDate
+            map_table = pd.read_csv(block_map, index_col=0, sep='\t')
+            timed('blockToDate apply', lambda: swaps['blockNumber'].apply(lambda x: utils.blockToDate(x, map_table)))
+            timed('blockToDate', lambda: utils.blockDateIndex(block_map).toDates(swaps['blockNumber']))
+            # end-to-end runs write their outputs under data/ of a scratch folder
+            os.makedirs(os.path.join(path, 'data'))
+            shutil.copy(block_map, os.path.join(path, 'data'))
+            cwd = os.getcwd()
+            os.chdir(path)
+            try:
+                timed('main.run', lambda: main.run(start_ts=0, charts=False, uni_api=uni.url('UNI'),
+                                                   sushi_api=sushi.url('SUSHI'), rewards_api=sushi.rewardsUrl()))
+                timed('main_archive_node.run', lambda: main_archive_node.run(event_pool, node=w3,
+                                                                             pool_abi=UNIV2_PAIR_ABI))
+            finally:
+                os.chdir(cwd)
+    return pd.DataFrame(results).pivot(index='stage', columns='scale', values='seconds')
+
+
+if __name__ == '__main__':
+    print(benchFetch())
+    print(benchCache())
+    print(benchBatch())
+    print(benchBlockToDate())
+    print(benchDecode())
+    print(benchScale())
+    print(benchScreen())
+    print(benchBlockMap())
+    print(benchImport())
+    print(benchSuite())
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from math import floor
+
+import utils
+from config import HIST_CACHE_DIR, HIST_CACHE_MAX_AGE_DAYS, HIST_CACHE_MAX_BYTES, REWARDS_CACHE, REWARDS_TTL_SECONDS
+
+
+class HistoryCache:
+    def __init__(self, path=HIST_CACHE_DIR, max_age_days=HIST_CACHE_MAX_AGE_DAYS, max_bytes=HIST_CACHE_MAX_BYTES):
+        """
+        On-disk store of raw pairDayDatas rows, one json file per (endpoint, pair, start date)
+        :param path: directory of the cache files
+        :param max_age_days: entries not refreshed for that many days are evicted
+        :param max_bytes: total size above which the least recently refreshed entries are evicted
+        """
+        self.path = path
+        self.max_age = max_age_days * 86400
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, endpoint, pair, start_ts):
+        key = hashlib.sha1(('%s|%s|%d' % (endpoint, pair.lower(), start_ts)).encode()).hexdigest()
+        return os.path.join(self.path, key + '.json')
+
+    def get(self, endpoint, pair, start_ts):
+        """
+        :param endpoint: subgraph url
+        :param pair: pair address
+        :param start_ts: first date of the history
+        :return: cached rows sorted by date, None if nothing is cached
+        """
+        try:
+            with open(self._file(endpoint, pair, start_ts)) as f:
+                return json.load(f)['rows']
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def put(self, endpoint, pair, start_ts, rows):
+        """
+        Stores the history, the current day is left out as its row keeps changing until the day closes
+        :param endpoint: subgraph url
+        :param pair: pair address
+        :param start_ts: first date of the history
+        :param rows: pairDayDatas rows sorted by date
+        """
+        today = floor(utils.todayTimestamp() / 86400) * 86400
+        entry = {'endpoint': endpoint, 'pair': pair, 'start_ts': start_ts,
+                 'rows': [r for r in rows if r['date'] < today]}
+        file = self._file(endpoint, pair, start_ts)
+        with self.lock:
+            with open(file + '.tmp', 'w') as f:
+                json.dump(entry, f)
+            os.replace(file + '.tmp', file)
+            self._evict()
+
+    def _evict(self):
+        entries = []
+        for name in os.listdir(self.path):
+            if name.endswith('.json'):
+                file = os.path.join(self.path, name)
+                stat = os.stat(file)
+                entries.append((stat.st_mtime, stat.st_size, file))
+        entries.sort()
+        total = sum(e[1] for e in entries)
+        now = time.time()
+        for mtime, size, file in entries:
+            if now - mtime > self.max_age or total > self.max_bytes:
+                os.remove(file)
+                total -= size
+
+    def clear(self):
+        with self.lock:
+            for name in os.listdir(self.path):
+                os.remove(os.path.join(self.path, name))
+
+
+class RewardsCache:
+    def __init__(self, path=REWARDS_CACHE, ttl=REWARDS_TTL_SECONDS):
+        """
+        Reward APR of each pool kept in a json file, an APR older than ttl is fetched again
+        :param path: json file
+        :param ttl: seconds an APR stays valid
+        """
+        self.path = path
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        try:
+            with open(path) as f:
+                self.entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            self.entries = {}
+
+    def get(self, pool_address):
+        """
+        :return: APR of the pool, None if missing or expired
+        """
+        entry = self.entries.get(pool_address.lower())
+        if entry is None or time.time() - entry['ts'] > self.ttl:
+            return None
+        return entry['apr']
+
+    def put(self, pool_address, apr):
+        with self.lock:
+            self.entries[pool_address.lower()] = {'apr': apr, 'ts': time.time()}
+            folder = os.path.dirname(self.path)
+            if folder != '':
+                os.makedirs(folder, exist_ok=True)
+            with open(self.path + '.tmp', 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(self.path + '.tmp', self.path)
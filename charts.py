@@ -0,0 +1,109 @@
+import hashlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib
+
+matplotlib.use('Agg')
+import matplotlib.pyplot as plt
+import pandas as pd
+
+from config import CHART_MAX_WORKERS, RENDER_CHARTS
+
+# inputs of the two charts, the rest of the history does not change them
+CHART_COLUMNS = ['Cumulative_Ret', 'Fee_pct_NAV', 'reserve_ETH', 'daily_Volume_ETH']
+HASH_FILE = 'charts.sha1'
+
+
+def chartFolder(token0, token1, exchange):
+    return "data/" + token0 + '_' + token1 + '_' + exchange
+
+
+def chartsHash(title, df_hist):
+    """
+    :return: digest of what the charts show, used to skip a render when nothing changed
+    """
+    digest = hashlib.sha1(title.encode())
+    digest.update(pd.util.hash_pandas_object(df_hist[CHART_COLUMNS]).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def renderCharts(title, df_hist, folder, force=False):
+    """
+    Saves 'daily returns.png' (NAV and compounded fees) and 'volume_tvl.png' (TVL and volume) of a pool
+    :param title: pair and exchange, e.g. WETH_USDC_UNI
+    :param df_hist: daily columns of LP.getStats indexed by date
+    :param folder: output folder, created if needed
+    :param force: render even if the inputs did not change since the last render
+    :return: True if the charts were rendered, False if they were up to date
+    """
+    key = chartsHash(title, df_hist)
+    hash_file = os.path.join(folder, HASH_FILE)
+    if not force and os.path.isfile(hash_file):
+        with open(hash_file) as f:
+            if f.read() == key:
+                return False
+    os.makedirs(folder, exist_ok=True)
+
+    fig, ax = plt.subplots(figsize=(12, 9))
+    (df_hist['Cumulative_Ret'] * 100).plot(title=title, ax=ax)
+    ((((1 + df_hist.iloc[1:]['Fee_pct_NAV']).cumprod()) - 1) * 100).plot(label='Cumulative Fee Return', ax=ax)
+    ax.set_xlabel('timestamp')
+    ax.set_ylabel('%')
+    ax.legend()
+    fig.savefig(folder + '/daily returns.png')
+    plt.close(fig)
+
+    fig, ax = plt.subplots(figsize=(12, 9))
+    df_hist['reserve_ETH'].plot(title=title, label='TVL', ax=ax)
+    ax2 = ax.twinx()
+    df_hist['daily_Volume_ETH'].plot(label='Daily volume', color='r', ax=ax2)
+    lines, labels = ax.get_legend_handles_labels()
+    lines2, labels2 = ax2.get_legend_handles_labels()
+    ax2.legend(lines + lines2, labels + labels2, loc=0)
+    ax.set_xlabel('Timestamp')
+    ax.set_ylabel('ETH')
+    fig.savefig(folder + '/volume_tvl.png')
+    plt.close(fig)
+
+    with open(hash_file + '.tmp', 'w') as f:
+        f.write(key)
+    os.replace(hash_file + '.tmp', hash_file)
+    return True
+
+
+class ChartRenderer:
+    def __init__(self, max_workers=CHART_MAX_WORKERS, enabled=RENDER_CHARTS):
+        """
+        Renders charts in worker processes while the caller keeps going, histories are queued as they are ready
+        :param max_workers: rendering processes
+        :param enabled: False for batch runs without charts, submit then does nothing
+        """
+        self.enabled = enabled
+        self.executor = ProcessPoolExecutor(max_workers=max_workers) if enabled else None
+        self.futures = []
+
+    def submit(self, title, df_hist, folder):
+        """
+        Queues the charts of a finished history, see renderCharts
+        """
+        if self.enabled:
+            self.futures.append(self.executor.submit(renderCharts, title, df_hist[CHART_COLUMNS], folder))
+
+    def close(self):
+        """
+        Waits for the queued charts
+        :return: number of charts rendered, the others were up to date
+        """
+        if not self.enabled:
+            return 0
+        rendered = sum(f.result() for f in self.futures)
+        self.executor.shutdown()
+        self.futures = []
+        return rendered
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -3,4 +3,73 @@ SUSHI_GRAPH_API='https://api.thegraph.com/subgraphs/name/sushiswap/exchange'
 DAYS_PER_YEAR=365
 PROVIDER_URL='https://eth-mainnet.g.alchemy.com/v2/RTrGE-8m6FJNI0UFokTTPxHwzU9Vaz7d'
 UNI_FEES=0.003
-SUSHI_FEES=0.003
\ No newline at end of file
+SUSHI_FEES=0.003
+SUSHI_REWARDS_API='https://www.sushi.com/earn/api/pool/eth:'
+# concurrent history fetch: worker threads and max requests per second per subgraph endpoint
+GRAPH_MAX_WORKERS=8
+GRAPH_RATE_LIMITS={UNIV2_GRAPH_API: 5, SUSHI_GRAPH_API: 5}
+# on-disk cache of pairDayDatas histories, entries not refreshed for max age are dropped
+HIST_CACHE_DIR='data/cache'
+HIST_CACHE_MAX_AGE_DAYS=30
+HIST_CACHE_MAX_BYTES=500 * 1024 * 1024
+BLOCK_DATE_MAP='data/block_date_map.csv'
+# block headers read while extending the block map, see archive_node/blockmap.py
+BLOCK_HEADER_CACHE='data/block_headers.csv'
+# eth_getLogs scanner: blocks per chunk, concurrent chunks, retries of a failing chunk and checkpoint folder
+SCAN_CHUNK_SIZE=100000
+SCAN_MAX_WORKERS=4
+SCAN_RETRIES=5
+SCAN_CHECKPOINT_DIR='data/scan'
+# JSON-RPC batch requests: calls per http request and retries of the failed calls
+RPC_BATCH_SIZE=100
+RPC_RETRIES=5
+# columnar store of pool histories and summaries
+STORE_DIR='data/store'
+# chart rendering: worker processes, False skips the charts in batch runs
+CHART_MAX_WORKERS=4
+RENDER_CHARTS=True
+# running LP statistics saved between runs
+STATS_STATE_DIR='data/stats_state'
+# aliased multi-pair history requests: most pairs per request and rows per response before shrinking the batch
+GRAPH_BATCH_SIZE=50
+GRAPH_BATCH_MAX_ROWS=5000
+# shared http session: hosts kept in the pool, connections kept alive per host and retries on 5xx
+HTTP_POOL_HOSTS=10
+HTTP_POOL_SIZE=32
+HTTP_RETRIES=10
+# on-disk registry of contract ABIs and cache of the sushi reward APRs, refreshed after the ttl
+ABI_DIR='data/abi'
+REWARDS_CACHE='data/rewards.json'
+REWARDS_TTL_SECONDS=6 * 3600
+# startup budget of the entry point imports, in seconds
+IMPORT_BUDGET_SECONDS=3
+# json report, and optional cProfile dump, of each pipeline run
+RUNS_DIR='data/runs'
+# backtest grid of sweep.py: holding periods in days and % of reserves owned at entry
+SWEEP_HOLDINGS=(30, 90, 180, 365)
+SWEEP_STAKES=(0.001, 0.01, 0.05)
+# scenario engine of scenarios.py: paths per pool and method, days held, pools per worker task and processes
+SCENARIO_PATHS=10000
+SCENARIO_HORIZON_DAYS=30
+SCENARIO_CHUNK=16
+SCENARIO_MAX_WORKERS=4
+# JSON-RPC providers shared by the node scans, requests per second of each plan and for the ones not listed,
+# lowest rate a provider is slowed down to after rate limit answers, cooldown of a failing provider doubling up to the max
+PROVIDER_URLS=[PROVIDER_URL]
+PROVIDER_RATES={PROVIDER_URL: 25}
+PROVIDER_DEFAULT_RATE=10
+PROVIDER_MIN_RATE=1
+PROVIDER_COOLDOWN_SECONDS=1
+PROVIDER_MAX_COOLDOWN_SECONDS=60
+# daemon.py: blocks under the head scanned again at every tick for reorgs, seconds between ticks, between
+# subgraph refreshes within a day, and after midnight before the subgraph row of the day is taken as final
+REORG_DEPTH=64
+DAEMON_POLL_SECONDS=60
+DAEMON_GRAPH_REFRESH_SECONDS=900
+DAEMON_CLOSE_DELAY_SECONDS=300
+# longest wait of the daemon after ticks failing in a row
+DAEMON_MAX_BACKOFF_SECONDS=3600
+# screen.py: interface and port of the screening endpoint, pools returned by default
+SCREEN_HOST='127.0.0.1'
+SCREEN_PORT=8050
+SCREEN_TOP_K=10
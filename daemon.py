@@ -0,0 +1,235 @@
+import argparse
+import logging
+import time
+from math import floor
+
+import numpy as np
+import pandas as pd
+
+import instrument
+import utils
+from archive_node.blockmap import HeaderCache, updateBlockMap
+from archive_node.node import provider, latestBlock, getUniverseEvents, universeCheckpoint
+from archive_node.scanner import Checkpoint
+from cache import HistoryCache, RewardsCache
+from config import UNIV2_GRAPH_API, SUSHI_GRAPH_API, SUSHI_REWARDS_API, REORG_DEPTH, DAEMON_POLL_SECONDS, \
+    DAEMON_GRAPH_REFRESH_SECONDS, DAEMON_CLOSE_DELAY_SECONDS, DAEMON_MAX_BACKOFF_SECONDS
+from incremental import StatsState, incrementalStats
+from main import LP, fetchHistoriesBatched
+from main_archive_node import Lp2, summarize
+from store import ParquetStore
+
+NODE_EVENTS = ('Swap', 'Sync')
+
+logger = logging.getLogger(__name__)
+
+
+class Daemon:
+    def __init__(self, universe_path='data/research_universe.csv', initial_stake=0.01, start_ts=1640991600,
+                 start_block=900000, node=None, pool_abi=None, graph=True, archive=True, uni_api=UNIV2_GRAPH_API,
+                 sushi_api=SUSHI_GRAPH_API, rewards_api=SUSHI_REWARDS_API, store=None, state=None,
+                 reorg_depth=REORG_DEPTH, poll_seconds=DAEMON_POLL_SECONDS,
+                 graph_refresh_seconds=DAEMON_GRAPH_REFRESH_SECONDS, close_delay_seconds=DAEMON_CLOSE_DELAY_SECONDS):
+        """
+        Keeps the store and final_lp_stats.csv up to date with the pools of the research universe: new pairDayDatas
+        rows are fetched after the cached ones and folded into the saved LPStats, new Swap/Sync logs are scanned
+        after the checkpointed block ranges and the node summaries of the days that closed are appended
+        :param universe_path: csv saved by main.py
+        :param initial_stake: % of reserves owned at inception
+        :param start_ts: first day of the subgraph histories, kept so the cached histories are reused
+        :param start_block: first block of the log scan
+        :param node: web3 connection, provider() if None
+        :param pool_abi: contract ABI of the pairs, from the ABI registry if None
+        :param graph: follow the subgraphs
+        :param archive: follow the chain
+        :param uni_api: uniswap subgraph url
+        :param sushi_api: sushiswap subgraph url
+        :param rewards_api: sushi rewards api prefix
+        :param store: ParquetStore, default folder if None
+        :param state: StatsState, default folder if None
+        :param reorg_depth: blocks under the head that can still be reorganized, scanned again at every tick
+        :param poll_seconds: seconds between ticks
+        :param graph_refresh_seconds: seconds between subgraph refreshes within a day
+        :param close_delay_seconds: seconds after midnight before a day is considered closed on the subgraphs,
+        so that their indexing catches up with its last blocks
+        """
+        self.universe = pd.read_csv(universe_path)
+        self.addresses = list(self.universe['id'].str.split('-').str[0].unique())
+        column = 'exchange' if 'exchange' in self.universe else 'Exchange'
+        self.exchanges = self.universe.groupby(self.universe['id'].str.split('-').str[0])[column].first()
+        self.initial_stake = initial_stake
+        self.start_block = start_block
+        self.node = node
+        self.pool_abi = pool_abi
+        self.graph = graph
+        self.archive = archive
+        self.store = ParquetStore() if store is None else store
+        self.state = StatsState() if state is None else state
+        self.reorg_depth = reorg_depth
+        self.poll_seconds = poll_seconds
+        self.graph_refresh_seconds = graph_refresh_seconds
+        self.close_delay_seconds = close_delay_seconds
+        history_cache = HistoryCache()
+        rewards_cache = RewardsCache()
+        apis = {'UNI': uni_api, 'SUSHI': sushi_api}
+        self.lps = [LP(exchange=self.exchanges[a], pool_address=a, initial_stake=initial_stake, fees=0.003,
+                       start_ts=start_ts, graph_api=apis[self.exchanges[a]], rewards_api=rewards_api,
+                       cache=history_cache, rewards_cache=rewards_cache) for a in self.addresses]
+        self.lp2s = None
+        self.headers = None
+        self.last_graph = None
+        self.last_day = None
+        # ticks failed in a row, the wait before the next one doubles with each
+        self.failures = 0
+
+    def tickGraph(self, now):
+        """
+        Fetches the subgraph rows after the cached ones, then refreshes final_lp_stats.csv and stores the closed days.
+        Runs when a day closed since the last refresh, otherwise every graph_refresh_seconds
+        :param now: unix time
+        :return: summary dataframe, None if it was not time to refresh
+        """
+        if now % 86400 < self.close_delay_seconds:
+            # the row of the day that just closed may still miss its last blocks, it must not be cached yet
+            return None
+        today = floor(now / 86400) * 86400
+        if self.last_graph is not None and today == self.last_day and \
+                now - self.last_graph < self.graph_refresh_seconds:
+            return None
+        fetchHistoriesBatched(self.lps)
+        lps = [lp for lp in self.lps if len(lp.hist_data) > 0]
+        summary = incrementalStats(lps, today, self.state)
+        with instrument.stage('store'):
+            for lp in lps:
+                self.store.append('history', lp.exchange, lp.pool_address, lp.hist_data[lp.hist_data.index < today])
+                if today != self.last_day:
+                    self.store.append('stats', lp.exchange, lp.pool_address,
+                                      summary.loc[[lp.pool_address]].set_axis([today], axis=0))
+        summary.to_csv('final_lp_stats.csv')
+        self.last_graph = now
+        self.last_day = today
+        return summary
+
+    def _closedDays(self, head):
+        """
+        :param head: chain head
+        :return: first day not closed yet: the day of the last block out of reach of reorgs, or the last
+        day of the block map as the blocks after it are not mapped to their day yet
+        """
+        index = utils.blockDateIndex()
+        safe_day = np.datetime64(index.toDates([head - self.reorg_depth])[0], 'D')
+        return min(safe_day, index.days[-1])
+
+    def tickNode(self):
+        """
+        Adds the new days to the block map, rolls the log scan back by reorg_depth blocks, scans the blocks after
+        the checkpoint and appends the node summaries of the days closed since the last stored one
+        :return: dict of pair address -> number of days appended
+        """
+        node = provider() if self.node is None else self.node
+        if self.lp2s is None:
+            self.lp2s = [Lp2(a, self.universe, node=node, pool_abi=self.pool_abi) for a in self.addresses]
+        decimals = {lp.pool_address: lp.swapDecimals() for lp in self.lp2s}
+        if self.headers is None:
+            self.headers = HeaderCache()
+        updateBlockMap(node=node, cache=self.headers)
+        head = latestBlock(node)
+        # the blocks still within reorg_depth of the head when the last tick scanned them are scanned again
+        checkpoint = Checkpoint(universeCheckpoint(self.addresses, NODE_EVENTS, decimals))
+        ranges = checkpoint.ranges()
+        scanned = head if len(ranges) == 0 else min(head, ranges[-1][1])
+        checkpoint.rollback(scanned - self.reorg_depth + 1)
+        index = utils.blockDateIndex()
+        open_day = self._closedDays(head)
+        # pools already stored only need the days after their last one
+        firsts = {}
+        for lp in self.lp2s:
+            last = self.store.lastDay('node_summary', lp.exchange, lp.pool_address)
+            first_day = None if last is None else last + np.timedelta64(1, 'D')
+            if first_day is None:
+                firsts[lp.pool_address] = self.start_block
+            elif first_day < open_day:
+                # the block of a day in the map is the last one of the day before
+                firsts[lp.pool_address] = int(index.firstBlocks([first_day])[0]) + 1
+        if len(firsts) == 0:
+            return {}
+        events = getUniverseEvents(self.addresses, NODE_EVENTS, start_block=min(firsts.values()), end_block=head,
+                                   node=node, decimals=decimals)
+        appended = {}
+        for lp in self.lp2s:
+            if lp.pool_address not in firsts:
+                continue
+            address = lp.pool_address.lower()
+            swaps, sync = events[(address, 'Swap')], events[(address, 'Sync')]
+            if len(swaps) == 0 or len(sync) == 0:
+                continue
+            swaps = swaps[swaps['blockNumber'] >= firsts[lp.pool_address]]
+            sync = sync[sync['blockNumber'] >= firsts[lp.pool_address]]
+            if len(swaps) == 0 or len(sync) == 0:
+                continue
+            summary = summarize(lp, swaps=swaps, sync=sync)
+            summary = summary[summary.index < str(open_day)]
+            # the supply of a day is read at the block of the next day in the map, which is only in the blocks
+            # read when the next day has a Sync, so the last closed day waits for one in the open day
+            last_closed = str(open_day - np.timedelta64(1, 'D'))
+            if last_closed in summary.index and pd.isna(summary.loc[last_closed, 'Supply']):
+                summary = summary.drop(last_closed)
+            with instrument.stage('store'):
+                appended[lp.pool_address] = self.store.append('node_summary', lp.exchange, lp.pool_address, summary)
+        return appended
+
+    def tick(self, now=None):
+        """
+        One round of both followers
+        :param now: unix time, the clock if None
+        :return: dict with the graph summary and the node days appended
+        """
+        now = utils.todayTimestamp() if now is None else now
+        result = {}
+        if self.graph:
+            result['graph'] = self.tickGraph(now)
+        if self.archive:
+            result['node'] = self.tickNode()
+        return result
+
+    def delay(self):
+        """
+        :return: seconds before the next tick, poll_seconds doubled for every tick failed in a row
+        up to DAEMON_MAX_BACKOFF_SECONDS
+        """
+        return min(self.poll_seconds * 2 ** self.failures, DAEMON_MAX_BACKOFF_SECONDS)
+
+    def run(self, max_ticks=None):
+        """
+        Ticks until interrupted. A failed tick is logged with its traceback and counted, and the next one
+        is tried after a longer wait, see delay
+        :param max_ticks: stop after that many ticks, None to run forever
+        """
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            instrument.reset()
+            try:
+                self.tick()
+                self.failures = 0
+            except Exception:
+                self.failures += 1
+                instrument.count('daemon', failures=1)
+                logger.exception('tick failed, %d in a row, next one in %ds', self.failures, self.delay())
+            instrument.dump('daemon')
+            ticks += 1
+            if max_ticks is None or ticks < max_ticks:
+                time.sleep(self.delay())
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Follows the subgraphs and the chain, keeping the store and '
+                                                 'final_lp_stats.csv up to date')
+    parser.add_argument('--universe', default='data/research_universe.csv')
+    parser.add_argument('--initial-stake', type=float, default=0.01, help='share of the reserves owned at inception')
+    parser.add_argument('--start-ts', type=int, default=1640991600, help='first day of the histories')
+    parser.add_argument('--no-graph', action='store_true', help='do not follow the subgraphs')
+    parser.add_argument('--no-node', action='store_true', help='do not follow the chain')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    Daemon(args.universe, args.initial_stake, args.start_ts, graph=not args.no_graph,
+           archive=not args.no_node).run()
@@ -0,0 +1,195 @@
+import json
+import os
+from collections import deque
+from math import sqrt, nan, isnan
+
+import numpy as np
+import pandas as pd
+
+from config import DAYS_PER_YEAR, STATS_STATE_DIR
+from panel import SUMMARY_COLUMNS
+
+# compounded fees of the last days reported as Fees_30D_pct
+FEE_WINDOW = 30
+
+
+class LPStats:
+    def __init__(self, exchange, pool_address, initial_stake, pair='', rewards=0):
+        """
+        Running version of LP.getStats: every summary metric is updated in constant time from one daily row
+        :param exchange: 'UNI' or 'SUSHI'
+        :param pool_address: pair address
+        :param initial_stake: % of reserves owned at inception
+        :param pair: token0_token1 symbols
+        :param rewards: extra incentives APR
+        """
+        self.exchange = exchange
+        self.pool_address = pool_address
+        self.initial_stake = initial_stake
+        self.pair = pair
+        self.rewards = rewards
+        self.last_date = None
+        self.nb_rows = 0
+        self.lp_position = nan
+        self.ini_nav = nan
+        self.reserve_eth = nan
+        self.cumul_ret = nan
+        self.max_nav = nan
+        self.max_drawdown = nan
+        self.last_token = nan
+        # Welford mean and sum of squared deviations of Token Ret
+        self.nb_ret = 0
+        self.mean_ret = 0.0
+        self.m2_ret = 0.0
+        # product of (1 + Fee_pct_NAV) from the second day, the last FEE_WINDOW factors with the NaN days in
+        # their slot, and the last Fee_pct_NAV: a compounded product ending on a NaN day is NaN, as in getStats
+        self.fee_product = 1.0
+        self.fee_window = deque(maxlen=FEE_WINDOW)
+        self.last_fee = 0.0
+
+    def update(self, date, row):
+        """
+        Adds the next day of the history
+        :param date: timestamp of the row, later than the last one added
+        :param row: hist_data row with totalSupply, reserve_ETH, daily_fees_ETH and WETH/Token
+        """
+        if self.last_date is not None and date <= self.last_date:
+            raise ValueError('%s: day %s is not after %s' % (self.pool_address, date, self.last_date))
+        if self.nb_rows == 0:
+            self.lp_position = self.initial_stake * float(row['totalSupply'])
+            self.ini_nav = float(row['reserve_ETH']) * self.initial_stake
+        # numpy divisions give the inf and NaN of getStats on a drained pool or a flat price, not an error
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ownership = np.float64(self.lp_position) / float(row['totalSupply'])
+            nav = float(row['reserve_ETH']) * ownership
+            fee_pct = float(float(row['daily_fees_ETH']) * ownership / self.ini_nav)
+            self.reserve_eth = float(row['reserve_ETH'])
+            self.cumul_ret = float(nav / self.ini_nav - 1)
+            # the running max ignores infinite NAVs, as pandas expanding windows do
+            if np.isfinite(nav):
+                self.max_nav = float(nav if isnan(self.max_nav) else max(self.max_nav, nav))
+            if not isnan(nav):
+                drawdown = float(nav / self.max_nav - 1)
+                if not isnan(drawdown):
+                    self.max_drawdown = drawdown if isnan(self.max_drawdown) else min(self.max_drawdown, drawdown)
+            token = float(row['WETH/Token'])
+            token_ret = float(np.float64(self.last_token) / token - 1)
+        if not isnan(token_ret):
+            self.nb_ret += 1
+            delta = token_ret - self.mean_ret
+            self.mean_ret += delta / self.nb_ret
+            self.m2_ret += delta * (token_ret - self.mean_ret)
+        self.last_token = token
+        if self.nb_rows > 0:
+            if not isnan(fee_pct):
+                self.fee_product *= 1 + fee_pct
+            self.last_fee = fee_pct
+        self.fee_window.append(1 + fee_pct)
+        self.nb_rows += 1
+        self.last_date = date
+
+    def ingest(self, hist_data):
+        """
+        Adds the rows of a history that are after the last day already added
+        :param hist_data: LP.hist_data indexed by timestamp
+        :return: number of rows added
+        """
+        new = hist_data if self.last_date is None else hist_data[hist_data.index > self.last_date]
+        for date, row in new.iterrows():
+            self.update(int(date), row)
+        return len(new)
+
+    def summary(self):
+        """
+        :return: one row dataframe in the final_lp_stats layout
+        """
+        nb_days = self.nb_rows - 1
+        ann_vol = np.float64(sqrt(self.m2_ret / (self.nb_ret - 1)) * sqrt(DAYS_PER_YEAR) if self.nb_ret > 1 else nan)
+        fees_ret = self.fee_product - 1 if not isnan(self.last_fee) else nan
+        fees_30d = 1.0
+        for factor in self.fee_window:
+            if not isnan(factor):
+                fees_30d *= factor
+        fees_30d = fees_30d - 1 if len(self.fee_window) > 0 and not isnan(self.fee_window[-1]) else nan
+        with_days = nb_days > 0
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            row = {
+                'nbDays': nb_days,
+                'TVL_ETH': self.reserve_eth,
+                'CumulRet': self.cumul_ret,
+                'FeesRet': fees_ret,
+                'AnnRet': np.float64(1 + self.cumul_ret) ** (DAYS_PER_YEAR / nb_days) - 1 if with_days else nan,
+                'AnnVol': ann_vol,
+                'MaxDrawdown': self.max_drawdown,
+                'Fees/Vol': fees_ret / ann_vol,
+                'FeesAnn': np.float64(1 + fees_ret) ** (DAYS_PER_YEAR / nb_days) - 1 if with_days else nan,
+                'Fees_30D_pct': fees_30d,
+                'Fees/Vol 30D': fees_30d * 12 / ann_vol,
+                'Pair': self.pair,
+                'Extra Incentives APR': self.rewards,
+            }
+        return pd.DataFrame([row], index=[self.pool_address], columns=SUMMARY_COLUMNS)
+
+    def toDict(self):
+        state = dict(self.__dict__)
+        state['fee_window'] = list(self.fee_window)
+        return state
+
+    @classmethod
+    def fromDict(cls, state):
+        stats = cls(state['exchange'], state['pool_address'], state['initial_stake'])
+        stats.__dict__.update(state)
+        stats.fee_window = deque(state['fee_window'], maxlen=FEE_WINDOW)
+        return stats
+
+
+class StatsState:
+    def __init__(self, path=STATS_STATE_DIR):
+        """
+        LPStats of each pool saved between runs, one json file per (exchange, pool, initial stake)
+        :param path: directory of the state files
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, exchange, pool_address, initial_stake):
+        return os.path.join(self.path, '%s_%s_%s.json' % (exchange, pool_address.lower(), initial_stake))
+
+    def get(self, exchange, pool_address, initial_stake):
+        """
+        :return: saved LPStats of the pool, a new empty one if nothing is saved
+        """
+        try:
+            with open(self._file(exchange, pool_address, initial_stake)) as f:
+                return LPStats.fromDict(json.load(f))
+        except (FileNotFoundError, ValueError):
+            return LPStats(exchange, pool_address, initial_stake)
+
+    def put(self, stats):
+        file = self._file(stats.exchange, stats.pool_address, stats.initial_stake)
+        with open(file + '.tmp', 'w') as f:
+            json.dump(stats.toDict(), f)
+        os.replace(file + '.tmp', file)
+
+
+def incrementalStats(lps, today_ts, state=None):
+    """
+    Summary of each pool from its saved state: only the closed days not seen yet are added and saved,
+    the current day, still moving, is added to a copy that is not saved
+    :param lps: list of LP after getHist
+    :param today_ts: timestamp of the current day
+    :param state: StatsState, default folder if None
+    :return: summary dataframe in the final_lp_stats layout
+    """
+    state = StatsState() if state is None else state
+    summaries = []
+    for lp in lps:
+        stats = state.get(lp.exchange, lp.pool_address, lp.initial_stake)
+        stats.pair = lp.token0 + '_' + lp.token1
+        stats.rewards = lp.rewards
+        if stats.ingest(lp.hist_data[lp.hist_data.index < today_ts]) > 0:
+            state.put(stats)
+        current = LPStats.fromDict(stats.toDict())
+        current.ingest(lp.hist_data[lp.hist_data.index >= today_ts])
+        summaries.append(current.summary())
+    return pd.concat(summaries)
@@ -0,0 +1,138 @@
+import cProfile
+import functools
+import json
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from urllib.parse import urlsplit
+
+from config import RUNS_DIR
+
+# path parts that vary per call (pool addresses) or are secrets (api keys) are masked in endpoint names
+_VARIABLE = re.compile(r'0x[0-9a-fA-F]+|[A-Za-z0-9_-]{24,}')
+
+_lock = threading.Lock()
+_started = time.time()
+_stages = {}
+_endpoints = {}
+
+
+def reset():
+    """
+    Starts a new run, every timer and counter goes back to 0
+    """
+    global _started
+    with _lock:
+        _started = time.time()
+        _stages.clear()
+        _endpoints.clear()
+
+
+def endpointName(url):
+    """
+    :param url: request url
+    :return: host and path with addresses and keys masked, e.g. api.thegraph.com/subgraphs/name/uniswap/uniswap-v2
+    """
+    parts = urlsplit(url)
+    return parts.netloc + _VARIABLE.sub('*', parts.path)
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a block of code under a stage name. Stages run by several threads add up their time,
+    and a stage nested in another is also counted in it
+    :param name: e.g. 'search', 'history fetch', 'log scan'
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        with _lock:
+            entry = _stages.setdefault(name, {'calls': 0, 'seconds': 0.0})
+            entry['calls'] += 1
+            entry['seconds'] += elapsed
+
+
+def timed(name):
+    """
+    Decorator timing every call of a function under a stage name, see stage
+    """
+    def decorator(function):
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(endpoint, **counters):
+    """
+    Adds to the counters of an endpoint: requests, bytes_sent, bytes_received, errors, retries,
+    backoff_s (seconds slept before a retry), throttle_s (seconds waited on a rate limiter), splits,
+    rate_limited and failovers (requests a provider pool sent to another provider)
+    :param endpoint: endpoint name, see endpointName
+    """
+    with _lock:
+        entry = _endpoints.setdefault(endpoint, {})
+        for key, value in counters.items():
+            entry[key] = entry.get(key, 0) + value
+
+
+def onResponse(response, *args, **kwargs):
+    """
+    requests response hook counting every http call of the shared session
+    """
+    retries = getattr(getattr(response.raw, 'retries', None), 'history', ())
+    body = response.request.body
+    count(endpointName(response.url), requests=1, bytes_sent=len(body) if body is not None else 0,
+          bytes_received=len(response.content), errors=int(response.status_code >= 400), retries=len(retries))
+
+
+def report():
+    """
+    :return: json serializable summary of the run: wall time, time per stage and counters per endpoint
+    """
+    with _lock:
+        return {'started': datetime.fromtimestamp(_started).isoformat(timespec='seconds'),
+                'wall_s': time.time() - _started,
+                'stages': {name: dict(entry) for name, entry in _stages.items()},
+                'endpoints': {name: dict(entry) for name, entry in _endpoints.items()}}
+
+
+def dump(name, path=RUNS_DIR):
+    """
+    Saves the report of the run as <path>/<name>-<start time>.json
+    :param name: pipeline name, e.g. 'main'
+    :param path: folder of the run reports
+    :return: file written
+    """
+    data = report()
+    os.makedirs(path, exist_ok=True)
+    file = os.path.join(path, '%s-%s.json' % (name, data['started'].replace(':', '')))
+    with open(file, 'w') as f:
+        json.dump(data, f, indent=2)
+    return file
+
+
+@contextmanager
+def profiled(name, path=RUNS_DIR):
+    """
+    Runs a block under cProfile and saves the stats next to the run reports, to load with pstats
+    :param name: pipeline name
+    :param path: folder of the run reports
+    """
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield profile
+    finally:
+        profile.disable()
+        os.makedirs(path, exist_ok=True)
+        profile.dump_stats(os.path.join(path, '%s-%s.prof' % (name, datetime.fromtimestamp(_started).strftime(
+            '%Y-%m-%dT%H%M%S'))))
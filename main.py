@@ -1,12 +1,22 @@
+import argparse
+import contextlib
 import pandas as pd
-from gql import gql
-import os
 import requests
+from concurrent.futures import ThreadPoolExecutor
 from math import floor, sqrt
-import matplotlib.pyplot as plt
+import instrument
+import numeric
 import utils
+from cache import HistoryCache, RewardsCache
+from charts import ChartRenderer, chartFolder
+from panel import panelFromLPs, panelStats
+from store import ParquetStore
+from scenarios import scenarioStats
+from sweep import sweep
+from gql import gql
 from utils import client, timestampToDate
-from config import SUSHI_GRAPH_API, UNIV2_GRAPH_API, DAYS_PER_YEAR
+from config import SUSHI_GRAPH_API, UNIV2_GRAPH_API, DAYS_PER_YEAR, SUSHI_REWARDS_API, GRAPH_MAX_WORKERS, \
+    GRAPH_BATCH_SIZE, GRAPH_BATCH_MAX_ROWS, RENDER_CHARTS, SCENARIO_MAX_WORKERS
 
 
 class Pools:
@@ -27,17 +37,20 @@ class Pools:
         today = utils.todayTimestamp()
         self.timestamp = floor(today / 86400) * 86400  # last daily update timestamp
 
-    def search(self):
+    def pages(self, page_size=1000):
         """
-        Returns all the pools that matches our tvl and token criteria
-        :return: pools addresses
+        Streams the pools that match our tvl and token criteria one page at a time. The token
+        filter is applied by the subgraph: a first pass on token0, then a pass on token1
+        excluding the pairs already returned
+        :param page_size: rows per request, 1000 at most on The Graph
+        :return: generator of dataframes
         """
-        filter_query = '''query($reserve_min: BigDecimal!,$date: Int!) {pairDayDatas(
-            orderBy: date
-            orderDirection: desc
+        filter_query = '''query($where: PairDayData_filter!, $first: Int!) {pairDayDatas(
+            orderBy: id
+            orderDirection: asc
             subgraphError: allow
-            where: {reserveUSD_gt: $reserve_min, date:$date}
-            first: 1000
+            where: $where
+            first: $first
           ) {
             reserveUSD
             token0 {
@@ -56,96 +69,189 @@ class Pools:
             id
           }
         }'''
-        params = {"reserve_min": self.min_tvl,
-                  "date": self.timestamp}
-        cli = self.client
-        response = cli.execute(gql(filter_query), variable_values=params)
-        data = pd.json_normalize(response['pairDayDatas'])
-        data['exchange'] = self.exchange
-        # fill in the token symbols
+        where = {"reserveUSD_gt": str(self.min_tvl), "date": self.timestamp}
         if len(self.to_include) == 0:
-            return data
+            passes = [where]
         else:
-            shortlist = data[
-                (data['token1.symbol'].isin(self.to_include)) | (data['token0.symbol'].isin(self.to_include))]
-            return shortlist
+            passes = [dict(where, token0_={"symbol_in": self.to_include}),
+                      dict(where, token1_={"symbol_in": self.to_include}, token0_={"symbol_not_in": self.to_include})]
+        for where in passes:
+            for rows in utils.paginate(self.client, filter_query, where, 'id', first=page_size):
+                data = pd.json_normalize(rows)
+                data['exchange'] = self.exchange
+                yield data
+
+    @instrument.timed('search')
+    def search(self):
+        """
+        Returns all the pools that matches our tvl and token criteria
+        :return: pools addresses
+        """
+        pages = list(self.pages())
+        if len(pages) == 0:
+            return pd.DataFrame()
+        return pd.concat(pages, ignore_index=True)
+
+
+# pairDayDatas fields read to build hist_data, the rest of the entity is not downloaded
+UNI_DAY_FIELDS = '''
+            date
+            totalSupply
+            reserve0
+            reserve1
+            dailyVolumeToken0
+            dailyVolumeToken1
+            token0 { symbol derivedETH }
+            token1 { symbol }'''
+SUSHI_DAY_FIELDS = '''
+            date
+            totalSupply
+            reserve0
+            reserve1
+            volumeToken0
+            volumeToken1
+            token0 { symbol derivedETH }
+            token1 { symbol }'''
+# pair filter of pairDayDatas on each subgraph
+PAIR_FILTERS = {'UNI': 'pairAddress', 'SUSHI': 'pair'}
+
+
+def dayQuery(fields):
+    """
+    :param fields: selection of pairDayDatas
+    :return: query of one pair taking `$where` and `$first` variables, as used by utils.paginate
+    """
+    return '''query($where: PairDayData_filter!, $first: Int!)
+    {
+        pairDayDatas(subgraphError: allow, orderBy: date, orderDirection: asc, where: $where, first: $first) {%s
+        }
+    }''' % fields
+
+
+def batchDayQuery(fields, nb_pairs):
+    """
+    :param fields: selection of pairDayDatas
+    :param nb_pairs: number of aliased pairDayDatas fields p0, p1... filtered by the variables $w0, $w1...
+    :return: query of several pairs in one request, taking a shared `$first` variable
+    """
+    variables = ''.join(', $w%d: PairDayData_filter!' % i for i in range(nb_pairs))
+    roots = ''.join('''
+        p%d: pairDayDatas(subgraphError: allow, orderBy: date, orderDirection: asc, where: $w%d, first: $first) {%s
+        }''' % (i, i, fields) for i in range(nb_pairs))
+    return 'query($first: Int!%s)\n    {%s\n    }' % (variables, roots)
 
 
 class LP:
-    def __init__(self, exchange, pool_address, initial_stake, fees, start_ts):
+    def __init__(self, exchange, pool_address, initial_stake, fees, start_ts, graph_api=None,
+                 rewards_api=SUSHI_REWARDS_API, cache=None, rewards_cache=None):
         """
         :param pool_address: address of pool we are analysing
         :param exchange: 'UNI' for uniswap and 'SUSHI' for Sushiswap
         :param initial_stake: % of reserves owned at inception
         :param fees: trading fees charged by exchange that goes to LP
         :param start_ts: timestamp we start the analysis and deposit
+        :param graph_api: overrides the exchange subgraph url, e.g. to use a local stand-in
+        :param rewards_api: sushi rewards api prefix, the pool address is appended
+        :param cache: HistoryCache, only the days missing from it are then downloaded
+        :param rewards_cache: RewardsCache, the rewards api is only called for expired APRs
         """
         self.pool_address = pool_address
         self.initial_stake = initial_stake
         self.fees = fees
         self.start_ts = start_ts
         self.exchange = exchange
+        self.rewards_api = rewards_api
+        self.cache = cache
+        self.rewards_cache = rewards_cache
         if exchange == 'UNI':
             self.graph_api = UNIV2_GRAPH_API
         else:
             if exchange == 'SUSHI':
                 self.graph_api = SUSHI_GRAPH_API
-        self.client = client(self.graph_api)
+        if graph_api is not None:
+            self.graph_api = graph_api
+        self._client = None
+
+    @property
+    def client(self):
+        """
+        Subgraph client, created on first use so that the schema introspection happens
+        in the worker thread when fetching concurrently
+        """
+        if self._client is None:
+            self._client = client(self.graph_api)
+        return self._client
+
+    def _cachedRows(self):
+        """
+        :return: rows of the pool already in the cache, sorted by date
+        """
+        if self.cache is None:
+            return []
+        return self.cache.get(self.graph_api, self.pool_address, self.start_ts) or []
+
+    def _cacheRows(self, rows):
+        if self.cache is not None:
+            self.cache.put(self.graph_api, self.pool_address, self.start_ts, rows)
+
+    def _histRows(self, hist_query, where):
+        """
+        Daily rows of the pool since start_ts, only the days after the last cached one are requested
+        :param hist_query: pairDayDatas query ordered by date
+        :param where: pair filter of the query
+        :return: rows sorted by date
+        """
+        rows = self._cachedRows()
+        cursor = rows[-1]['date'] if len(rows) > 0 else self.start_ts - 1
+        for page in utils.paginate(self.client, hist_query, where, 'date', cursor=cursor):
+            rows += page
+        self._cacheRows(rows)
+        return rows
+
+    def getHist(self):
+        """
+        Retrieves the daily history with the query matching the exchange subgraph
+        :return:
+        """
+        if self.exchange == 'UNI':
+            return self.getHistUNI()
+        return self.getHistSUSHI()
+
+    def setHist(self, rows):
+        """
+        Builds hist_data from pairDayDatas rows downloaded elsewhere, e.g. by fetchHistoriesBatched
+        :param rows: rows sorted by date with the fields of the exchange query
+        :return: history
+        """
+        if self.exchange == 'UNI':
+            return self.setHistUNI(rows)
+        return self.setHistSUSHI(rows)
 
     def getHistUNI(self):
         """
         Retrieves the daily history of the pool fees, reserves
         :return:
         """
-        hist_query = '''query($pairAddress:Bytes!,$date: Int!)
-        {
-            pairDayDatas(
-                subgraphError: allow
-            orderBy: date
-            orderDirection: desc
-            where: {pairAddress: $pairAddress, date_gte:$date}
-            first: 800
-        ) {
-            totalSupply
-        reserveUSD
-        reserve1
-        reserve0
-        pairAddress
-        id
-        date
-        dailyVolumeUSD
-        dailyVolumeToken0
-        dailyVolumeToken1
-        token0
-        {
-            symbol
-        decimals
-        derivedETH
-        }
-        token1
-        {
-            derivedETH
-        symbol
-        name
-        }
-        }
-        }'''
-        params = {"pairAddress": self.pool_address,
-                  "date": self.start_ts}
-        cli = self.client
-        response = cli.execute(gql(hist_query), variable_values=params)
-        data = pd.json_normalize(response['pairDayDatas'])
+        hist_query = dayQuery(UNI_DAY_FIELDS)
+        return self.setHistUNI(self._histRows(hist_query, {"pairAddress": self.pool_address}))
+
+    def setHistUNI(self, rows):
+        """
+        :param rows: pairDayDatas rows with UNI_DAY_FIELDS
+        :return: history
+        """
+        data = pd.json_normalize(rows)
         data = data.set_index('date')
         data = data.sort_index(ascending=True)
         self.token0 = data['token0.symbol'].iloc[0]
         self.token1 = data['token1.symbol'].iloc[0]
         """
-        Convert columns to float
+        Convert columns to float64, float32 only keeps 7 digits of the reserves and supply
         """
         to_convert = ['totalSupply', 'dailyVolumeToken0', 'token0.derivedETH', 'reserve1', 'reserve0',
                       'dailyVolumeToken1']
         for col in to_convert:
-            data[col] = data[col].astype('float32')
+            data[col] = numeric.parseDecimals(data[col])
         if data.iloc[0]['token0.symbol'] == 'WETH':
             data['daily_fees_ETH'] = data['dailyVolumeToken0'] * self.fees
             data['daily_Volume_ETH'] = data['dailyVolumeToken0']
@@ -169,56 +275,25 @@ class LP:
         Retrieves the daily history of the pool fees, reserves
         :return:
         """
-        hist_query = '''query($pairAddress:String!,$date: Int!)
-        {
-            pairDayDatas(
-                subgraphError: allow
-            orderBy: date
-            orderDirection: desc
-            where: {pair: $pairAddress, date_gte:$date}
-            first: 800
-        ) {
-            totalSupply
-        reserveUSD
-        reserve1
-        reserve0
-        pair
-        {
-        id
-        }
-        date
-        volumeUSD
-        volumeToken0
-        volumeToken1
-        token0
-        {
-            symbol
-        decimals
-        derivedETH
-        }
-        token1
-        {
-            derivedETH
-        symbol
-        name
-        }
-        }
-        }'''
-        params = {"pairAddress": self.pool_address,
-                  "date": self.start_ts}
-        cli = self.client
-        response = cli.execute(gql(hist_query), variable_values=params)
-        data = pd.json_normalize(response['pairDayDatas'])
+        hist_query = dayQuery(SUSHI_DAY_FIELDS)
+        return self.setHistSUSHI(self._histRows(hist_query, {"pair": self.pool_address}))
+
+    def setHistSUSHI(self, rows):
+        """
+        :param rows: pairDayDatas rows with SUSHI_DAY_FIELDS
+        :return: history
+        """
+        data = pd.json_normalize(rows)
         data = data.set_index('date')
         data = data.sort_index(ascending=True)
         self.token0 = data['token0.symbol'].iloc[0]
         self.token1 = data['token1.symbol'].iloc[0]
         """
-        Convert columns to float
+        Convert columns to float64, float32 only keeps 7 digits of the reserves and supply
         """
         to_convert = ['totalSupply', 'volumeToken0', 'token0.derivedETH', 'reserve1', 'reserve0', 'volumeToken1']
         for col in to_convert:
-            data[col] = data[col].astype('float32')
+            data[col] = numeric.parseDecimals(data[col])
         if data.iloc[0]['token0.symbol'] == 'WETH':
             data['daily_fees_ETH'] = data['volumeToken0'] * self.fees
             data['daily_Volume_ETH'] = data['volumeToken0']
@@ -237,19 +312,27 @@ class LP:
         self.getRewards()
         return data
 
+    @instrument.timed('rewards')
     def getRewards(self):
         if self.exchange == 'UNI':
             self.rewards = 0
-        else:
-            reward = requests.get('https://www.sushi.com/earn/api/pool/eth:' + self.pool_address)
-            # reward=pd.json_normalize(pd.json_normalize(reward.json()['pair'])['farm.incentives'][0])
-            print('x')
-            try:
-                reward = pd.json_normalize(pd.json_normalize(reward.json()['pair'])['farm.incentives'][0])
-                self.rewards = reward.iloc[0]['apr']
-            except:
-                self.rewards = 0
+            return
+        if self.rewards_cache is not None:
+            self.rewards = self.rewards_cache.get(self.pool_address)
+            if self.rewards is not None:
+                return
+        reward = utils.httpSession().get(self.rewards_api + self.pool_address)
+        # reward=pd.json_normalize(pd.json_normalize(reward.json()['pair'])['farm.incentives'][0])
+        try:
+            reward = pd.json_normalize(pd.json_normalize(reward.json()['pair'])['farm.incentives'][0])
+            self.rewards = reward.iloc[0]['apr']
+        except:
+            self.rewards = 0
+            return
+        if self.rewards_cache is not None:
+            self.rewards_cache.put(self.pool_address, float(self.rewards))
 
+    @instrument.timed('stats')
     def getStats(self):
         """
         This function analyses the historical data extracted previously to calculate
@@ -280,36 +363,6 @@ class LP:
 
         # convert index timestamp to date
         df_hist.index = df_hist.index.map(timestampToDate)
-        # Create a directory if does not exist
-        folder_name = "data/" + self.token0 + '_' + self.token1 + '_' + self.exchange
-        if not os.path.isdir(folder_name):
-            # if the demo_folder2 directory is
-            # not present then create it.
-            os.makedirs(folder_name)
-        # Charts to show NAV through time, fee component, TVL
-        plt.clf()
-        (df_hist['Cumulative_Ret'] * 100).plot(title=self.token0 + '_' + self.token1 + '_' + self.exchange,
-                                               figsize=(12, 9))
-
-        ((((1 + df_hist.iloc[1:]['Fee_pct_NAV']).cumprod()) - 1) * 100).plot(label='Cumulative Fee Return')
-        plt.xlabel('timestamp')
-        plt.ylabel('%')
-        plt.legend()
-        plt.savefig(folder_name + '/daily returns.png')
-        plt.clf()
-        ax = df_hist['reserve_ETH'].plot(title=self.token0 + '_' + self.token1 + '_' + self.exchange, label='TVL',
-                                         figsize=(12, 9))
-        ax2 = ax.twinx()
-        df_hist['daily_Volume_ETH'].plot(label='Daily volume', color='r', ax=ax2)
-        lines, labels = ax.get_legend_handles_labels()
-        lines2, labels2 = ax2.get_legend_handles_labels()
-        print(labels + labels2)
-        ax2.legend(lines + lines2, labels + labels2, loc=0)
-
-        plt.xlabel('Timestamp')
-        plt.ylabel('ETH')
-        plt.savefig(folder_name + '/volume_tvl.png')
-
         # Generate the summary dataframe
         summary = pd.DataFrame(index=[self.pool_address],
                                columns=['nbDays', 'TVL_ETH', 'CumulRet', 'FeesRet', 'AnnRet', 'AnnVol', \
@@ -331,31 +384,166 @@ class LP:
         summary['Extra Incentives APR'] = self.rewards
         return df_hist, summary
 
-# Search the investable Pools
-uni = Pools(to_include=['WETH'])
-pool_uni = uni.search()
-sushi = Pools(url=SUSHI_GRAPH_API, to_include=['WETH'], exchange='SUSHI')
-pool_sushi = sushi.search()
-# save it
-pd.concat([pool_uni, pool_sushi]).to_csv('data/research_universe.csv')
-
-final_data = pd.DataFrame()
-# get the relevant info for Uniswap pool
-for pool_id in pool_uni['id'].unique():
-    print(pool_id)
-    lp_wise = LP(exchange='UNI', pool_address=pool_id.split('-')[0], initial_stake=0.01, fees=0.003,
-                 start_ts=1640991600)
-    lp_wise_hist = lp_wise.getHistUNI()
-    ret, s = lp_wise.getStats()
-    final_data = final_data.append(s)
-
-# get the relevant info for Sushiswap pool
-for pool_id in pool_sushi['id'].unique():
-    lp_wise = LP(exchange='SUSHI', pool_address=pool_id.split('-')[0], initial_stake=0.01, fees=0.003,
-                 start_ts=1640991600)
-    lp_wise_hist = lp_wise.getHistSUSHI()
-    ret, s = lp_wise.getStats()
-    final_data = final_data.append(s)
-
-final_data.to_csv('final_lp_stats.csv')
 
+@instrument.timed('history fetch')
+def fetchHistories(lps, max_workers=GRAPH_MAX_WORKERS):
+    """
+    Downloads the history of several pools concurrently. Requests to each subgraph stay
+    within its GRAPH_RATE_LIMITS budget whatever the number of workers
+    :param lps: list of LP
+    :param max_workers: number of pools fetched at the same time
+    :return: list of histories in the same order as lps
+    """
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(LP.getHist, lps))
+
+
+def isRetryableBatchError(error):
+    """
+    :param error: exception raised by a batched subgraph query
+    :return: True for transport errors and for the errors answered by the subgraph, which gql raises as
+    a plain Exception, so the batch is tried again smaller. False for the other exceptions, which are bugs
+    and must not be retried
+    """
+    return isinstance(error, requests.RequestException) or type(error) is Exception
+
+
+@instrument.timed('history fetch')
+def fetchHistoriesBatched(lps, batch_size=GRAPH_BATCH_SIZE, max_rows=GRAPH_BATCH_MAX_ROWS, first=1000):
+    """
+    Downloads the history of several pools with aliased pairDayDatas fields, many pairs per request.
+    The number of pairs per request is halved when a request fails or returns more than max_rows
+    and doubled again, up to batch_size, while responses stay small
+    :param lps: list of LP, several exchanges or endpoints can be mixed
+    :param batch_size: most pairs in one request
+    :param max_rows: rows per response above which the batch shrinks
+    :param first: page size of each pair
+    :return: list of histories in the same order as lps
+    """
+    groups = {}
+    for lp in lps:
+        groups.setdefault((lp.graph_api, lp.exchange), []).append(lp)
+    for (graph_api, exchange), group in groups.items():
+        cli = client(graph_api)
+        fields = UNI_DAY_FIELDS if exchange == 'UNI' else SUSHI_DAY_FIELDS
+        rows = {lp: lp._cachedRows() for lp in group}
+        cursors = {lp: rows[lp][-1]['date'] if len(rows[lp]) > 0 else lp.start_ts - 1 for lp in group}
+        pending = list(group)
+        size = min(batch_size, len(pending))
+        while len(pending) > 0:
+            batch = pending[:size]
+            variables = {'first': first}
+            for i, lp in enumerate(batch):
+                variables['w%d' % i] = {PAIR_FILTERS[exchange]: lp.pool_address, 'date_gt': cursors[lp]}
+            try:
+                response = cli.execute(gql(batchDayQuery(fields, len(batch))), variable_values=variables)
+            except Exception as e:
+                # timeouts, http errors and errors answered by the subgraph are retried with a smaller batch,
+                # as a batch too large fails with one of them
+                if size == 1 or not isRetryableBatchError(e):
+                    raise
+                size //= 2
+                continue
+            nb_rows = 0
+            for i, lp in enumerate(batch):
+                page = response['p%d' % i]
+                rows[lp] += page
+                nb_rows += len(page)
+                if len(page) == first:
+                    cursors[lp] = page[-1]['date']
+                else:
+                    pending.remove(lp)
+            if nb_rows > max_rows:
+                size = max(1, size // 2)
+            elif nb_rows < max_rows // 2:
+                size = min(batch_size, size * 2)
+        for lp in group:
+            lp._cacheRows(rows[lp])
+            if len(rows[lp]) == 0:
+                # pair without any day in the range, left out by the len(lp.hist_data) > 0 filters
+                lp.hist_data = pd.DataFrame()
+                continue
+            lp.setHist(rows[lp])
+    return [lp.hist_data for lp in lps]
+
+
+def run(initial_stake=0.01, start_ts=1640991600, charts=RENDER_CHARTS, uni_api=UNIV2_GRAPH_API,
+        sushi_api=SUSHI_GRAPH_API, rewards_api=SUSHI_REWARDS_API, backtest=False, scenarios=False, batched=True):
+    """
+    Full pipeline: pool universe, histories, stats saved in final_lp_stats.csv and the store, charts
+    :param initial_stake: % of reserves owned at inception
+    :param start_ts: timestamp we start the analysis and deposit
+    :param charts: render the charts of each pool
+    :param uni_api: uniswap subgraph url
+    :param sushi_api: sushiswap subgraph url
+    :param rewards_api: sushi rewards api prefix
+    :param backtest: also save lp_sweep.csv, the stats of every entry day, holding period and stake (see sweep.py)
+    :param scenarios: also save lp_scenarios.csv, the simulated LP return distributions (see scenarios.py)
+    :param batched: fetch many pairs per subgraph request with fetchHistoriesBatched, otherwise one pool per
+    request with fetchHistories
+    :return: summary of every pool, the timings and request counts of the run are saved in RUNS_DIR
+    """
+    instrument.reset()
+    history_cache = HistoryCache()
+    rewards_cache = RewardsCache()
+    # Search the investable Pools
+    uni = Pools(url=uni_api, to_include=['WETH'])
+    pool_uni = uni.search()
+    sushi = Pools(url=sushi_api, to_include=['WETH'], exchange='SUSHI')
+    pool_sushi = sushi.search()
+    # save it
+    pd.concat([pool_uni, pool_sushi]).to_csv('data/research_universe.csv')
+
+    lps = [LP(exchange='UNI', pool_address=pool_id.split('-')[0], initial_stake=initial_stake, fees=0.003,
+              start_ts=start_ts, graph_api=uni_api, cache=history_cache) for pool_id in pool_uni['id'].unique()]
+    lps += [LP(exchange='SUSHI', pool_address=pool_id.split('-')[0], initial_stake=initial_stake, fees=0.003,
+               start_ts=start_ts, graph_api=sushi_api, rewards_api=rewards_api, cache=history_cache,
+               rewards_cache=rewards_cache)
+            for pool_id in pool_sushi['id'].unique()]
+    # charts are rendered by worker processes meanwhile the store is written
+    if batched:
+        fetchHistoriesBatched(lps)
+    else:
+        fetchHistories(lps)
+    lps = [lp for lp in lps if len(lp.hist_data) > 0]
+
+    store = ParquetStore()
+    panel, rewards = panelFromLPs(lps)
+    ret, final_data = panelStats(panel, initial_stake=initial_stake, rewards=rewards)
+    with ChartRenderer(enabled=charts) as renderer:
+        for lp in lps:
+            df_hist = ret.loc[lp.pool_address]
+            df_hist = df_hist.set_axis(df_hist.index.map(timestampToDate))
+            renderer.submit(lp.token0 + '_' + lp.token1 + '_' + lp.exchange, df_hist,
+                            chartFolder(lp.token0, lp.token1, lp.exchange))
+            with instrument.stage('store'):
+                # the current day is still moving, only closed days are appended
+                store.append('history', lp.exchange, lp.pool_address,
+                             lp.hist_data[lp.hist_data.index < uni.timestamp])
+                store.append('stats', lp.exchange, lp.pool_address,
+                             final_data.loc[[lp.pool_address]].set_axis([uni.timestamp], axis=0))
+        with instrument.stage('charts'):
+            renderer.close()
+
+    final_data.to_csv('final_lp_stats.csv')
+    if backtest:
+        sweep(lps).to_csv('lp_sweep.csv')
+    if scenarios:
+        scenarioStats(lps, max_workers=SCENARIO_MAX_WORKERS).to_csv('lp_scenarios.csv')
+    instrument.dump('main')
+    return final_data
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Uniswap and Sushiswap WETH pools LP statistics')
+    parser.add_argument('--initial-stake', type=float, default=0.01, help='share of the reserves owned at inception')
+    parser.add_argument('--start-ts', type=int, default=1640991600, help='timestamp of the deposit')
+    parser.add_argument('--no-charts', action='store_true', help='skip the charts, for batch runs')
+    parser.add_argument('--profile', action='store_true', help='save a cProfile dump of the run in RUNS_DIR')
+    parser.add_argument('--backtest', action='store_true', help='save the entry date x holding x stake grid')
+    parser.add_argument('--scenarios', action='store_true', help='save the simulated LP return distributions')
+    parser.add_argument('--unbatched', action='store_true', help='one subgraph request per pool, as before batching')
+    args = parser.parse_args()
+    with instrument.profiled('main') if args.profile else contextlib.nullcontext():
+        run(args.initial_stake, args.start_ts, charts=not args.no_charts, backtest=args.backtest,
+            scenarios=args.scenarios, batched=not args.unbatched)
@@ -1,88 +1,181 @@
+import argparse
+import contextlib
+import instrument
 from config import PROVIDER_URL, UNI_FEES, SUSHI_FEES
 from archive_node.node import *
 from utils import *
+from store import ParquetStore
+import numpy as np
 import pandas as pd
 
 FROM_BLOCK = 9000000  # put start of univ3
 
-w3 = web3.Web3(web3.HTTPProvider(PROVIDER_URL))
-LATEST_BLOCK = w3.eth.get_block_number()
-
-# Load the mapping file that maps block numbers to dates
-block_to_date = pd.read_csv('data/block_date_map.csv', index_col=0, sep='\t')
-
 
 # create a class uniV2 wil be easier
 
 class Lp2:
-    def __init__(self, pool_address, universe):
+    def __init__(self, pool_address, universe, node=None, pool_abi=None):
         """
         Takes a pool_address and a universe dataframe with all pool info
+        :param node: web3 connection, provider() if None
+        :param pool_abi: contract ABI, from the ABI registry if None
         """
         pool_data = universe[universe['id'].str.startswith(pool_address)]
         self.token0 = pool_data.iloc[0]['token0.symbol']
         self.token1 = pool_data.iloc[0]['token1.symbol']
         self.pool_address = pool_address
-        self.exchange = pool_data.iloc[0]['Exchange']
-        self.token0_decimals = pool_data.iloc[0]['token0.decimals']
-        self.token1_decimals = pool_data.iloc[0]['token1.decimals']
-        self.pool_abi = get_ABI(self.pool_address)
+        # older universe files name the column Exchange
+        self.exchange = pool_data.iloc[0]['Exchange' if 'Exchange' in pool_data else 'exchange']
+        self.token0_decimals = int(pool_data.iloc[0]['token0.decimals'])
+        self.token1_decimals = int(pool_data.iloc[0]['token1.decimals'])
+        self.node = node
+        self.pool_abi = get_ABI(self.pool_address) if pool_abi is None else pool_abi
+
+    def swapDecimals(self):
+        """
+        :return: decimals of each Swap amount, to get them in token units
+        """
+        return {'amount0In': self.token0_decimals, 'amount0Out': self.token0_decimals,
+                'amount1In': self.token1_decimals, 'amount1Out': self.token1_decimals}
 
-    def get_fees(self):
+    def get_fees(self, swaps=None):
+        """
+        :param swaps: Swap logs of the pool scaled with swapDecimals, e.g. from getUniverseEvents, scanned if None
+        """
         if self.exchange == 'UNI':
             trading_fee = UNI_FEES
         else:
             trading_fee = SUSHI_FEES
-        swa = extractSwap(self.pool_address, pool_abi=self.pool_abi)
+        if swaps is None:
+            swaps = extractSwap(self.pool_address, pool_abi=self.pool_abi, node=self.node,
+                                decimals=(self.token0_decimals, self.token1_decimals))
+        swa = swaps.copy()
+        # amounts come in token units, each leg scaled by the decimals of its own token
         if self.token0 == 'WETH':
-            for c in ['amount0In', 'amount0Out']:
-                swa[c] = swa[c] / 10 ** (self.token0_decimals)
             swa['ETH vol'] = swa['amount0Out'] + swa['amount0In']
         else:
-            for c in ['amount1In', 'amount1Out']:
-                swa[c] = swa[c] / 10 ** (self.token0_decimals)
             swa['ETH vol'] = swa['amount1Out'] + swa['amount1In']
         swa['ETH fees'] = swa['ETH vol'] * trading_fee
         # convert block number to actual date
-        swa['day'] = swa['blockNumber'].apply(lambda x: blockToDate(x, block_to_date))
+        swa['day'] = blockDateIndex().toDates(swa['blockNumber'])
         daily_fees = pd.pivot_table(data=swa, index='day', values='ETH fees', aggfunc='sum')  # pivot_table
         daily_volumes = pd.pivot_table(data=swa, index='day', values='ETH vol', aggfunc='sum')
         return daily_fees.join(daily_volumes)
 
-    def get_reserves(self):
-        sync = extractSync(self.pool_address, pool_abi=self.pool_abi)
-        sync['reserve0_adj'] = sync['reserve0'] / 10 ** (self.token0_decimals)
-        sync['reserve1_adj'] = sync['reserve1'] / 10 ** (self.token1_decimals)
+    def get_reserves(self, sync=None):
+        """
+        :param sync: Sync logs of the pool, e.g. from getUniverseEvents, scanned if None
+        """
+        # raw reserves are kept as exact ints for the store, python int division rounds them once
+        if sync is None:
+            sync = extractSync(self.pool_address, pool_abi=self.pool_abi, node=self.node)
+        sync = sync.copy()
+        sync['reserve0_adj'] = (sync['reserve0'] / 10 ** self.token0_decimals).astype('float64')
+        sync['reserve1_adj'] = (sync['reserve1'] / 10 ** self.token1_decimals).astype('float64')
         if self.token0 == 'WETH':
             sync['Token vs WETH'] = sync['reserve1_adj'] / sync['reserve0_adj']
             sync['TVL ETH'] = 2 * sync['reserve0_adj']
         else:
             sync['Token vs WETH'] = sync['reserve0_adj'] / sync['reserve1_adj']
             sync['TVL ETH'] = 2 * sync['reserve1_adj']
-        sync['day'] = sync['blockNumber'].apply(lambda x: blockToDate(x, block_to_date))
+        sync['day'] = blockDateIndex().toDates(sync['blockNumber'])
         sync = sync.set_index('day')
         self.reserves = sync
-        self.blocklist = block_to_date.loc[sync.index.dropna().unique()]['Block'].unique()
+        self.blocklist = np.unique(blockDateIndex().firstBlocks(sync.index.dropna().unique()))
         return sync
 
     # get daily Nb Lp tokens could be faster by archive node but could consume more calls
-    def get_supply(self):
-        sup = supply(self.pool_address, pool_abi=self.pool_abi, list_block=self.blocklist)
-        sup.index = sup.index.map(lambda x: blockToDate(x, block_to_date))
+    def get_supply(self, from_events=False, spot_checks=3, seed=None):
+        """
+        :param from_events: rebuild the supply from mint/burn Transfer events instead of archive reads
+        :param spot_checks: archive reads checked against the event ledger, 0 on a non-archive node
+        :param seed: seed of the spot checked blocks, so that a failed check can be replayed
+        """
+        if from_events:
+            sup = supplyFromEvents(self.pool_address, self.blocklist, self.pool_abi, spot_checks=spot_checks,
+                                   node=self.node, seed=seed)
+        else:
+            sup = supply(self.pool_address, pool_abi=self.pool_abi, list_block=self.blocklist, node=self.node)
+        sup.index = blockDateIndex().toDates(sup.index)
         sup=sup[~sup.index.duplicated(keep='last')]
         return sup
 
 
-# Running example
-address = "0x21b8065d10f73ee2e260e5b47d3344d3ced7596e"
-universe = pd.read_csv('data/research_universe.csv')
-lp = Lp2(address, universe)
-df_fee = lp.get_fees()
-df_tvl = lp.get_reserves()
-df_tvl=df_tvl[~df_tvl.index.duplicated(keep='last')]
-df_supply = lp.get_supply()
-# join doubles up check to remove duplicates
-pool_data_summary = df_fee.join(df_supply).join(df_tvl)
+def summarize(lp, from_events=False, swaps=None, sync=None):
+    """
+    Daily fees, reserves and supply of a pool, joined
+    :param lp: Lp2
+    :param from_events: rebuild the supply from mint/burn events instead of archive reads
+    :param swaps: Swap logs already scanned, see Lp2.get_fees
+    :param sync: Sync logs already scanned, see Lp2.get_reserves
+    """
+    df_fee = lp.get_fees(swaps)
+    df_tvl = lp.get_reserves(sync)
+    df_tvl = df_tvl[~df_tvl.index.duplicated(keep='last')]
+    df_supply = lp.get_supply(from_events=from_events)
+    # join doubles up check to remove duplicates
+    return df_fee.join(df_supply).join(df_tvl)
+
+
+def run(address, universe_path='data/research_universe.csv', from_events=False, node=None, pool_abi=None):
+    """
+    Rebuilds the daily fees, reserves and supply of a pool from the node and appends them to the store
+    :param address: pair address, must be in the research universe
+    :param universe_path: csv saved by main.py
+    :param from_events: rebuild the supply from mint/burn events instead of archive reads
+    :param node: web3 connection, provider() if None
+    :param pool_abi: contract ABI, from the ABI registry if None
+    :return: daily summary of the pool, the timings and request counts of the run are saved in RUNS_DIR
+    """
+    instrument.reset()
+    universe = pd.read_csv(universe_path)
+    lp = Lp2(address, universe, node=node, pool_abi=pool_abi)
+    pool_data_summary = summarize(lp, from_events)
+    with instrument.stage('store'):
+        ParquetStore().append('node_summary', lp.exchange, address, pool_data_summary)
+    instrument.dump('main_archive_node')
+    return pool_data_summary
 
-pool_data_summary.to_csv('data/Node/' + str(address) + '_summary.csv')
-print('pp')
+
+def runUniverse(universe_path='data/research_universe.csv', from_events=False, node=None, pool_abi=None):
+    """
+    run for every pool of the research universe, the Swap and Sync logs of all pools are scanned together
+    with getUniverseEvents, one eth_getLogs per block range
+    :param universe_path: csv saved by main.py
+    :param from_events: rebuild the supply from mint/burn events instead of archive reads
+    :param node: web3 connection, provider() if None
+    :param pool_abi: contract ABI shared by the pairs, from the ABI registry if None
+    :return: dict of pair address -> daily summary
+    """
+    instrument.reset()
+    universe = pd.read_csv(universe_path)
+    lps = [Lp2(address, universe, node=node, pool_abi=pool_abi)
+           for address in universe['id'].str.split('-').str[0].unique()]
+    events = getUniverseEvents([lp.pool_address for lp in lps], ('Swap', 'Sync'), node=node,
+                               decimals={lp.pool_address: lp.swapDecimals() for lp in lps})
+    store = ParquetStore()
+    summaries = {}
+    for lp in lps:
+        address = lp.pool_address.lower()
+        summaries[lp.pool_address] = summarize(lp, from_events, swaps=events[(address, 'Swap')],
+                                               sync=events[(address, 'Sync')])
+        with instrument.stage('store'):
+            store.append('node_summary', lp.exchange, lp.pool_address, summaries[lp.pool_address])
+    instrument.dump('main_archive_node')
+    return summaries
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Daily pool data rebuilt from an archive node')
+    # Running example
+    parser.add_argument('address', nargs='?', default="0x21b8065d10f73ee2e260e5b47d3344d3ced7596e")
+    parser.add_argument('--universe', default='data/research_universe.csv')
+    parser.add_argument('--from-events', action='store_true', help='supply from mint/burn events, no archive reads')
+    parser.add_argument('--profile', action='store_true', help='save a cProfile dump of the run in RUNS_DIR')
+    parser.add_argument('--all', action='store_true', help='every pool of the universe, logs scanned together')
+    args = parser.parse_args()
+    with instrument.profiled('main_archive_node') if args.profile else contextlib.nullcontext():
+        if args.all:
+            runUniverse(args.universe, args.from_events)
+        else:
+            run(args.address, args.universe, args.from_events)
@@ -0,0 +1,179 @@
+import numpy as np
+
+# uint256 values are held as 8 big-endian uint32 limbs in uint64 arrays: every limb is exact in a float64
+# and a limb times 2**32 plus a remainder below 10**9 never overflows during the long division
+NB_LIMBS = 8
+# base 10**9 digits of a uint256, 10**81 > 2**256
+CHUNK = 10 ** 9
+NB_CHUNKS = 9
+NB_DIGITS = NB_CHUNKS * 9
+# 10**decimals is exact as a pair of float64 up to 10**45, 5**45 < 2**106
+MAX_DECIMALS = 45
+_POWERS = 10 ** np.arange(8, -1, -1, dtype='uint64')
+_LIMB_SCALES = 2.0 ** (32 * np.arange(NB_LIMBS - 1, -1, -1))
+_SPLITTER = 2.0 ** 27 + 1
+
+# Precision contract
+# - limbsFrom*, decimalChunks and fixedPoint are exact for any value in [0, 2**256)
+# - scaleUnits computes value / 10**decimals in double-double arithmetic (about 104 bits) and rounds once to
+#   float64: the result is the nearest float64, as the python int division value / 10 ** decimals, except when
+#   the exact quotient is within 2**-100 relative of a tie where it can be the other neighbour
+# - parseDecimals returns the float64 nearest to each decimal string, as float(string)
+# float64 keeps 15 to 17 significant digits, enough for reserves, volumes and prices in ETH, fixedPoint is
+# there where every wei counts
+
+
+def limbsFromInts(values):
+    """
+    :param values: non negative python ints below 2**256, e.g. the uint columns of decodeLogs
+    :return: uint64 array (n, 8) of uint32 limbs, most significant first
+    """
+    raw = b''.join(int(v).to_bytes(32, 'big') for v in values)
+    return limbsFromBytes(raw)
+
+
+def limbsFromBytes(raw):
+    """
+    :param raw: concatenated 32 bytes big-endian words, e.g. the data of raw logs
+    :return: uint64 array (n, 8) of uint32 limbs, most significant first
+    """
+    return np.frombuffer(raw, dtype='>u4').reshape(-1, NB_LIMBS).astype('uint64')
+
+
+def limbsFromHex(values):
+    """
+    :param values: 0x hex strings of 32 bytes words
+    :return: uint64 array (n, 8) of uint32 limbs, most significant first
+    """
+    return limbsFromBytes(bytes.fromhex(''.join(v[2:].rjust(64, '0') for v in values)))
+
+
+def limbsFromWords(words):
+    """
+    :param words: uint64 array (n, 4) of big-endian limbs, see archive_node.decode.dataWords
+    :return: uint64 array (n, 8) of uint32 limbs, most significant first
+    """
+    words = np.asarray(words, dtype='uint64')
+    return np.stack([words >> np.uint64(32), words & np.uint64(0xffffffff)], axis=-1).reshape(-1, NB_LIMBS)
+
+
+def decimalChunks(limbs):
+    """
+    Exact base 10**9 digits by long division of every value at once
+    :param limbs: uint64 array (n, 8) of uint32 limbs
+    :return: uint64 array (n, 9) of chunks below 10**9, most significant first
+    """
+    rest = np.array(limbs, dtype='uint64')
+    chunks = np.empty((len(rest), NB_CHUNKS), dtype='uint64')
+    divisor = np.uint64(CHUNK)
+    shift = np.uint64(32)
+    for k in range(NB_CHUNKS - 1, -1, -1):
+        remainder = np.zeros(len(rest), dtype='uint64')
+        for j in range(NB_LIMBS):
+            current = (remainder << shift) | rest[:, j]
+            rest[:, j] = current // divisor
+            remainder = current % divisor
+        chunks[:, k] = remainder
+    return chunks
+
+
+def _digits(limbs):
+    """
+    :return: uint8 array (n, 81) of the ascii decimal digits, zero padded on the left
+    """
+    chunks = decimalChunks(limbs)
+    digits = (chunks[:, :, None] // _POWERS) % np.uint64(10)
+    return (digits.reshape(len(chunks), NB_DIGITS) + ord('0')).astype('uint8')
+
+
+def _shifted(limbs, decimals):
+    """
+    :return: bytes array of the values with the decimal point moved left by decimals digits
+    """
+    decimals = int(decimals)
+    if not 0 <= decimals <= NB_DIGITS:
+        raise ValueError('decimals must be between 0 and %d, got %d' % (NB_DIGITS, decimals))
+    digits = _digits(limbs)
+    out = np.empty((len(digits), NB_DIGITS + 1), dtype='uint8')
+    point = NB_DIGITS - decimals
+    out[:, :point] = digits[:, :point]
+    out[:, point] = ord('.')
+    out[:, point + 1:] = digits[:, point:]
+    return out.view('S%d' % (NB_DIGITS + 1)).ravel()
+
+
+def _twoSum(a, b):
+    """
+    :return: a + b rounded and its exact rounding error
+    """
+    total = a + b
+    virtual = total - a
+    return total, (a - (total - virtual)) + (b - virtual)
+
+
+def _twoProduct(a, b):
+    """
+    :return: a * b rounded and its exact rounding error, Dekker's product without fma
+    """
+    product = a * b
+    a_big = _SPLITTER * a
+    a_high = a_big - (a_big - a)
+    b_big = _SPLITTER * b
+    b_high = b_big - (b_big - b)
+    a_low, b_low = a - a_high, b - b_high
+    return product, ((a_high * b_high - product) + a_high * b_low + a_low * b_high) + a_low * b_low
+
+
+def scaleUnits(limbs, decimals):
+    """
+    Token amounts from raw uint256 units, e.g. wei to ETH with 18 decimals
+    :param limbs: uint64 array (n, 8), see limbsFromInts, limbsFromBytes, limbsFromHex, limbsFromWords
+    :param decimals: decimals of the token, MAX_DECIMALS at most
+    :return: float64 array, rounded once (see the precision contract)
+    """
+    decimals = int(decimals)
+    if not 0 <= decimals <= MAX_DECIMALS:
+        raise ValueError('decimals must be between 0 and %d, got %d' % (MAX_DECIMALS, decimals))
+    limbs = np.asarray(limbs, dtype='uint64')
+    # value as an unevaluated sum high + low, every limb times its power of 2 is exact. The limbs that are 0
+    # in every row, the top ones for uint112 reserves, are skipped
+    used = np.flatnonzero(limbs.any(axis=0))
+    terms = limbs.T[used].astype('float64') * _LIMB_SCALES[used, None]
+    high = np.zeros(len(limbs))
+    low = np.zeros(len(limbs))
+    for term in terms:
+        high, error = _twoSum(high, term)
+        low += error
+    high, low = _twoSum(high, low)
+    unit = 10 ** decimals
+    unit_high = float(unit)
+    unit_low = float(unit - int(unit_high))
+    # one step of long division by the double-double 10**decimals
+    quotient = high / unit_high
+    product, error = _twoProduct(quotient, unit_high)
+    remainder = (high - product) - error + low - quotient * unit_low
+    return quotient + remainder / unit_high
+
+
+def fixedPoint(limbs, decimals):
+    """
+    :param limbs: uint64 array (n, 8)
+    :param decimals: decimals of the token
+    :return: exact decimal strings of value / 10**decimals, e.g. '1.500000000000000000'
+    """
+    if len(limbs) == 0:
+        return np.empty(0, dtype=object)
+    text = np.char.lstrip(np.char.decode(_shifted(limbs, decimals), 'ascii'), '0')
+    if int(decimals) == 0:
+        # integers have no fractional part to put after the point, 0 becomes an empty string here
+        text = np.char.rstrip(text, '.')
+    return np.array([t if t[:1] not in ('.', '') else '0' + t for t in text], dtype=object)
+
+
+def parseDecimals(values):
+    """
+    Decimal strings, e.g. the BigDecimal fields of the subgraphs, to float64
+    :param values: decimal strings, missing values as nan
+    :return: float64 array, correctly rounded (see the precision contract)
+    """
+    return np.asarray(values, dtype=object).astype('float64')
@@ -0,0 +1,75 @@
+from math import sqrt
+
+import pandas as pd
+
+import instrument
+from config import DAYS_PER_YEAR
+
+SUMMARY_COLUMNS = ['nbDays', 'TVL_ETH', 'CumulRet', 'FeesRet', 'AnnRet', 'AnnVol', 'MaxDrawdown', 'Fees/Vol',
+                   'FeesAnn', 'Fees_30D_pct', 'Fees/Vol 30D', 'Pair', 'Extra Incentives APR']
+
+
+def panelFromLPs(lps):
+    """
+    Stacks the histories of LP objects already fetched
+    :param lps: list of LP after getHist
+    :return: panel indexed by (pool, date), rewards per pool
+    """
+    panel = pd.concat({lp.pool_address: lp.hist_data for lp in lps}, names=['pool', 'date'])
+    rewards = pd.Series({lp.pool_address: lp.rewards for lp in lps})
+    return panel, rewards
+
+
+@instrument.timed('stats')
+def panelStats(panel, initial_stake, rewards=None):
+    """
+    LP.getStats for every pool at once with grouped operations
+    :param panel: histories indexed by (pool, date) sorted by date within each pool, with the
+    hist_data columns totalSupply, reserve_ETH, daily_fees_ETH, WETH/Token, token0.symbol, token1.symbol
+    :param initial_stake: % of reserves owned at inception
+    :param rewards: extra incentives APR per pool, 0 when missing
+    :return: df_hist panel with the daily columns of getStats still indexed by timestamp, summary in the
+    final_lp_stats layout
+    """
+    df_hist = panel.copy()
+    pools = df_hist.index.get_level_values(0)
+    groups = df_hist.groupby(level=0, sort=False)
+    position = groups.cumcount().to_numpy()
+    from_end = groups.cumcount(ascending=False).to_numpy()
+
+    ini_nav = groups['reserve_ETH'].transform('first').astype('float64') * initial_stake
+    lp_position = initial_stake * groups['totalSupply'].transform('first').astype('float64')
+    df_hist['ownership_pct'] = lp_position / df_hist['totalSupply']
+    df_hist['Fee_lp'] = df_hist['daily_fees_ETH'] * df_hist['ownership_pct']
+    df_hist['NAV_ETH'] = df_hist['reserve_ETH'] * df_hist['ownership_pct']
+    df_hist['Cumulative_Ret'] = df_hist['NAV_ETH'] / ini_nav - 1
+    df_hist['Fee_pct_NAV'] = df_hist['Fee_lp'] / ini_nav
+    df_hist['Drawdown'] = df_hist['NAV_ETH'] / df_hist.groupby(level=0, sort=False)['NAV_ETH'].cummax() - 1
+    token = df_hist['WETH/Token']
+    df_hist['Token Ret'] = token.groupby(level=0, sort=False).shift(1) / token - 1
+
+    # compounded fees, the first day is skipped and the 30 days window keeps the last 30 rows
+    growth = 1 + df_hist['Fee_pct_NAV']
+    fees = growth.where(position > 0, 1.0).groupby(pools, sort=False).cumprod()
+    fees_30d = growth.where(from_end < 30, 1.0).groupby(pools, sort=False).cumprod()
+
+    last = df_hist[from_end == 0].droplevel(1)
+    order = pools.unique()
+    summary = pd.DataFrame(index=order)
+    summary['nbDays'] = groups.size().loc[order] - 1
+    summary['TVL_ETH'] = last['reserve_ETH']
+    summary['CumulRet'] = last['Cumulative_Ret']
+    summary['FeesRet'] = fees[from_end == 0].droplevel(1) - 1
+    summary['AnnRet'] = (1 + summary['CumulRet']) ** (DAYS_PER_YEAR / summary['nbDays']) - 1
+    summary['AnnVol'] = df_hist.groupby(level=0, sort=False)['Token Ret'].std() * sqrt(DAYS_PER_YEAR)
+    summary['MaxDrawdown'] = df_hist.groupby(level=0, sort=False)['Drawdown'].min()
+    summary['Fees/Vol'] = summary['FeesRet'] / summary['AnnVol']
+    summary['FeesAnn'] = (1 + summary['FeesRet']) ** (DAYS_PER_YEAR / summary['nbDays']) - 1
+    summary['Fees_30D_pct'] = fees_30d[from_end == 0].droplevel(1) - 1
+    summary['Fees/Vol 30D'] = summary['Fees_30D_pct'] * 12 / summary['AnnVol']
+    first = df_hist[position == 0].droplevel(1)
+    summary['Pair'] = first['token0.symbol'] + '_' + first['token1.symbol']
+    if rewards is None:
+        rewards = pd.Series(dtype='float64')
+    summary['Extra Incentives APR'] = rewards.reindex(order).fillna(0).to_numpy()
+    return df_hist, summary[SUMMARY_COLUMNS]
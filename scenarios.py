@@ -0,0 +1,140 @@
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+import instrument
+from config import SCENARIO_PATHS, SCENARIO_HORIZON_DAYS, SCENARIO_CHUNK, SCENARIO_MAX_WORKERS
+from utils import portRet
+
+# tail of the LP return distribution reported as VaR and CVaR
+TAIL = 0.05
+# paths drawn at once by the bootstrap, bounds the (paths, days) index array
+BOOTSTRAP_BLOCK = 2000
+SCENARIO_COLUMNS = ['paths', 'IL_mean', 'IL_p05', 'FeesRet_mean', 'LPRet_mean', 'LPRet_std', 'LPRet_p05',
+                    'LPRet_p50', 'LPRet_p95', 'CVaR_5', 'LPvsHold_mean', 'P(LP<Hold)']
+
+
+def poolInputs(hist_data):
+    """
+    Daily inputs of the scenarios: token return versus WETH, as 'Token Ret' in getStats, and fee yield
+    of the pool, the fees of a day over its reserves, which is the fee return of any stake
+    :param hist_data: LP.hist_data with reserve_ETH, daily_fees_ETH, WETH/Token
+    :return: token returns, fee yields, aligned on the days where both are known
+    """
+    token = hist_data['WETH/Token'].to_numpy(dtype='float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        token_ret = token[:-1] / token[1:] - 1
+        fee_yield = hist_data['daily_fees_ETH'].to_numpy(dtype='float64')[1:] / \
+            hist_data['reserve_ETH'].to_numpy(dtype='float64')[1:]
+    known = np.isfinite(token_ret) & np.isfinite(fee_yield) & (token_ret > -1)
+    return token_ret[known], fee_yield[known]
+
+
+def outcomes(token_perf, fee_growth):
+    """
+    :param token_perf: price ratio of the token versus WETH over the horizon, one per path
+    :param fee_growth: compounded fee growth over the horizon, one per path
+    :return: dict of impermanent loss, fee return, LP return and LP return over holding 50/50 per path
+    """
+    hold = 0.5 + 0.5 * token_perf
+    lp = portRet(token_perf)
+    return {'IL': lp / hold - 1, 'FeesRet': fee_growth - 1, 'LPRet': lp * fee_growth - 1,
+            'LPvsHold': lp * fee_growth / hold - 1}
+
+
+def monteCarlo(token_ret, fee_yield, horizon=SCENARIO_HORIZON_DAYS, nb_paths=SCENARIO_PATHS, rng=None):
+    """
+    Lognormal token paths with the daily volatility of the token returns and no drift in price, the fees
+    accrue at the mean daily fee yield. The LP value only depends on the last price, so the paths are
+    drawn at the horizon directly
+    :param token_ret: daily token returns versus WETH
+    :param fee_yield: daily fee yields
+    :param horizon: days held
+    :param nb_paths: paths drawn
+    :param rng: numpy Generator
+    :return: outcomes per path
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    sigma = np.log1p(token_ret).std(ddof=1) if len(token_ret) > 1 else np.nan
+    log_perf = rng.normal(-0.5 * sigma ** 2 * horizon, sigma * np.sqrt(horizon), nb_paths)
+    fee_growth = np.full(nb_paths, (1 + fee_yield.mean()) ** horizon if len(fee_yield) > 0 else np.nan)
+    return outcomes(np.exp(log_perf), fee_growth)
+
+
+def bootstrap(token_ret, fee_yield, horizon=SCENARIO_HORIZON_DAYS, nb_paths=SCENARIO_PATHS, rng=None):
+    """
+    Paths of days drawn with replacement from the history, the token return and fee yield of a day stay together
+    :param token_ret: daily token returns versus WETH
+    :param fee_yield: daily fee yields
+    :param horizon: days held
+    :param nb_paths: paths drawn
+    :param rng: numpy Generator
+    :return: outcomes per path
+    """
+    rng = np.random.default_rng() if rng is None else rng
+    if len(token_ret) == 0:
+        return outcomes(np.full(nb_paths, np.nan), np.full(nb_paths, np.nan))
+    log_ret = np.log1p(token_ret)
+    log_fees = np.log1p(fee_yield)
+    log_perf = np.empty(nb_paths)
+    log_growth = np.empty(nb_paths)
+    for start in range(0, nb_paths, BOOTSTRAP_BLOCK):
+        days = rng.integers(0, len(log_ret), (min(BOOTSTRAP_BLOCK, nb_paths - start), horizon))
+        log_perf[start:start + len(days)] = log_ret[days].sum(axis=1)
+        log_growth[start:start + len(days)] = log_fees[days].sum(axis=1)
+    return outcomes(np.exp(log_perf), np.exp(log_growth))
+
+
+def distribution(paths):
+    """
+    :param paths: outcomes per path
+    :return: dict of SCENARIO_COLUMNS
+    """
+    lp = paths['LPRet']
+    p05, p50, p95 = np.quantile(lp, [TAIL, 0.5, 1 - TAIL])
+    return {'paths': len(lp), 'IL_mean': paths['IL'].mean(), 'IL_p05': np.quantile(paths['IL'], TAIL),
+            'FeesRet_mean': paths['FeesRet'].mean(), 'LPRet_mean': lp.mean(), 'LPRet_std': lp.std(ddof=1),
+            'LPRet_p05': p05, 'LPRet_p50': p50, 'LPRet_p95': p95, 'CVaR_5': lp[lp <= p05].mean(),
+            'LPvsHold_mean': paths['LPvsHold'].mean(), 'P(LP<Hold)': (paths['LPvsHold'] < 0).mean()}
+
+
+def _chunkStats(chunk, horizon, nb_paths):
+    """
+    Scenario statistics of a list of (pool, token returns, fee yields, seed), run in a worker process
+    """
+    rows = {}
+    for pool, token_ret, fee_yield, seed in chunk:
+        rng = np.random.default_rng(seed)
+        rows[(pool, 'montecarlo')] = distribution(monteCarlo(token_ret, fee_yield, horizon, nb_paths, rng))
+        rows[(pool, 'bootstrap')] = distribution(bootstrap(token_ret, fee_yield, horizon, nb_paths, rng))
+    return rows
+
+
+@instrument.timed('scenarios')
+def scenarioStats(lps, horizon=SCENARIO_HORIZON_DAYS, nb_paths=SCENARIO_PATHS, seed=0, max_workers=None,
+                  chunk_size=SCENARIO_CHUNK):
+    """
+    Distribution of the LP return over a horizon for every pool, from Monte Carlo and bootstrap paths
+    :param lps: list of LP after getHist
+    :param horizon: days held
+    :param nb_paths: paths per pool and method
+    :param seed: the results only depend on it, not on the chunking
+    :param max_workers: processes the pools are spread on by chunks, None to run in this process
+    :param chunk_size: pools per task
+    :return: dataframe indexed by (pool, method) with SCENARIO_COLUMNS
+    """
+    seeds = np.random.SeedSequence(seed).spawn(len(lps))
+    inputs = [(lp.pool_address,) + poolInputs(lp.hist_data) + (pool_seed,) for lp, pool_seed in zip(lps, seeds)]
+    chunks = [inputs[i:i + chunk_size] for i in range(0, len(inputs), chunk_size)]
+    rows = {}
+    if max_workers is None:
+        for chunk in chunks:
+            rows.update(_chunkStats(chunk, horizon, nb_paths))
+    else:
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for chunk_rows in executor.map(_chunkStats, chunks, [horizon] * len(chunks), [nb_paths] * len(chunks)):
+                rows.update(chunk_rows)
+    stats = pd.DataFrame.from_dict(rows, orient='index', columns=SCENARIO_COLUMNS)
+    stats.index = pd.MultiIndex.from_tuples(stats.index, names=['pool', 'method'])
+    return stats
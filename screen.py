@@ -0,0 +1,218 @@
+import argparse
+import json
+import os
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+import numpy as np
+import pandas as pd
+
+from config import SCREEN_HOST, SCREEN_PORT, SCREEN_TOP_K
+
+OPERATORS = ['>=', '<=', '==', '!=', '>', '<', '=']
+FILTER = re.compile(r'^(.+?)(%s)(.+)$' % '|'.join(re.escape(o) for o in OPERATORS))
+
+
+class _Snapshot:
+    def __init__(self, stats):
+        """
+        Immutable sorted view of a summary, replaced as a whole on refresh so queries never see half of one
+        :param stats: dataframe indexed by pool address with the final_lp_stats columns and exchange
+        """
+        self.stats = stats
+        self.pools = stats.index.to_numpy()
+        self.values = {}
+        # rows by ascending and by descending value, the NaNs after them, ties in row order both ways, and the
+        # number of non NaN values
+        self.ascending = {}
+        self.descending = {}
+        self.known = {}
+        # rows of each value of the text columns
+        self.groups = {}
+        for column in stats.columns:
+            if pd.api.types.is_numeric_dtype(stats[column]):
+                values = stats[column].to_numpy(dtype='float64')
+                self.values[column] = values
+                self.ascending[column] = np.argsort(values, kind='stable')
+                self.descending[column] = np.argsort(-values, kind='stable')
+                self.known[column] = int((~np.isnan(values)).sum())
+            else:
+                codes, uniques = pd.factorize(stats[column])
+                self.groups[column] = {value: np.flatnonzero(codes == i) for i, value in enumerate(uniques)}
+
+    def order(self, column, ascending=False):
+        """
+        :return: rows sorted by the column, the NaNs last either way
+        """
+        return self.ascending[column] if ascending else self.descending[column]
+
+    def mask(self, column, operator, value):
+        """
+        :return: boolean mask of the rows verifying the condition, found by bisection in the sorted values.
+        NaN values verify no condition, != included
+        """
+        selected = np.zeros(len(self.pools), dtype=bool)
+        if column in self.groups:
+            if operator not in ('==', '!='):
+                raise ValueError('%s only supports == and !=' % column)
+            selected[self.groups[column].get(value, [])] = True
+            return ~selected if operator == '!=' else selected
+        if column not in self.values:
+            raise KeyError('unknown column %s' % column)
+        value = float(value)
+        rows = self.ascending[column][:self.known[column]]
+        values = self.values[column][rows]
+        if operator == '!=':
+            return ~self.mask(column, '==', value) & ~np.isnan(self.values[column])
+        lo, hi = 0, len(rows)
+        if operator in ('>', '>='):
+            lo = np.searchsorted(values, value, side='right' if operator == '>' else 'left')
+        elif operator in ('<', '<='):
+            hi = np.searchsorted(values, value, side='left' if operator == '<' else 'right')
+        else:
+            lo, hi = np.searchsorted(values, value, side='left'), np.searchsorted(values, value, side='right')
+        selected[rows[lo:hi]] = True
+        return selected
+
+
+def parseFilter(condition):
+    """
+    :param condition: 'column<op>value', e.g. 'TVL_ETH>100' or 'exchange==SUSHI', = is read as ==
+    :return: (column, operator, value)
+    """
+    match = FILTER.match(condition)
+    if match is None:
+        raise ValueError('cannot parse filter %r' % condition)
+    operator = '==' if match.group(2) == '=' else match.group(2)
+    return match.group(1).strip(), operator, match.group(3).strip()
+
+
+class ScreenIndex:
+    def __init__(self, stats_path='final_lp_stats.csv', universe_path='data/research_universe.csv'):
+        """
+        Pools of the last computed summary kept sorted on every numeric column, for top-k and range queries
+        without sorting the summary again. The summary file is reloaded when it changes, e.g. after a run of
+        main.py or a daemon tick
+        :param stats_path: csv saved by main.py, None to only use update
+        :param universe_path: csv saved by main.py, for the exchange of each pool
+        """
+        self.stats_path = stats_path
+        self.universe_path = universe_path
+        self.mtime = None
+        self.snapshot = _Snapshot(pd.DataFrame())
+        self.lock = threading.Lock()
+        if stats_path is not None:
+            self.refresh()
+
+    def _exchanges(self):
+        if self.universe_path is None or not os.path.exists(self.universe_path):
+            return None
+        universe = pd.read_csv(self.universe_path)
+        column = 'exchange' if 'exchange' in universe else 'Exchange'
+        return universe.groupby(universe['id'].str.split('-').str[0])[column].first()
+
+    def update(self, stats, exchanges=None):
+        """
+        Replaces the indexed summary
+        :param stats: dataframe indexed by pool address in the final_lp_stats layout
+        :param exchanges: series of pool address -> exchange, from the universe file if None
+        """
+        stats = stats.copy()
+        if 'exchange' not in stats:
+            exchanges = self._exchanges() if exchanges is None else exchanges
+            stats['exchange'] = None if exchanges is None else stats.index.map(exchanges)
+        self.snapshot = _Snapshot(stats)
+
+    def refresh(self):
+        """
+        Reloads the summary file if it was written since the last load
+        :return: True if it was reloaded
+        """
+        try:
+            mtime = os.stat(self.stats_path).st_mtime_ns
+        except (OSError, TypeError):
+            return False
+        if mtime == self.mtime:
+            return False
+        with self.lock:
+            if mtime != self.mtime:
+                self.update(pd.read_csv(self.stats_path, index_col=0))
+                self.mtime = mtime
+        return True
+
+    def query(self, where=(), order_by='Fees/Vol 30D', k=SCREEN_TOP_K, ascending=False):
+        """
+        :param where: conditions as (column, operator, value) or 'column<op>value' strings, all must hold
+        :param order_by: numeric column to rank on
+        :param k: rows returned, None for every pool matching
+        :param ascending: smallest first
+        :return: dataframe of the matching pools in order
+        """
+        self.refresh()
+        snapshot = self.snapshot
+        if len(snapshot.pools) == 0:
+            return snapshot.stats
+        selected = np.ones(len(snapshot.pools), dtype=bool)
+        for condition in where:
+            column, operator, value = parseFilter(condition) if isinstance(condition, str) else condition
+            selected &= snapshot.mask(column, operator, value)
+        if order_by not in snapshot.values:
+            raise KeyError('cannot order by %s' % order_by)
+        rows = snapshot.order(order_by, ascending)
+        rows = rows[selected[rows]][:k]
+        return snapshot.stats.iloc[rows]
+
+
+def serve(index, host=SCREEN_HOST, port=SCREEN_PORT):
+    """
+    Local http endpoint of a ScreenIndex, e.g.
+    GET /top?order_by=Fees/Vol 30D&k=10&where=TVL_ETH>100&where=exchange==SUSHI
+    answers the pools as a json list of records, add ascending=1 for the smallest first
+    :param index: ScreenIndex
+    :param host: interface to listen on
+    :param port: port to listen on, 0 picks a free one
+    :return: ThreadingHTTPServer, not started, call serve_forever
+    """
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, status, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != '/top':
+                return self._reply(404, {'message': 'unknown path %s' % url.path})
+            params = parse_qs(url.query)
+            try:
+                k = params.get('k', [str(SCREEN_TOP_K)])[0]
+                result = index.query(params.get('where', []), params.get('order_by', ['Fees/Vol 30D'])[0],
+                                     None if k == 'all' else int(k), params.get('ascending', ['0'])[0] == '1')
+            except (KeyError, ValueError) as e:
+                return self._reply(400, {'message': str(e)})
+            records = json.loads(result.rename_axis('pool').reset_index().to_json(orient='records'))
+            self._reply(200, records)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Screening endpoint over the last computed pool stats')
+    parser.add_argument('--stats', default='final_lp_stats.csv')
+    parser.add_argument('--universe', default='data/research_universe.csv')
+    parser.add_argument('--host', default=SCREEN_HOST)
+    parser.add_argument('--port', type=int, default=SCREEN_PORT)
+    args = parser.parse_args()
+    server = serve(ScreenIndex(args.stats, args.universe), args.host, args.port)
+    print('listening on http://%s:%d/top' % server.server_address)
+    server.serve_forever()
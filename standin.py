@@ -0,0 +1,764 @@
+import bisect
+import calendar
+import csv
+import hashlib
+import json
+import math
+import os
+import random
+import threading
+import time
+from math import floor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from graphql import build_ast_schema, parse, graphql
+
+import utils
+from archive_node.abi import EVENT_TOPICS
+from archive_node.batch import TOTAL_SUPPLY_SELECTOR
+
+# Subset of the uniswap-v2 and sushiswap exchange subgraph schemas used by main.py.
+# Both flavours are merged in a single schema: uni filters pairDayDatas on pairAddress,
+# sushi on pair and names its volumes volumeToken0/volumeToken1
+SCHEMA = '''
+schema { query: Query }
+scalar BigDecimal
+scalar BigInt
+scalar Bytes
+enum OrderDirection { asc desc }
+enum _SubgraphErrorPolicy_ { allow deny }
+enum PairDayData_orderBy { id date reserveUSD }
+
+type Token {
+    id: ID!
+    name: String!
+    symbol: String!
+    decimals: BigInt!
+    derivedETH: BigDecimal
+}
+
+type Pair {
+    id: ID!
+}
+
+type PairDayData {
+    id: ID!
+    date: Int!
+    pairAddress: Bytes!
+    pair: Pair!
+    token0: Token!
+    token1: Token!
+    reserve0: BigDecimal!
+    reserve1: BigDecimal!
+    totalSupply: BigDecimal
+    reserveUSD: BigDecimal!
+    dailyVolumeToken0: BigDecimal!
+    dailyVolumeToken1: BigDecimal!
+    dailyVolumeUSD: BigDecimal!
+    volumeToken0: BigDecimal!
+    volumeToken1: BigDecimal!
+    volumeUSD: BigDecimal!
+}
+
+input Token_filter {
+    id: ID
+    id_in: [ID!]
+    symbol: String
+    symbol_in: [String!]
+    symbol_not_in: [String!]
+}
+
+input PairDayData_filter {
+    id: ID
+    id_gt: ID
+    id_in: [ID!]
+    date: Int
+    date_gt: Int
+    date_gte: Int
+    date_lt: Int
+    date_lte: Int
+    pairAddress: Bytes
+    pairAddress_in: [Bytes!]
+    pair: String
+    pair_in: [String!]
+    reserveUSD_gt: BigDecimal
+    token0_: Token_filter
+    token1_: Token_filter
+}
+
+type Query {
+    pairDayDatas(
+        skip: Int
+        first: Int
+        orderBy: PairDayData_orderBy
+        orderDirection: OrderDirection
+        where: PairDayData_filter
+        subgraphError: _SubgraphErrorPolicy_
+    ): [PairDayData!]!
+}
+'''
+
+# The Graph hosted service limits
+MAX_FIRST = 1000
+MAX_SKIP = 5000
+
+WETH = {'id': '0xc02aaa39b223fe8d0a0e5c4f27ead9083c756cc2', 'name': 'Wrapped Ether', 'symbol': 'WETH',
+        'decimals': '18'}
+
+
+def _value(x):
+    """
+    Comparable value of a field: entities compare on their id, numeric strings as floats
+    """
+    if isinstance(x, dict):
+        return x['id']
+    if isinstance(x, str) and not x.startswith('0x'):
+        try:
+            return float(x)
+        except ValueError:
+            return x
+    return x
+
+
+def _match(row, where):
+    """
+    Evaluates a subgraph `where` filter on a row
+    :param row: entity as a dict
+    :param where: filter dict as sent by the client
+    :return: True if the row passes every condition
+    """
+    for key, target in where.items():
+        if key.endswith('_'):
+            if not _match(row[key[:-1]], target):
+                return False
+            continue
+        field, _, op = key.rpartition('_')
+        if op not in ('gt', 'gte', 'lt', 'lte', 'in', 'not', 'not_in'):
+            field, op = key, 'eq'
+        if field.endswith('_not'):  # x_not_in
+            field, op = field[:-4], 'not_in'
+        value = _value(row[field])
+        if op == 'in' or op == 'not_in':
+            found = value in [_value(t) for t in target]
+            if found != (op == 'in'):
+                return False
+            continue
+        target = _value(target)
+        if op == 'eq' and not value == target:
+            return False
+        if op == 'not' and value == target:
+            return False
+        if op == 'gt' and not value > target:
+            return False
+        if op == 'gte' and not value >= target:
+            return False
+        if op == 'lt' and not value < target:
+            return False
+        if op == 'lte' and not value <= target:
+            return False
+    return True
+
+
+def _dayRow(address, date, legs, eth_reserve, price, supply, eth_volume):
+    """
+    :return: pairDayDatas row of a pair with the given ETH side reserve, token price in ETH,
+    LP supply and ETH volume, in both subgraph flavours
+    """
+    token0 = dict(legs[0], derivedETH=str(1 if legs[0]['symbol'] == 'WETH' else price))
+    token1 = dict(legs[1], derivedETH=str(1 if legs[1]['symbol'] == 'WETH' else price))
+    token_reserve = eth_reserve / price
+    reserves = [eth_reserve, token_reserve] if token0['symbol'] == 'WETH' else [token_reserve, eth_reserve]
+    volumes = [eth_volume, eth_volume / price] if token0['symbol'] == 'WETH' \
+        else [eth_volume / price, eth_volume]
+    return {
+        'id': address + '-' + str(date // 86400),
+        'date': date,
+        'pairAddress': address,
+        'pair': {'id': address},
+        'token0': token0,
+        'token1': token1,
+        'reserve0': repr(reserves[0]),
+        'reserve1': repr(reserves[1]),
+        'totalSupply': repr(supply),
+        'reserveUSD': repr(eth_reserve * 2 * 1500),
+        'dailyVolumeToken0': repr(volumes[0]),
+        'dailyVolumeToken1': repr(volumes[1]),
+        'dailyVolumeUSD': repr(eth_volume * 1500),
+        'volumeToken0': repr(volumes[0]),
+        'volumeToken1': repr(volumes[1]),
+        'volumeUSD': repr(eth_volume * 1500),
+    }
+
+
+def _randomRows(address, legs, nb_days, end_ts, rng):
+    """
+    :return: nb_days rows ending at end_ts, reserves, price, supply and volume following random walks
+    """
+    eth_reserve = rng.uniform(2000, 20000)
+    price = rng.uniform(0.0001, 0.1)  # ETH per token
+    supply = rng.uniform(1e4, 1e6)
+    rows = []
+    for d in range(nb_days):
+        date = end_ts - (nb_days - 1 - d) * 86400
+        price *= 1 + rng.gauss(0, 0.05)
+        eth_reserve *= 1 + rng.gauss(0, 0.02)
+        supply *= 1 + rng.gauss(0, 0.01)
+        eth_volume = eth_reserve * rng.uniform(0.01, 0.3)
+        rows.append(_dayRow(address, date, legs, eth_reserve, price, supply, eth_volume))
+    return rows
+
+
+def syntheticPools(nb_pools=30, nb_days=800, seed=0, end_ts=None):
+    """
+    Generates pairDayDatas rows for a synthetic universe, most pools having a WETH leg
+    :param nb_pools: number of pairs
+    :param nb_days: days of history per pair, ending today
+    :param seed: random seed so runs are reproducible
+    :param end_ts: last daily timestamp, defaults to today
+    :return: dict pair address -> list of rows sorted by date
+    """
+    rng = random.Random(seed)
+    if end_ts is None:
+        end_ts = floor(utils.todayTimestamp() / 86400) * 86400
+    pools = {}
+    for i in range(nb_pools):
+        address = '0x%040x' % (0xa000 + i)
+        token = {'id': '0x%040x' % (0xb000 + i), 'name': 'Token %d' % i, 'symbol': 'TK%d' % i,
+                 'decimals': '18'}
+        if i % 7 == 6:  # no WETH leg
+            legs = [token, {'id': '0x%040x' % 0xc000, 'name': 'USD Coin', 'symbol': 'USDC', 'decimals': '6'}]
+        else:
+            legs = [dict(WETH), token] if i % 2 == 0 else [token, dict(WETH)]
+        pools[address] = _randomRows(address, legs, nb_days, end_ts, rng)
+    return pools
+
+
+def poolsFromData(path='data', nb_days=800, seed=0, end_ts=None):
+    """
+    pairDayDatas rows for the pools of the saved research universe. Pools with an archive node summary
+    in <path>/Node replay its daily reserves, supply and volume, the others get random walks.
+    Dates are shifted so every history ends at end_ts and the universe is found by Pools.search
+    :param path: data folder holding research_universe.csv and Node/<address>_summary.csv
+    :param nb_days: days of history of the pools without a node summary
+    :param seed: random seed so runs are reproducible
+    :param end_ts: last daily timestamp, defaults to today
+    :return: dict pair address -> list of rows sorted by date, exchange of each pair
+    """
+    rng = random.Random(seed)
+    if end_ts is None:
+        end_ts = floor(utils.todayTimestamp() / 86400) * 86400
+    pools = {}
+    exchanges = {}
+    with open(os.path.join(path, 'research_universe.csv')) as f:
+        universe = list(csv.DictReader(f))
+    for pool in universe:
+        address = pool['id'].split('-')[0]
+        if address in pools:
+            continue
+        legs = [{k: pool[leg + '.' + k] for k in ['id', 'name', 'symbol', 'decimals']} for leg in ['token0', 'token1']]
+        exchanges[address] = pool['Exchange']
+        summary = os.path.join(path, 'Node', address + '_summary.csv')
+        if not os.path.isfile(summary):
+            pools[address] = _randomRows(address, legs, nb_days, end_ts, rng)
+            continue
+        with open(summary) as f:
+            days = [d for d in csv.DictReader(f) if all(d[c] != '' for c in ['TVL ETH', 'Token vs WETH', 'Supply'])]
+        shift = end_ts - calendar.timegm(time.strptime(days[-1]['day'], '%Y-%m-%d'))
+        pools[address] = [_dayRow(address, calendar.timegm(time.strptime(d['day'], '%Y-%m-%d')) + shift, legs,
+                                  float(d['TVL ETH']) / 2, 1 / float(d['Token vs WETH']), int(d['Supply']) / 1e18,
+                                  float(d['ETH vol'] or 0)) for d in days]
+    return pools, exchanges
+
+
+def scalePools(pools, factor):
+    """
+    :param pools: dict pair address -> pairDayDatas rows
+    :param factor: copies of each pool
+    :return: pools and factor - 1 copies of each under new addresses
+    """
+    scaled = dict(pools)
+    for k in range(1, factor):
+        for address, rows in pools.items():
+            copy = '0x%08x' % k + address[10:]
+            scaled[copy] = [dict(r, id=copy + r['id'][len(address):], pairAddress=copy, pair={'id': copy})
+                            for r in rows]
+    return scaled
+
+
+class _StandIn:
+    def __init__(self, latency=0.0, port=0):
+        """
+        Threaded local http server answering json requests
+        :param latency: seconds slept before answering each request, to mimic network wait
+        :param port: port to listen on, 0 picks a free one
+        """
+        self.latency = latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1]
+
+    def post(self, path, request):
+        """
+        :param path: request path
+        :param request: decoded json body
+        :return: json serializable response
+        """
+        raise NotImplementedError
+
+    def get(self, path):
+        raise NotImplementedError
+
+    def _handler(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, answer):
+                headers = {}
+                try:
+                    payload, status = answer(), 200
+                except NotRecorded as e:
+                    payload, status = {'message': str(e)}, 404
+                except HttpFault as e:
+                    payload, status, headers = e.payload, e.status, e.headers
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def do_POST(self):
+                request = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+                with standin._lock:
+                    standin.requests += 1
+                time.sleep(standin.latency)
+                self._reply(lambda: standin.post(self.path, request))
+
+            def do_GET(self):
+                with standin._lock:
+                    standin.requests += 1
+                time.sleep(standin.latency)
+                self._reply(lambda: standin.get(self.path))
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+
+class GraphStandIn(_StandIn):
+    def __init__(self, pools=None, latency=0.0, port=0):
+        """
+        Local GraphQL server answering the pairDayDatas queries of main.py, including
+        schema introspection, so LP/Pools can be pointed at it instead of The Graph.
+        GET requests answer as the sushi rewards api
+        :param pools: dict pair address -> pairDayDatas rows, see syntheticPools
+        :param latency: seconds slept before answering each request, to mimic network wait
+        :param port: port to listen on, 0 picks a free one
+        """
+        super().__init__(latency, port)
+        self.pools = syntheticPools() if pools is None else pools
+        self.rows = [r for rows in self.pools.values() for r in rows]
+        self.schema = build_ast_schema(parse(SCHEMA))
+        for name in ['BigDecimal', 'BigInt', 'Bytes']:
+            scalar = self.schema.get_type(name)
+            scalar.serialize = str
+            scalar.parse_value = str
+            scalar.parse_literal = lambda ast: getattr(ast, 'value', None)
+        self.schema.get_query_type().fields['pairDayDatas'].resolver = self._pairDayDatas
+
+    def url(self, exchange='UNI'):
+        """
+        :param exchange: 'UNI' or 'SUSHI', only changes the path
+        :return: url to use in place of UNIV2_GRAPH_API/SUSHI_GRAPH_API
+        """
+        return 'http://127.0.0.1:%d/%s' % (self.port, exchange.lower())
+
+    def rewardsUrl(self):
+        """
+        :return: url to use in place of SUSHI_REWARDS_API
+        """
+        return 'http://127.0.0.1:%d/rewards/eth:' % self.port
+
+    def _pairDayDatas(self, root, info, first=100, skip=0, orderBy=None, orderDirection='asc', where=None,
+                      **kwargs):
+        if first > MAX_FIRST or skip > MAX_SKIP:
+            raise ValueError('first must be <= %d and skip <= %d' % (MAX_FIRST, MAX_SKIP))
+        where = where or {}
+        address = where.get('pairAddress', where.get('pair'))
+        rows = self.pools.get(address, []) if address is not None else self.rows
+        rows = [r for r in rows if _match(r, where)]
+        rows.sort(key=lambda r: _value(r[orderBy or 'id']), reverse=orderDirection == 'desc')
+        return rows[skip:skip + first]
+
+    def post(self, path, request):
+        result = graphql(self.schema, request['query'], variable_values=request.get('variables'))
+        payload = {'data': result.data}
+        if result.errors:
+            payload['errors'] = [{'message': str(e)} for e in result.errors]
+        return payload
+
+    def get(self, path):
+        return {'pair': {'farm': {'incentives': [{'apr': 0.05}]}}}
+
+
+# block timestamps of the stand-in node: about 13.2s per block before the merge, drifting over days and months
+# like the hash rate did, then 12s after, anchored on mainnet
+ANCHOR_BLOCK = 12000000
+ANCHOR_TIMESTAMP = 1615234816
+MERGE_BLOCK = 15537394
+
+
+def blockTimestamp(block):
+    """
+    :param block: block number
+    :return: timestamp of the block on the stand-in node, strictly increasing with irregular gaps before the merge
+    """
+    if block >= MERGE_BLOCK:
+        return blockTimestamp(MERGE_BLOCK - 1) + 12 * (block - MERGE_BLOCK + 1)
+    drift = 20000 * math.sin(block / 1e6) + 600 * math.sin(block / 6000)
+    return ANCHOR_TIMESTAMP + (block - ANCHOR_BLOCK) * 66 // 5 + int(drift) + block * 2654435761 % 5
+
+
+def _word(value):
+    return '%064x' % value
+
+
+def syntheticLogs(pools, start_block=12000000, end_block=12100000, logs_per_pool=5000, seed=0):
+    """
+    Generates raw UniV2 pair logs: an initial mint then a stream of swaps, each followed by a sync,
+    and occasional LP token mints and burns
+    :param pools: pair addresses
+    :param start_block: block of the initial mint
+    :param end_block: last block with logs
+    :param logs_per_pool: approximate number of logs per pool
+    :param seed: random seed so runs are reproducible
+    :return: list of eth_getLogs entries sorted by block and log index
+    """
+    rng = random.Random(seed)
+    zero = '0x' + _word(0)
+    logs = []
+
+    def log(address, block, topics, words):
+        logs.append({'address': address, 'blockNumber': block, 'topics': topics,
+                     'data': '0x' + ''.join(_word(w) for w in words)})
+
+    for address in pools:
+        sender = '0x' + _word(int(address, 16) + 1)
+        reserve0 = rng.randint(10 ** 24, 10 ** 26)
+        reserve1 = rng.randint(10 ** 21, 10 ** 23)
+        supply = 10 ** 22
+        log(address, start_block, [EVENT_TOPICS['Transfer'], zero, zero], [1000])
+        log(address, start_block, [EVENT_TOPICS['Transfer'], zero, sender], [supply - 1000])
+        log(address, start_block, [EVENT_TOPICS['Sync']], [reserve0, reserve1])
+        log(address, start_block, [EVENT_TOPICS['Mint'], sender], [reserve0, reserve1])
+        blocks = sorted(rng.randint(start_block + 1, end_block) for _ in range(logs_per_pool // 2))
+        for block in blocks:
+            if rng.random() < 0.05:
+                liquidity = rng.randint(1, supply // 20)
+                if rng.random() < 0.5:
+                    log(address, block, [EVENT_TOPICS['Transfer'], zero, sender], [liquidity])
+                    supply += liquidity
+                else:
+                    log(address, block, [EVENT_TOPICS['Transfer'], address[:2] + '0' * 24 + address[2:], zero],
+                        [liquidity])
+                    supply -= liquidity
+                continue
+            amount0 = rng.randint(1, reserve0 // 100)
+            amount1 = amount0 * reserve1 // reserve0
+            if rng.random() < 0.5:
+                log(address, block, [EVENT_TOPICS['Swap'], sender, sender], [amount0, 0, 0, amount1])
+                reserve0, reserve1 = reserve0 + amount0, reserve1 - amount1
+            else:
+                log(address, block, [EVENT_TOPICS['Swap'], sender, sender], [0, amount1, amount0, 0])
+                reserve0, reserve1 = reserve0 - amount0, reserve1 + amount1
+            log(address, block, [EVENT_TOPICS['Sync']], [reserve0, reserve1])
+    logs.sort(key=lambda l: l['blockNumber'])
+    log_index = {}
+    for i, l in enumerate(logs):
+        block = l['blockNumber']
+        l['logIndex'] = log_index.get(block, 0)
+        log_index[block] = l['logIndex'] + 1
+        l['blockHash'] = '0x' + _word(block)
+        l['transactionHash'] = '0x' + _word(10 ** 12 + i)
+        l['transactionIndex'] = l['logIndex']
+        l['removed'] = False
+    return logs
+
+
+class NodeStandIn(_StandIn):
+    def __init__(self, logs=None, head=None, max_results=10000, latency=0.0, port=0, rate_limit=None,
+                 rate_limit_status=429, error_rate=0.0, seed=0):
+        """
+        Local JSON-RPC node serving eth_getLogs, totalSupply eth_calls and block headers from synthetic logs,
+        with the 10000 results cap of hosted providers and optional faults
+        :param logs: raw logs, see syntheticLogs
+        :param head: latest block, defaults to the last log block
+        :param max_results: eth_getLogs answers an error above that many logs
+        :param latency: seconds slept before answering each request
+        :param port: port to listen on, 0 picks a free one
+        :param rate_limit: requests per second served, the others get a rate limit error, None for no limit
+        :param rate_limit_status: http status of the rate limit errors, 429 or 200 for a JSON-RPC error only
+        :param error_rate: share of requests answered with a 503
+        :param seed: random seed of the 503s
+        """
+        super().__init__(latency, port)
+        self.logs = syntheticLogs(['0x%040x' % 0xa000]) if logs is None else logs
+        self.blocks = [l['blockNumber'] for l in self.logs]
+        self.head = self.blocks[-1] if head is None else head
+        self.max_results = max_results
+        self.rate_limit = rate_limit
+        self.rate_limit_status = rate_limit_status
+        self.error_rate = error_rate
+        # set to True to answer every request with a 503
+        self.down = False
+        self.faults = 0
+        # headers served, see blockTimestamp
+        self.headers = 0
+        self._random = random.Random(seed)
+        self._tokens = rate_limit or 0
+        self._last = time.monotonic()
+
+    def _fault(self, request):
+        """
+        :raise HttpFault: when the request is refused by the injected faults
+        """
+        with self._lock:
+            if self.down or self._random.random() < self.error_rate:
+                self.faults += 1
+                raise HttpFault(503, {'message': 'service unavailable'})
+            if self.rate_limit is None:
+                return
+            now = time.monotonic()
+            self._tokens = min(self.rate_limit, self._tokens + (now - self._last) * self.rate_limit)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            self.faults += 1
+        error = {'code': -32005, 'message': 'daily request rate exceeded, too many requests'}
+        if isinstance(request, list):
+            payload = [{'jsonrpc': '2.0', 'id': r.get('id'), 'error': error} for r in request]
+        else:
+            payload = {'jsonrpc': '2.0', 'id': request.get('id'), 'error': error}
+        raise HttpFault(self.rate_limit_status, payload, {'Retry-After': '1'})
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d' % self.port
+
+    def _block(self, value):
+        if value in (None, 'latest', 'pending', 'safe', 'finalized'):
+            return self.head
+        if value == 'earliest':
+            return 0
+        return int(value, 16)
+
+    def getLogs(self, params):
+        address = params.get('address')
+        if isinstance(address, str):
+            address = [address]
+        address = None if address is None else set(a.lower() for a in address)
+        topics = params.get('topics') or []
+        lo = bisect.bisect_left(self.blocks, self._block(params.get('fromBlock')))
+        hi = bisect.bisect_right(self.blocks, self._block(params.get('toBlock')))
+        found = []
+        for l in self.logs[lo:hi]:
+            if address is not None and l['address'] not in address:
+                continue
+            if any(t is not None and l['topics'][i] not in (t if isinstance(t, list) else [t])
+                   for i, t in enumerate(topics)):
+                continue
+            found.append(l)
+            if len(found) > self.max_results:
+                raise JsonRpcError(-32005, 'query returned more than %d results' % self.max_results)
+        return [dict(l, blockNumber=hex(l['blockNumber']), logIndex=hex(l['logIndex']),
+                     transactionIndex=hex(l['transactionIndex'])) for l in found]
+
+    def totalSupply(self, address, block):
+        supply = 0
+        zero = '0x' + _word(0)
+        for l in self.logs[:bisect.bisect_right(self.blocks, block)]:
+            if l['address'] == address and l['topics'][0] == EVENT_TOPICS['Transfer']:
+                if l['topics'][1] == zero:
+                    supply += int(l['data'], 16)
+                elif l['topics'][2] == zero:
+                    supply -= int(l['data'], 16)
+        return supply
+
+    def call(self, method, params):
+        if method == 'eth_chainId' or method == 'net_version':
+            return '0x1' if method == 'eth_chainId' else '1'
+        if method == 'eth_blockNumber':
+            return hex(self.head)
+        if method == 'eth_getLogs':
+            return self.getLogs(params[0])
+        if method == 'eth_getBlockByNumber':
+            block = self._block(params[0])
+            if block > self.head:
+                return None
+            self.headers += 1
+            return {'number': hex(block), 'timestamp': hex(blockTimestamp(block)),
+                    'hash': '0x' + hashlib.sha256(str(block).encode()).hexdigest()}
+        if method == 'eth_call':
+            call, block = params[0], self._block(params[1])
+            if call['data'][:10] != TOTAL_SUPPLY_SELECTOR:
+                raise JsonRpcError(-32000, 'execution reverted')
+            return '0x' + _word(self.totalSupply(call['to'].lower(), block))
+        raise JsonRpcError(-32601, 'the method %s does not exist' % method)
+
+    def _answer(self, request):
+        try:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'result': self.call(request['method'],
+                                                                                 request.get('params', []))}
+        except JsonRpcError as e:
+            return {'jsonrpc': '2.0', 'id': request.get('id'), 'error': {'code': e.code, 'message': e.message}}
+
+    def post(self, path, request):
+        self._fault(request)
+        if isinstance(request, list):
+            return [self._answer(r) for r in request]
+        return self._answer(request)
+
+
+class JsonRpcError(Exception):
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+class NotRecorded(LookupError):
+    pass
+
+
+class HttpFault(Exception):
+    def __init__(self, status, payload, headers=None):
+        """
+        Error answer of a stand-in with its http status
+        """
+        super().__init__(status)
+        self.status = status
+        self.payload = payload
+        self.headers = headers or {}
+
+
+def _key(path, request):
+    """
+    Requests are matched on their path and body, JSON-RPC ids aside since web3 numbers them with a counter
+    """
+    def strip(r):
+        return {k: v for k, v in r.items() if k != 'id'} if isinstance(r, dict) and 'jsonrpc' in r else r
+    body = [strip(r) for r in request] if isinstance(request, list) else strip(request)
+    return hashlib.sha1((path + json.dumps(body, sort_keys=True)).encode()).hexdigest()
+
+
+def _localUrl(port, live_url):
+    """
+    :return: live_url with its scheme and host replaced by the local server
+    """
+    parts = urlsplit(live_url)
+    return 'http://127.0.0.1:%d%s' % (port, live_url[len(parts.scheme) + 3 + len(parts.netloc):])
+
+
+class Recorder(_StandIn):
+    def __init__(self, upstream, cassette, port=0):
+        """
+        Proxy forwarding every request to a live endpoint and appending the answers to a cassette,
+        which Replay then serves offline
+        :param upstream: scheme and host of the live endpoint, e.g. https://api.thegraph.com
+        :param cassette: json lines file, one recorded exchange per line
+        :param port: port to listen on, 0 picks a free one
+        """
+        super().__init__(0.0, port)
+        self.upstream = upstream.rstrip('/')
+        self.cassette = cassette
+
+    def url(self, live_url):
+        """
+        :param live_url: url used without the proxy, on the upstream host
+        :return: url to use in its place
+        """
+        return _localUrl(self.port, live_url)
+
+    def _record(self, path, request, response):
+        line = json.dumps({'key': _key(path, request), 'path': path, 'request': request, 'response': response})
+        with self._lock:
+            with open(self.cassette, 'a') as f:
+                f.write(line + '\n')
+        return response
+
+    def post(self, path, request):
+        response = utils.httpSession().post(self.upstream + path, json=request, timeout=120).json()
+        if isinstance(request, list) and isinstance(response, list):
+            # batch answers can come in any order, they are saved in the order of the calls
+            by_id = {a.get('id'): a for a in response}
+            response = [by_id.get(r.get('id')) for r in request]
+        return self._record(path, request, response)
+
+    def get(self, path):
+        response = utils.httpSession().get(self.upstream + path, timeout=120)
+        return self._record(path, None, response.json())
+
+
+class Replay(_StandIn):
+    def __init__(self, cassette, latency=0.0, port=0):
+        """
+        Serves the answers saved by Recorder, requests that were not recorded get a 404
+        :param cassette: json lines file written by Recorder
+        :param latency: seconds slept before answering each request
+        :param port: port to listen on, 0 picks a free one
+        """
+        super().__init__(latency, port)
+        self.answers = {}
+        with open(cassette) as f:
+            for line in f:
+                entry = json.loads(line)
+                self.answers[entry['key']] = entry['response']
+
+    def url(self, live_url):
+        """
+        :param live_url: url of the recorded endpoint
+        :return: url to use in its place
+        """
+        return _localUrl(self.port, live_url)
+
+    def post(self, path, request):
+        response = self.answers.get(_key(path, request))
+        if response is None:
+            raise NotRecorded('%s was not recorded' % path)
+        if isinstance(request, list):
+            return [dict(a, id=r.get('id')) for a, r in zip(response, request)]
+        if isinstance(request, dict) and 'jsonrpc' in request:
+            return dict(response, id=request.get('id'))
+        return response
+
+    def get(self, path):
+        response = self.answers.get(_key(path, None))
+        if response is None:
+            raise NotRecorded('%s was not recorded' % path)
+        return response
@@ -0,0 +1,215 @@
+import ast
+import os
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from config import STORE_DIR
+
+# exact uint256 as 32 bytes big-endian words, decimal256 stops at 76 digits and 2**256 - 1 has 78. The fields
+# are tagged so that read gives python ints back
+UINT_TYPE = pa.binary(32)
+UINT_METADATA = {b'uint': b'256'}
+HASH_TYPE = pa.binary(32)
+# raw on-chain amounts, stored as uint256 even when a part happens to fit in int64
+UINT_COLUMNS = ['Supply', 'reserve0', 'reserve1', 'amount0', 'amount1', 'amount0In', 'amount1In', 'amount0Out',
+                'amount1Out', 'value']
+HASH_COLUMNS = ['blockHash', 'transactionHash']
+# uint256 columns of each kind, stored as such even in a part where they are all NaN, e.g. a pool without
+# a Sync in its days, so that every part has the same schema. Hashes are found by name in every kind
+KIND_UINT_COLUMNS = {
+    'node_summary': ['Supply', 'reserve0', 'reserve1'],
+}
+PARTITIONING = ds.partitioning(pa.schema([('exchange', pa.string()), ('pool', pa.string())]), flavor='hive')
+
+
+def _toBytes(value):
+    """
+    :param value: hash as bytes, HexBytes, 0x hex string or the str() of a bytes object
+    :return: bytes
+    """
+    if isinstance(value, (bytes, bytearray)):
+        return bytes(value)
+    if value.startswith("b'") or value.startswith('b"'):
+        return ast.literal_eval(value)
+    return bytes.fromhex(value[2:] if value.startswith('0x') else value)
+
+
+def _words(series):
+    """
+    :return: uint256 array of python ints, NaN as null
+    """
+    return pa.array([None if pd.isna(v) else int(v).to_bytes(32, 'big') for v in series], type=UINT_TYPE)
+
+
+def _column(series, uint=False):
+    """
+    Compact arrow array for a column: python ints -> uint256 words, hashes -> fixed size binary,
+    numeric strings -> float64, other strings -> dictionary, numbers kept as is. Types only depend on the column content kind
+    so that every part file of a dataset shares the same schema
+    :param uint: the column is a uint256 of its kind, see KIND_UINT_COLUMNS, whatever the content of this part
+    """
+    if series.name in HASH_COLUMNS:
+        return pa.array([None if pd.isna(v) else _toBytes(v) for v in series], type=HASH_TYPE)
+    if uint or series.name in UINT_COLUMNS and pd.api.types.is_integer_dtype(series):
+        return _words(series)
+    if series.dtype != object:
+        return pa.array(series.to_numpy(), from_pandas=True)
+    values = series.dropna()
+    if len(values) > 0 and all(isinstance(v, int) for v in values):
+        return _words(series)
+    array = pa.array(series, from_pandas=True)
+    if pa.types.is_string(array.type):
+        # subgraph BigDecimal values come as numeric strings
+        try:
+            return pa.array(pd.to_numeric(series).astype('float64').to_numpy(), from_pandas=True)
+        except (ValueError, TypeError):
+            return array.dictionary_encode()
+    return array
+
+
+def _days(index):
+    """
+    :param index: unix timestamps or 'YYYY-MM-DD' days
+    :return: datetime64[D] array
+    """
+    if pd.api.types.is_integer_dtype(index):
+        return pd.to_datetime(np.asarray(index), unit='s').to_numpy(dtype='datetime64[D]')
+    return pd.to_datetime(index).to_numpy(dtype='datetime64[D]')
+
+
+def toTable(df, kind=None):
+    """
+    :param df: daily frame indexed by date
+    :param kind: dataset name, for its uint256 columns in KIND_UINT_COLUMNS
+    :return: arrow table with a 'day' date column and compact column types
+    """
+    uints = KIND_UINT_COLUMNS.get(kind, [])
+    fields = [pa.field('day', pa.date32())]
+    arrays = [pa.array(_days(df.index), type=pa.date32())]
+    for name in df.columns:
+        array = _column(df[name], str(name) in uints)
+        is_uint = array.type == UINT_TYPE and str(name) not in HASH_COLUMNS
+        fields.append(pa.field(str(name), array.type, metadata=UINT_METADATA if is_uint else None))
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=pa.schema(fields))
+
+
+def _unify(schemas):
+    """
+    Union of the fields of several schemas, numeric fields of different types are read as float64 and
+    fields without a value take the type of the others
+    """
+    fields = {}
+    for schema in schemas:
+        for field in schema:
+            known = fields.get(field.name)
+            if known is None or pa.types.is_null(known.type):
+                fields[field.name] = field
+            elif known.type == field.type or pa.types.is_null(field.type):
+                continue
+            elif all(pa.types.is_integer(t) or pa.types.is_floating(t) for t in [known.type, field.type]):
+                fields[field.name] = pa.field(field.name, pa.float64())
+            else:
+                raise TypeError('column %s is stored as %s and %s' % (field.name, known.type, field.type))
+    return pa.schema(list(fields.values()))
+
+
+class ParquetStore:
+    def __init__(self, root=STORE_DIR):
+        """
+        Parquet datasets of daily pool data, one folder per kind ('history', 'node_summary', 'stats'),
+        partitioned as exchange=<exchange>/pool=<address>/part-<first day>-<last day>.parquet
+        :param root: folder of the store
+        """
+        self.root = root
+
+    def _partition(self, kind, exchange, pool):
+        return os.path.join(self.root, kind, 'exchange=' + exchange, 'pool=' + pool.lower())
+
+    def lastDay(self, kind, exchange, pool):
+        """
+        :return: last stored day of the pool as datetime64[D], None if nothing is stored
+        """
+        path = self._partition(kind, exchange, pool)
+        if not os.path.isdir(path):
+            return None
+        parts = [n for n in os.listdir(path) if n.endswith('.parquet')]
+        if len(parts) == 0:
+            return None
+        return max(np.datetime64(n[:-8].split('-', 1)[1].split('_')[1]) for n in parts)
+
+    def append(self, kind, exchange, pool, df, overwrite=False):
+        """
+        Adds the days after the last stored one as a new part file
+        :param kind: dataset name
+        :param exchange: 'UNI' or 'SUSHI'
+        :param pool: pair address
+        :param df: daily frame indexed by unix timestamp or 'YYYY-MM-DD' day
+        :param overwrite: drop the stored days of the pool first
+        :return: number of rows written
+        """
+        path = self._partition(kind, exchange, pool)
+        if overwrite and os.path.isdir(path):
+            for name in os.listdir(path):
+                os.remove(os.path.join(path, name))
+        table = toTable(df, kind)
+        last = self.lastDay(kind, exchange, pool)
+        if last is not None:
+            table = table.filter(pa.array(table['day'].to_numpy() > last))
+        if table.num_rows == 0:
+            return 0
+        days = table['day'].to_numpy()
+        os.makedirs(path, exist_ok=True)
+        file = os.path.join(path, 'part-%s_%s.parquet' % (days.min(), days.max()))
+        pq.write_table(table, file + '.tmp')
+        os.replace(file + '.tmp', file)
+        return table.num_rows
+
+    def read(self, kind, columns=None, exchange=None, pools=None):
+        """
+        Loads a panel reading only the requested columns and partitions
+        :param kind: dataset name
+        :param columns: columns to load, None for all
+        :param exchange: only this exchange
+        :param pools: only these pair addresses
+        :return: dataframe indexed by (exchange, pool, day)
+        """
+        path = os.path.join(self.root, kind)
+        if not os.path.isdir(path):
+            return pd.DataFrame()
+        dataset = ds.dataset(path, format='parquet', partitioning=PARTITIONING)
+        # pools may not share every column or type, e.g. no WETH leg
+        schema = _unify([f.physical_schema for f in dataset.get_fragments()] + [PARTITIONING.schema])
+        dataset = ds.dataset(path, schema=schema, format='parquet', partitioning=PARTITIONING)
+        condition = None
+        if exchange is not None:
+            condition = ds.field('exchange') == exchange
+        if pools is not None:
+            in_pools = ds.field('pool').isin([p.lower() for p in pools])
+            condition = in_pools if condition is None else condition & in_pools
+        if columns is not None:
+            columns = ['exchange', 'pool', 'day'] + [c for c in columns if c not in ('exchange', 'pool', 'day')]
+        table = dataset.to_table(columns=columns, filter=condition)
+        df = table.to_pandas()
+        for field in table.schema:
+            if field.metadata == UINT_METADATA:
+                df[field.name] = df[field.name].map(lambda b: int.from_bytes(b, 'big'), na_action='ignore')
+        return df.set_index(['exchange', 'pool', 'day']).sort_index()
+
+
+def fromNodeSummaryCsv(path):
+    """
+    Parses a legacy data/Node/<addr>_summary.csv, turning the str(bytes) hashes back into bytes
+    and the uint256 text columns into python ints
+    :param path: csv file
+    :return: dataframe indexed by day, ready for ParquetStore.append
+    """
+    converters = {c: lambda v: int(v) if v != '' else np.nan for c in ['Supply', 'reserve0', 'reserve1']}
+    df = pd.read_csv(path, index_col=0, converters=converters)
+    for column in ['blockHash', 'transactionHash']:
+        df[column] = df[column].map(_toBytes, na_action='ignore')
+    return df
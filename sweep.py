@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+
+import instrument
+from config import DAYS_PER_YEAR, SWEEP_HOLDINGS, SWEEP_STAKES
+
+SWEEP_COLUMNS = ['exit', 'nbDays', 'CumulRet', 'FeesRet', 'AnnRet', 'AnnVol', 'MaxDrawdown', 'Fees/Vol', 'FeesAnn',
+                 'NAV_ETH', 'Fees_ETH']
+
+
+def _entryRows(dates, entries):
+    """
+    :param dates: timestamps of the history, sorted
+    :param entries: entry timestamps, None for every day of the history
+    :return: row of each entry, the first day on or after it, entries after the history are dropped
+    """
+    if entries is None:
+        return np.arange(len(dates))
+    rows = np.unique(np.searchsorted(dates, np.asarray(entries, dtype='int64'), side='left'))
+    return rows[rows < len(dates)]
+
+
+def sweepLP(hist_data, entries=None, holdings=SWEEP_HOLDINGS, stakes=SWEEP_STAKES):
+    """
+    LP.getStats of one history for every entry day, holding period and stake at once. An entry at row e held
+    h days ends at the last row on or before e + h days, so a window is the history getStats would see with
+    start_ts at the entry and the history cut at the exit. Windows going past the end of the history are left out.
+    The returns do not depend on the stake, which only scales NAV_ETH and Fees_ETH
+    :param hist_data: LP.hist_data indexed by timestamp, with totalSupply, reserve_ETH, daily_fees_ETH, WETH/Token
+    :param entries: entry timestamps, None for every day of the history
+    :param holdings: holding periods in days
+    :param stakes: % of reserves owned at entry
+    :return: dataframe indexed by (entry, holding, stake) with SWEEP_COLUMNS, exit and entry as timestamps
+    """
+    dates = hist_data.index.to_numpy(dtype='int64')
+    supply = hist_data['totalSupply'].to_numpy(dtype='float64')
+    reserve = hist_data['reserve_ETH'].to_numpy(dtype='float64')
+    fees = hist_data['daily_fees_ETH'].to_numpy(dtype='float64')
+    token = hist_data['WETH/Token'].to_numpy(dtype='float64')
+    rows = _entryRows(dates, entries)
+    holdings = np.asarray(holdings, dtype='int64')
+    stakes = np.asarray(stakes, dtype='float64')
+
+    # (entry, holding) grid of exit rows, the exit day must be in the history
+    targets = dates[rows, None] + holdings[None, :] * 86400
+    exits = np.searchsorted(dates, targets, side='right') - 1
+    valid = (targets <= dates[-1]) & (exits > rows[:, None])
+    columns = np.arange(len(dates))
+    after = columns[None, :] > rows[:, None]
+
+    # NAV per LP token, the NAV of a stake is stake * reserve_e * value_t / value_e
+    value = reserve / supply
+    growth = value[None, :] / value[rows, None]
+    cumul_ret = np.take_along_axis(growth, exits, axis=1) - 1
+
+    # fees compounded from the day after the entry, as a % of the NAV at entry
+    fee_pct = (fees / supply)[None, :] / value[rows, None]
+    log_fees = np.where(after, np.log1p(fee_pct), 0.0).cumsum(axis=1)
+    fees_ret = np.expm1(np.take_along_axis(log_fees, exits, axis=1))
+
+    # drawdown from the running max of the NAV since the entry
+    since_entry = columns[None, :] >= rows[:, None]
+    running_max = np.maximum.accumulate(np.where(since_entry, growth, -np.inf), axis=1)
+    drawdown = np.minimum.accumulate(np.where(since_entry, growth / running_max - 1, np.inf), axis=1)
+    max_drawdown = np.take_along_axis(drawdown, exits, axis=1)
+
+    # sample std of the daily token returns in (entry, exit] from prefix sums, centered to limit cancellation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        token_ret = np.concatenate([[np.nan], token[:-1] / token[1:] - 1])
+    known = np.isfinite(token_ret)
+    centered = np.where(known, token_ret - (token_ret[known].mean() if known.any() else 0.0), 0.0)
+    count = np.concatenate([[0], np.cumsum(known)])
+    total = np.concatenate([[0.0], np.cumsum(centered)])
+    squares = np.concatenate([[0.0], np.cumsum(centered ** 2)])
+    start = rows[:, None] + 1
+    n = count[exits + 1] - count[start]
+    mean = (total[exits + 1] - total[start]) / np.maximum(n, 1)
+    variance = (squares[exits + 1] - squares[start] - n * mean ** 2) / (n - 1).clip(min=1)
+    ann_vol = np.where(n > 1, np.sqrt(np.maximum(variance, 0)), np.nan) * np.sqrt(DAYS_PER_YEAR)
+
+    nb_days = (exits - rows[:, None]).astype('float64')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grid = {
+            'exit': dates[exits],
+            'nbDays': nb_days,
+            'CumulRet': cumul_ret,
+            'FeesRet': fees_ret,
+            'AnnRet': (1 + cumul_ret) ** (DAYS_PER_YEAR / nb_days) - 1,
+            'AnnVol': ann_vol,
+            'MaxDrawdown': max_drawdown,
+            'Fees/Vol': fees_ret / ann_vol,
+            'FeesAnn': (1 + fees_ret) ** (DAYS_PER_YEAR / nb_days) - 1,
+        }
+    entry_nav = reserve[rows, None, None] * stakes[None, None, :]
+    cube = {name: np.broadcast_to(values[:, :, None], valid.shape + (len(stakes),)) for name, values in grid.items()}
+    cube['NAV_ETH'] = entry_nav * (1 + cumul_ret[:, :, None])
+    cube['Fees_ETH'] = entry_nav * fees_ret[:, :, None]
+    keep = np.broadcast_to(valid[:, :, None], valid.shape + (len(stakes),)).ravel()
+    index = pd.MultiIndex.from_product([dates[rows], holdings, stakes], names=['entry', 'holding', 'stake'])
+    result = pd.DataFrame({name: values.ravel() for name, values in cube.items()}, index=index)[SWEEP_COLUMNS]
+    return result[keep].astype({'nbDays': 'int64'})
+
+
+@instrument.timed('sweep')
+def sweep(lps, entries=None, holdings=SWEEP_HOLDINGS, stakes=SWEEP_STAKES):
+    """
+    sweepLP of several pools reusing their fetched histories
+    :param lps: list of LP after getHist
+    :return: dataframe indexed by (pool, entry, holding, stake), see sweepLP
+    """
+    return pd.concat({lp.pool_address: sweepLP(lp.hist_data, entries, holdings, stakes) for lp in lps},
+                     names=['pool'])
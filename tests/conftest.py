@@ -0,0 +1,37 @@
+import os
+import shutil
+
+import pandas as pd
+import pytest
+
+import utils
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Empty working folder with a copy of the block map, so the caches, checkpoints and store of a test
+    start empty and stay out of the repository
+    """
+    os.makedirs(tmp_path / 'data')
+    shutil.copy(os.path.join(REPO, 'data', 'block_date_map.csv'), tmp_path / 'data')
+    monkeypatch.chdir(tmp_path)
+    # the block map index is cached per path, which is relative
+    utils.blockDateIndex.cache_clear()
+    yield tmp_path
+    utils.blockDateIndex.cache_clear()
+
+
+@pytest.fixture
+def universe(workdir):
+    """
+    WETH pairs of the saved research universe, written in the working folder
+    :return: pair addresses
+    """
+    pools = pd.read_csv(os.path.join(REPO, 'data', 'research_universe.csv'), index_col=0)
+    pools = pools[(pools['token0.symbol'] == 'WETH') | (pools['token1.symbol'] == 'WETH')]
+    addresses = list(pools['id'].str.split('-').str[0].unique())[:4]
+    pools[pools['id'].str.split('-').str[0].isin(addresses)].to_csv('data/research_universe.csv')
+    return addresses
@@ -0,0 +1,38 @@
+from unittest import mock
+
+from archive_node.batch import batchCall, totalSupplies
+from standin import NodeStandIn, syntheticLogs
+
+ADDRESS = '0x%040x' % 0xa000
+
+
+class RefusingNode(NodeStandIn):
+    """
+    Answers the first batch with a single JSON-RPC error object, and '0x' to the calls before the deployment
+    """
+    refused = 0
+
+    def post(self, path, request):
+        if isinstance(request, list) and self.refused == 0:
+            self.refused += 1
+            return {'jsonrpc': '2.0', 'id': None, 'error': {'code': -32600, 'message': 'batch too large'}}
+        return super().post(path, request)
+
+    def call(self, method, params):
+        if method == 'eth_call' and self._block(params[1]) < self.blocks[0]:
+            return '0x'
+        return super().call(method, params)
+
+
+def test_batch_refused_as_a_whole_is_retried():
+    with RefusingNode(syntheticLogs([ADDRESS], logs_per_pool=10)) as node, mock.patch('time.sleep'):
+        results = batchCall(node.url, [('eth_blockNumber', [])] * 3)
+    assert node.refused == 1
+    assert results == [hex(node.head)] * 3
+
+
+def test_supply_before_deployment():
+    with RefusingNode(syntheticLogs([ADDRESS], logs_per_pool=10)) as node, mock.patch('time.sleep'):
+        first = node.blocks[0]
+        supply = totalSupplies(node.url, ADDRESS, [first - 1, first])
+    assert supply['Supply'].tolist() == [0, 10 ** 22]
@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from archive_node.blockmap import HeaderCache, buildBlockMap, dayTimestamps
+from archive_node.node import provider
+from config import REORG_DEPTH
+from standin import NodeStandIn, blockTimestamp
+
+HEAD = 12100000
+
+
+def lastBlockBefore(timestamp):
+    """
+    :return: last block of the stand-in chain mined strictly before the timestamp, by bisection on the blocks
+    """
+    lo, hi = 0, HEAD
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        lo, hi = (mid, hi) if blockTimestamp(mid) < timestamp else (lo, mid)
+    return lo
+
+
+def assertTrueMap(path, first_day, last_day):
+    saved = pd.read_csv(path, index_col=0, sep='\t')
+    days = np.arange(np.datetime64(first_day), np.datetime64(last_day) + np.timedelta64(1, 'D'))
+    assert list(saved.index) == list(np.datetime_as_string(days))
+    assert saved['Block'].tolist() == [lastBlockBefore(t) for t in dayTimestamps(days)]
+
+
+def test_build_extend_and_fill(workdir):
+    with NodeStandIn(head=HEAD) as node:
+        w3 = provider(node.url)
+        cache = HeaderCache('headers.csv')
+        assert buildBlockMap('2021-03-10', '2021-03-15', node=w3, path='map.csv', cache=cache) == 6
+        assertTrueMap('map.csv', '2021-03-10', '2021-03-15')
+        # backward extension, and a later day with the days in between
+        assert buildBlockMap('2021-03-05', '2021-03-17', node=w3, path='map.csv', cache=cache) == 7
+        assertTrueMap('map.csv', '2021-03-05', '2021-03-17')
+        # rows lost from the map are searched again, from a cold header cache
+        saved = pd.read_csv('map.csv', index_col=0, sep='\t')
+        saved.drop(['2021-03-08', '2021-03-12']).to_csv('map.csv', sep='\t')
+        headers = node.headers
+        assert buildBlockMap(node=w3, path='map.csv', cache=HeaderCache(None), end_day='2021-03-17') == 2
+        assert node.headers > headers
+        assertTrueMap('map.csv', '2021-03-05', '2021-03-17')
+        # up to the last midnight out of reach of reorgs by default
+        buildBlockMap(node=w3, path='map.csv', cache=cache)
+        safe_day = np.datetime64(blockTimestamp(HEAD - REORG_DEPTH) // 86400, 'D')
+        assertTrueMap('map.csv', '2021-03-05', safe_day)
+
+
+def test_header_cache_keeps_the_reorg_window_in_memory(workdir):
+    with NodeStandIn(head=HEAD) as node:
+        w3 = provider(node.url)
+        cache = HeaderCache('headers.csv')
+        buildBlockMap('2021-03-10', '2021-03-11', node=w3, path='map.csv', cache=cache)
+        cache.fetch(range(HEAD - 2 * REORG_DEPTH, HEAD + 1), w3)
+        cache.save(HEAD)
+        saved = pd.read_csv('headers.csv', sep='\t')
+        assert HEAD in cache.times
+        assert saved['Block'].max() == HEAD - REORG_DEPTH
+        assert (saved['Timestamp'] == [blockTimestamp(b) for b in saved['Block']]).all()
+        # a warm cache only reads the head, which was not saved
+        headers = node.headers
+        assert buildBlockMap('2021-03-10', '2021-03-11', node=w3, path='other.csv',
+                             cache=HeaderCache('headers.csv')) == 2
+        assert node.headers == headers + 1
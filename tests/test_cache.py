@@ -0,0 +1,128 @@
+import os
+import time
+
+import pytest
+
+import utils
+from cache import HistoryCache, RewardsCache
+from main import LP, fetchHistoriesBatched
+from standin import GraphStandIn, syntheticPools
+
+TODAY = 1700006400
+
+
+class RecordingGraph(GraphStandIn):
+    """
+    Keeps the filters of the pairDayDatas queries it answered
+    """
+    def __init__(self, pools):
+        self.filters = []
+        super().__init__(pools)
+
+    def _pairDayDatas(self, root, info, **kwargs):
+        self.filters.append(kwargs.get('where'))
+        return super()._pairDayDatas(root, info, **kwargs)
+
+    def serve(self, pools):
+        self.pools = pools
+        self.rows = [r for rows in pools.values() for r in rows]
+
+
+@pytest.fixture
+def today(monkeypatch):
+    """
+    Frozen clock in the middle of TODAY, moved with today.set
+    """
+    class Clock:
+        def set(self, ts):
+            monkeypatch.setattr(utils, 'todayTimestamp', lambda: ts + 43200)
+    clock = Clock()
+    clock.set(TODAY)
+    return clock
+
+
+def lp(graph, address, cache):
+    return LP(exchange='UNI', pool_address=address, initial_stake=0.01, fees=0.003, start_ts=0,
+              graph_api=graph.url('UNI'), cache=cache)
+
+
+def test_current_day_is_not_cached_and_refresh_pages_after_the_cache(workdir, today):
+    # more days than a page of the subgraph, the day after TODAY is not mined yet
+    pools = syntheticPools(nb_pools=1, nb_days=1200, end_ts=TODAY + 86400)
+    address = list(pools)[0]
+    cache = HistoryCache('cache')
+    # TODAY is still moving, its row is not the final one
+    moving = pools[address][:-2] + [dict(pools[address][-2], reserve0='1.0')]
+    with RecordingGraph({address: moving}) as graph:
+        hist = lp(graph, address, cache).getHist()
+        assert hist.index[-1] == TODAY
+        cached = cache.get(graph.url('UNI'), address, 0)
+        assert [r['date'] for r in cached] == [r['date'] for r in pools[address][:-2]]
+        # the next day: TODAY closed and its row changed since, the new current day is out
+        today.set(TODAY + 86400)
+        graph.serve(pools)
+        graph.filters.clear()
+        hist = lp(graph, address, cache).getHist()
+        assert [f['date_gt'] for f in graph.filters] == [TODAY - 86400]
+        assert list(hist.index) == [r['date'] for r in pools[address]]
+        cached = cache.get(graph.url('UNI'), address, 0)
+        assert [r['date'] for r in cached] == [r['date'] for r in pools[address][:-1]]
+        assert cached[-1]['reserve0'] == pools[address][-2]['reserve0']
+
+
+def test_batched_fetch_shares_the_cache(workdir, today):
+    pools = syntheticPools(nb_pools=3, nb_days=50, end_ts=TODAY)
+    cache = HistoryCache('cache')
+    with RecordingGraph(pools) as graph:
+        fetchHistoriesBatched([lp(graph, a, cache) for a in pools])
+        graph.filters.clear()
+        lps = [lp(graph, a, cache) for a in pools]
+        fetchHistoriesBatched(lps)
+    # only the current day is asked again
+    assert sorted(f['date_gt'] for f in graph.filters) == [TODAY - 86400] * 3
+    for pool in lps:
+        assert list(pool.hist_data.index) == [r['date'] for r in pools[pool.pool_address]]
+        assert len(cache.get(graph.url('UNI'), pool.pool_address, 0)) == 49
+
+
+def test_eviction(tmp_path, today):
+    rows = syntheticPools(nb_pools=1, nb_days=20, end_ts=TODAY - 86400)
+    rows = list(rows.values())[0]
+    cache = HistoryCache(str(tmp_path), max_age_days=30)
+    cache.put('http://a', '0x1', 0, rows)
+    old = cache._file('http://a', '0x1', 0)
+    os.utime(old, (time.time() - 31 * 86400,) * 2)
+    cache.put('http://a', '0x2', 0, rows)
+    assert cache.get('http://a', '0x1', 0) is None
+    assert cache.get('http://a', '0x2', 0) == rows
+    # room for two entries, the least recently refreshed goes first
+    size = os.path.getsize(cache._file('http://a', '0x2', 0))
+    cache = HistoryCache(str(tmp_path), max_bytes=2 * size + size // 2)
+    os.utime(cache._file('http://a', '0x2', 0), (time.time() - 60,) * 2)
+    cache.put('http://a', '0x3', 0, rows)
+    cache.put('http://a', '0x4', 0, rows)
+    assert cache.get('http://a', '0x2', 0) is None
+    assert cache.get('http://a', '0x3', 0) == rows and cache.get('http://a', '0x4', 0) == rows
+
+
+def test_rewards_fetched_again_after_the_ttl(workdir, monkeypatch):
+    pools = syntheticPools(nb_pools=2, nb_days=5)
+    now = [1700000000.0]
+    monkeypatch.setattr(time, 'time', lambda: now[0])
+    with GraphStandIn(pools) as graph:
+        cache = RewardsCache('data/rewards.json', ttl=3600)
+        lps = [LP(exchange='SUSHI', pool_address=a, initial_stake=0.01, fees=0.003, start_ts=0,
+                  graph_api=graph.url('SUSHI'), rewards_api=graph.rewardsUrl(), rewards_cache=cache) for a in pools]
+        for pool in lps:
+            pool.getRewards()
+        assert graph.requests == 2 and [pool.rewards for pool in lps] == [0.05, 0.05]
+        # a warm rerun, from the file, within the ttl
+        cache = RewardsCache('data/rewards.json', ttl=3600)
+        now[0] += 3000
+        for pool in lps:
+            pool.rewards_cache = cache
+            pool.getRewards()
+        assert graph.requests == 2
+        now[0] += 1000
+        lps[0].getRewards()
+        assert graph.requests == 3 and lps[0].rewards == 0.05
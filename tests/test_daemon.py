@@ -0,0 +1,69 @@
+import os
+import shutil
+
+import pandas as pd
+
+from archive_node.abi import UNIV2_PAIR_ABI, EVENT_TOPICS
+from archive_node.node import provider
+from daemon import Daemon
+from main_archive_node import runUniverse
+from standin import NodeStandIn, syntheticLogs
+from store import ParquetStore
+
+
+def reorganize(logs, from_block):
+    """
+    Logs of a chain where the blocks from from_block were mined again: other block hashes, the Swap and
+    Sync amounts doubled and the first Swap of the range gone
+    """
+    reorganized = []
+    dropped = False
+    for l in logs:
+        if l['blockNumber'] < from_block or l['topics'][0] not in (EVENT_TOPICS['Swap'], EVENT_TOPICS['Sync']):
+            reorganized.append(l)
+            continue
+        if not dropped and l['topics'][0] == EVENT_TOPICS['Swap']:
+            dropped = True
+            continue
+        words = [int(l['data'][2 + i:66 + i], 16) * 2 for i in range(0, len(l['data']) - 2, 64)]
+        reorganized.append(dict(l, blockHash='0x%064x' % (l['blockNumber'] + 1),
+                                data='0x' + ''.join('%064x' % w for w in words)))
+    return reorganized
+
+
+def test_reorg_rescanned(universe, workdir):
+    logs = syntheticLogs(universe, logs_per_pool=1500)
+    head = 12060000
+    with NodeStandIn(logs, head=head) as node:
+        w3 = provider(node.url)
+        daemon = Daemon(node=w3, pool_abi=UNIV2_PAIR_ABI, graph=False, reorg_depth=64)
+        first = daemon.tickNode()
+        assert sum(first.values()) > 0
+        # the blocks near the head of the first tick are mined again, then the chain moves on
+        logs = reorganize(logs, head - 40)
+        node.logs, node.blocks = logs, [l['blockNumber'] for l in logs]
+        node.head = logs[-1]['blockNumber']
+        second = daemon.tickNode()
+        assert sum(second.values()) > 0
+        stored = ParquetStore().read('node_summary')
+        closed = daemon._closedDays(node.head)
+
+        os.makedirs('reference/data')
+        shutil.copy('data/block_date_map.csv', 'reference/data')
+        shutil.copy('data/research_universe.csv', 'reference/data')
+        os.chdir('reference')
+        runUniverse(node=w3, pool_abi=UNIV2_PAIR_ABI)
+        expected = ParquetStore().read('node_summary')
+    assert stored.index.is_unique
+    expected = expected[expected.index.get_level_values('day') < closed]
+    pd.testing.assert_frame_equal(stored, expected)
+
+
+def test_failed_ticks_logged_and_backed_off(universe, workdir, caplog, monkeypatch):
+    daemon = Daemon(graph=False, poll_seconds=0)
+    monkeypatch.setattr(daemon, 'tick', lambda now=None: {}['missing'])
+    daemon.run(max_ticks=3)
+    assert daemon.failures == 3
+    assert len([r for r in caplog.records if r.exc_info is not None]) == 3
+    daemon.poll_seconds = 60
+    assert daemon.delay() == 480
@@ -0,0 +1,29 @@
+import os
+
+import pandas as pd
+
+import main
+from standin import GraphStandIn, syntheticPools
+
+
+def runIn(folder, uni, sushi, **kwargs):
+    """
+    main.run with its own data folder, so that no cache is shared between runs
+    """
+    os.makedirs(os.path.join(folder, 'data'))
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        return main.run(start_ts=0, charts=False, uni_api=uni.url('UNI'), sushi_api=sushi.url('SUSHI'),
+                        rewards_api=sushi.rewardsUrl(), **kwargs)
+    finally:
+        os.chdir(cwd)
+
+
+def test_batched_and_unbatched_runs_agree(workdir):
+    pools = syntheticPools(nb_pools=8, nb_days=120)
+    with GraphStandIn(pools) as uni, GraphStandIn(pools) as sushi:
+        batched = runIn('batched', uni, sushi)
+        unbatched = runIn('unbatched', uni, sushi, batched=False)
+    assert len(batched) > 0
+    pd.testing.assert_frame_equal(batched.sort_index(), unbatched.sort_index())
@@ -0,0 +1,65 @@
+import json
+import os
+
+import pytest
+
+from archive_node import abi
+from archive_node.abi import UNIV2_PAIR_ABI, getABI
+from archive_node.node import provider, supplyFromEvents
+from standin import GraphStandIn, NodeStandIn, syntheticLogs
+
+ADDRESS = '0x%040x' % 0xa000
+
+
+class InflatedNode(NodeStandIn):
+    """
+    Answers totalSupply one unit above the mints and burns
+    """
+    def totalSupply(self, address, block):
+        return super().totalSupply(address, block) + 1
+
+
+def test_supply_from_events_matches_archive():
+    with NodeStandIn(syntheticLogs([ADDRESS], logs_per_pool=200)) as node:
+        w3 = provider(node.url)
+        blocks = node.blocks[::20]
+        sup = supplyFromEvents(ADDRESS, blocks, UNIV2_PAIR_ABI, start_block=blocks[0] - 1, spot_checks=len(blocks),
+                               node=w3, seed=0)
+    assert sup['Supply'].tolist() == [node.totalSupply(ADDRESS, b) for b in blocks]
+
+
+def test_spot_checks_replayed_from_seed():
+    with InflatedNode(syntheticLogs([ADDRESS], logs_per_pool=200)) as node:
+        w3 = provider(node.url)
+        blocks = node.blocks[::10]
+        messages = []
+        for _ in range(2):
+            with pytest.raises(ValueError) as error:
+                supplyFromEvents(ADDRESS, blocks, UNIV2_PAIR_ABI, start_block=blocks[0] - 1, node=w3, seed=7)
+            messages.append(str(error.value))
+    assert messages[0] == messages[1]
+    assert 'spot checked blocks' in messages[0]
+
+
+class EtherscanStandIn(GraphStandIn):
+    """
+    Answers the etherscan getabi calls, with a verified source for ADDRESS only
+    """
+    def get(self, path):
+        if ADDRESS[2:] in path:
+            return {'status': '1', 'result': json.dumps(UNIV2_PAIR_ABI)}
+        return {'status': '0', 'result': 'Contract source code not verified'}
+
+
+def test_abi_registry(workdir, monkeypatch):
+    with EtherscanStandIn({}) as etherscan:
+        monkeypatch.setattr(abi, 'ETHERSCAN_ABI_URL', 'http://127.0.0.1:%d/api?address=' % etherscan.port)
+        assert getABI(ADDRESS, path='abi') == UNIV2_PAIR_ABI
+        assert getABI(ADDRESS.upper().replace('0X', '0x'), path='abi') == UNIV2_PAIR_ABI
+        assert etherscan.requests == 1
+        # unverified contracts get the default and are asked again next time
+        other = '0x%040x' % 0xb000
+        assert getABI(other, path='abi', default=[]) == []
+        assert getABI(other, path='abi', default=[]) == []
+        assert etherscan.requests == 3
+        assert os.listdir('abi') == [ADDRESS + '.json']
@@ -0,0 +1,23 @@
+import numpy as np
+
+from numeric import fixedPoint, limbsFromInts, scaleUnits
+
+VALUES = [0, 5, 10 ** 18, 15 * 10 ** 17, 2 ** 112 - 1, 2 ** 256 - 1]
+
+
+def test_fixed_point_is_exact():
+    for decimals in (0, 1, 6, 18):
+        text = fixedPoint(limbsFromInts(VALUES), decimals)
+        expected = [str(v) if decimals == 0 else '%d.%0*d' % (v // 10 ** decimals, decimals, v % 10 ** decimals)
+                    for v in VALUES]
+        assert list(text) == expected
+
+
+def test_fixed_point_without_decimals():
+    assert list(fixedPoint(limbsFromInts([0, 5, 1000]), 0)) == ['0', '5', '1000']
+    assert list(fixedPoint(limbsFromInts([0, 5]), 2)) == ['0.00', '0.05']
+
+
+def test_scale_units_matches_int_division():
+    values = VALUES + [int(v) for v in np.random.default_rng(0).integers(0, 2 ** 62, 1000)]
+    assert (scaleUnits(limbsFromInts(values), 18) == np.array([v / 10 ** 18 for v in values])).all()
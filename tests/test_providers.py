@@ -0,0 +1,70 @@
+from unittest import mock
+
+import pandas as pd
+import pytest
+import web3
+
+from archive_node.node import provider, getUniverseEvents, supply
+from archive_node.providers import Endpoint, NoProviderAvailable, PooledProvider, ProviderPool, isRateLimited
+from archive_node.scanner import isTooManyResults
+from standin import NodeStandIn, syntheticLogs
+
+ADDRESSES = ['0x%040x' % (0xa000 + i) for i in range(4)]
+
+
+def test_rate_limits_are_not_too_many_results():
+    assert isRateLimited({'code': -32005, 'message': 'daily request rate exceeded'})
+    assert not isRateLimited({'code': -32005, 'message': 'query returned more than 10000 results'})
+    assert not isTooManyResults('daily request rate exceeded, too many requests')
+
+
+def test_failover_returns_the_same_logs():
+    logs = syntheticLogs(ADDRESSES, logs_per_pool=1500)
+    blocks = [logs[-1]['blockNumber'] - 10, logs[-1]['blockNumber']]
+    with NodeStandIn(logs, max_results=1500) as clean:
+        w3 = provider(clean.url)
+        expected = getUniverseEvents(ADDRESSES, start_block=0, node=w3, checkpoint=False)
+        expected_supply = supply(ADDRESSES[0], blocks, node=w3)
+    # rate of each provider right after it was throttled, it climbs back to the plan rate once the errors stop
+    slowed = []
+    throttle = Endpoint.throttled
+
+    def throttled_rate(endpoint, retry_after=None):
+        throttle(endpoint, retry_after)
+        slowed.append((endpoint.name, endpoint.limiter.rate))
+
+    with mock.patch.object(Endpoint, 'throttled', throttled_rate), \
+            NodeStandIn(logs, max_results=1500, rate_limit=15) as throttled, \
+            NodeStandIn(logs, max_results=1500, rate_limit=10, rate_limit_status=200) as erroring, \
+            NodeStandIn(logs, max_results=1500, error_rate=0.3) as flaky, \
+            NodeStandIn(logs, max_results=1500) as down:
+        down.down = True
+        pool = ProviderPool([throttled.url, erroring.url, flaky.url, down.url],
+                            rates={throttled.url: 100, erroring.url: 100, flaky.url: 50, down.url: 50})
+        w3 = web3.Web3(PooledProvider(pool))
+        got = getUniverseEvents(ADDRESSES, start_block=0, node=w3, checkpoint=False)
+        got_supply = supply(ADDRESSES[0], blocks, node=w3, batch_size=1)
+        health = pool.health()
+    for key in expected:
+        pd.testing.assert_frame_equal(got[key], expected[key])
+    pd.testing.assert_frame_equal(got_supply, expected_supply)
+    throttled_name, erroring_name, flaky_name, down_name = health.index
+    # rate limited providers were slowed down under their plan rate, by 429s or by JSON-RPC errors
+    assert throttled.faults > 0 and health.loc[throttled_name, 'rate_limited'] > 0
+    assert erroring.faults > 0 and health.loc[erroring_name, 'rate_limited'] > 0
+    assert any(name == throttled_name and rate < health.loc[throttled_name, 'max_rate'] for name, rate in slowed)
+    # 503s are errors, not rate limits
+    assert flaky.faults > 0 and health.loc[flaky_name, 'errors'] == flaky.faults
+    assert health.loc[flaky_name, 'rate_limited'] == 0
+    # the provider down only failed, and its growing cooldown kept it out of most requests
+    assert health.loc[down_name, 'errors'] == health.loc[down_name, 'requests'] > 0
+    assert health.loc[down_name, 'requests'] < health['requests'].sum() / 10
+
+
+def test_no_provider_available():
+    with NodeStandIn(syntheticLogs(ADDRESSES[:1], logs_per_pool=10)) as down:
+        down.down = True
+        pool = ProviderPool([down.url])
+        with pytest.raises(NoProviderAvailable):
+            pool.post(b'{"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []}', attempts=2)
+        assert pool.health().iloc[0]['errors'] == 2
@@ -0,0 +1,70 @@
+import os
+
+import pandas as pd
+
+import instrument
+from archive_node.abi import UNIV2_PAIR_ABI
+from archive_node.node import provider, getEvents
+from archive_node.scanner import Checkpoint, LogScanner, TooManyResults
+from standin import NodeStandIn, syntheticLogs
+
+ADDRESS = '0x%040x' % 0xa000
+
+
+def test_pending_fills_gaps():
+    checkpoint = Checkpoint()
+    for lo, hi in [(0, 99), (300, 399), (450, 500)]:
+        checkpoint.save(lo, hi, pd.DataFrame())
+    scanner = LogScanner(lambda lo, hi: pd.DataFrame(), chunk_size=100, checkpoint=checkpoint)
+    assert scanner.pending(0, 600) == [(100, 199), (200, 299), (400, 449), (501, 600)]
+    assert scanner.pending(50, 420) == [(100, 199), (200, 299), (400, 420)]
+    assert scanner.pending(0, 99) == []
+
+
+def test_bisects_ranges_with_too_many_results():
+    calls = []
+
+    def fetch(lo, hi):
+        calls.append((lo, hi))
+        if hi - lo + 1 > 10:
+            raise TooManyResults('too many results')
+        return pd.DataFrame({'blockNumber': range(lo, hi + 1), 'logIndex': 0})
+
+    instrument.reset()
+    scanner = LogScanner(fetch, chunk_size=40, max_workers=2, name='fake')
+    logs = scanner.scan(0, 79)
+    assert logs['blockNumber'].tolist() == list(range(80))
+    assert all(hi - lo + 1 <= 10 for lo, hi in scanner.checkpoint.ranges())
+    # 2 chunks of 40, halved twice: 2 + 4 + 8 calls
+    assert len(calls) == 14
+    assert instrument.report()['endpoints']['fake']['splits'] == 6
+
+
+def test_resume_from_checkpoint(workdir):
+    logs = syntheticLogs([ADDRESS], logs_per_pool=3000)
+    start = logs[0]['blockNumber']
+    with NodeStandIn(logs) as reference:
+        expected = getEvents(ADDRESS, UNIV2_PAIR_ABI, 'Swap', start_block=start, node=provider(reference.url),
+                             checkpoint=False)
+    with NodeStandIn(logs, max_results=300) as node:
+        w3 = provider(node.url)
+        scanned = getEvents(ADDRESS, UNIV2_PAIR_ABI, 'Swap', start_block=start, node=w3)
+        first_requests = node.requests
+        pd.testing.assert_frame_equal(scanned, expected)
+        # eth_blockNumber then more than one eth_getLogs per chunk, the chunks were split
+        assert first_requests > 3
+
+        # everything is in the checkpoint, only the head is read
+        rerun = getEvents(ADDRESS, UNIV2_PAIR_ABI, 'Swap', start_block=start, node=w3)
+        assert node.requests - first_requests == 1
+        pd.testing.assert_frame_equal(rerun, expected)
+
+        # a lost range is scanned again, alone
+        folder = os.path.join('data', 'scan', ADDRESS + '_Swap')
+        files = sorted(os.listdir(folder), key=lambda n: int(n.split('_')[0]))
+        os.remove(os.path.join(folder, files[len(files) // 2]))
+        before = node.requests
+        refilled = getEvents(ADDRESS, UNIV2_PAIR_ABI, 'Swap', start_block=start, node=w3)
+        assert 1 < node.requests - before < first_requests
+        assert len(os.listdir(folder)) == len(files)
+        pd.testing.assert_frame_equal(refilled, expected)
@@ -0,0 +1,65 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+from scenarios import bootstrap, distribution, monteCarlo, scenarioStats
+from utils import portRet
+
+
+def pool(address, token, fees, reserve=100.0):
+    """
+    Stand-in for an LP after getHist, with the hist_data columns the scenarios read
+    """
+    hist = pd.DataFrame({'WETH/Token': token, 'daily_fees_ETH': fees, 'reserve_ETH': reserve},
+                        index=1640995200 + 86400 * np.arange(len(token)))
+    return SimpleNamespace(pool_address=address, hist_data=hist)
+
+
+def randomPools(nb_pools=5, nb_days=200, seed=1):
+    rng = np.random.default_rng(seed)
+    return [pool('0x%040x' % (0xa000 + i), 0.01 * np.exp(np.cumsum(rng.normal(0, 0.05, nb_days))),
+                 rng.uniform(0.01, 1.0, nb_days)) for i in range(nb_pools)]
+
+
+def test_port_ret_is_the_square_root_of_the_price_ratio():
+    assert portRet(1) == 1
+    ratios = np.array([0.01, 0.25, 0.5, 1.0, 2.0, 4.0, 100.0])
+    np.testing.assert_allclose(portRet(ratios), np.sqrt(ratios), rtol=1e-15)
+
+
+def test_seeded_results_do_not_depend_on_the_chunking():
+    lps = randomPools()
+    inline = scenarioStats(lps, nb_paths=2000, seed=3)
+    spread = scenarioStats(lps, nb_paths=2000, seed=3, max_workers=2, chunk_size=2)
+    pd.testing.assert_frame_equal(inline, spread)
+    assert not inline.equals(scenarioStats(lps, nb_paths=2000, seed=4))
+    # a rerun of one method with the same generator state gives the same paths
+    token_ret, fee_yield = np.full(50, 0.01), np.full(50, 0.001)
+    for method in (monteCarlo, bootstrap):
+        first = method(token_ret, fee_yield, nb_paths=100, rng=np.random.default_rng(5))
+        second = method(token_ret, fee_yield, nb_paths=100, rng=np.random.default_rng(5))
+        np.testing.assert_array_equal(first['LPRet'], second['LPRet'])
+
+
+def test_quantiles_and_cvar():
+    lp_ret = np.random.default_rng(0).permutation(np.arange(100) / 100)
+    stats = distribution({'IL': -lp_ret, 'FeesRet': lp_ret, 'LPRet': lp_ret, 'LPvsHold': lp_ret - 0.5})
+    p05, p50, p95 = np.quantile(lp_ret, [0.05, 0.5, 0.95])
+    assert (stats['LPRet_p05'], stats['LPRet_p50'], stats['LPRet_p95']) == (p05, p50, p95)
+    # the values at or under the 5% quantile, 0.0495, are 0 to 0.04
+    assert np.isclose(stats['CVaR_5'], 0.02)
+    assert stats['P(LP<Hold)'] == 0.5 and stats['paths'] == 100
+
+
+def test_flat_price_pool():
+    # the price never moves and the fees are 1% of the reserves every day: every path earns the same
+    flat = pool('0x%040x' % 0xa000, np.full(60, 0.02), np.full(60, 1.0))
+    stats = scenarioStats([flat], horizon=30, nb_paths=500)
+    expected = 1.01 ** 30 - 1
+    for method in ('montecarlo', 'bootstrap'):
+        row = stats.loc[(flat.pool_address, method)]
+        for column in ['FeesRet_mean', 'LPRet_mean', 'LPRet_p05', 'LPRet_p50', 'LPRet_p95', 'CVaR_5',
+                       'LPvsHold_mean']:
+            assert np.isclose(row[column], expected, rtol=1e-12), (method, column)
+        assert row['IL_mean'] == 0 and row['IL_p05'] == 0 and row['P(LP<Hold)'] == 0
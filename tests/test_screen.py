@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+import urllib.error
+import urllib.request
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from screen import ScreenIndex, parseFilter, serve
+
+NAN = np.nan
+INF = np.inf
+
+
+def summary():
+    """
+    Pools of both exchanges with NaNs, an infinite ratio and ties in every numeric column
+    """
+    return pd.DataFrame({
+        'TVL_ETH': [100, 250, NAN, 100, 40, 900, 100, NAN, 250, 10],
+        'Fees/Vol 30D': [0.5, NAN, 0.5, 1.2, INF, 0.1, 0.5, 0.3, NAN, 0.5],
+        'AnnVol': [0.2, 0.9, 0.4, 0.4, 0.0, NAN, 1.5, 0.4, 0.3, 0.2],
+        'exchange': ['UNI', 'SUSHI', 'UNI', 'SUSHI', 'UNI', 'UNI', 'SUSHI', 'SUSHI', 'UNI', 'SUSHI'],
+    }, index=['0x%040x' % (0xa000 + i) for i in range(10)])
+
+
+def test_query_matches_pandas():
+    df = summary()
+    index = ScreenIndex(stats_path=None, universe_path=None)
+    index.update(df)
+    tvl = df['TVL_ETH']
+    cases = [
+        ([], df),
+        (['TVL_ETH>100'], df[tvl > 100]),
+        (['TVL_ETH>=100', 'exchange==SUSHI'], df[(tvl >= 100) & (df['exchange'] == 'SUSHI')]),
+        (['TVL_ETH<100'], df[tvl < 100]),
+        (['TVL_ETH<=100', 'exchange!=SUSHI'], df[(tvl <= 100) & (df['exchange'] != 'SUSHI')]),
+        (['TVL_ETH=100'], df[tvl == 100]),
+        # NaN verifies no condition
+        (['TVL_ETH!=100'], df[(tvl != 100) & tvl.notna()]),
+        ([('AnnVol', '>', '0.3'), 'Fees/Vol 30D>=0.5'], df[(df['AnnVol'] > 0.3) & (df['Fees/Vol 30D'] >= 0.5)]),
+        (['exchange==BALANCER'], df.iloc[:0]),
+    ]
+    for where, selected in cases:
+        for order_by in ['Fees/Vol 30D', 'TVL_ETH', 'AnnVol']:
+            for ascending in (False, True):
+                for k in (3, None):
+                    expected = selected.sort_values(order_by, ascending=ascending, kind='stable',
+                                                    na_position='last')
+                    expected = expected if k is None else expected.head(k)
+                    pd.testing.assert_frame_equal(index.query(where, order_by, k, ascending), expected,
+                                                  obj=str((where, order_by, ascending, k)))
+
+
+def test_bad_queries():
+    index = ScreenIndex(stats_path=None, universe_path=None)
+    index.update(summary())
+    assert parseFilter(' TVL_ETH >= 10 ') == ('TVL_ETH', '>=', '10')
+    with pytest.raises(ValueError):
+        parseFilter('TVL_ETH')
+    with pytest.raises(KeyError):
+        index.query(['Volume>1'])
+    with pytest.raises(ValueError):
+        index.query(['exchange>UNI'])
+    with pytest.raises(ValueError):
+        index.query(['TVL_ETH>many'])
+    with pytest.raises(KeyError):
+        index.query(order_by='exchange')
+
+
+def test_refresh_after_rewrite(tmp_path):
+    path = str(tmp_path / 'final_lp_stats.csv')
+    df = summary()
+    df.to_csv(path)
+    index = ScreenIndex(path, universe_path=None)
+    assert index.query(k=1).index[0] == df.index[4]
+    assert not index.refresh()
+    df.loc[df.index[9], 'Fees/Vol 30D'] = 1e9
+    df.loc[df.index[4], 'Fees/Vol 30D'] = 0.0
+    df.to_csv(path)
+    # the rewrite may land within the clock resolution of the first write
+    os.utime(path, ns=(os.stat(path).st_atime_ns, os.stat(path).st_mtime_ns + 10 ** 9))
+    assert index.query(k=1).index[0] == df.index[9]
+
+
+def test_serve_top():
+    index = ScreenIndex(stats_path=None, universe_path=None)
+    index.update(summary())
+    server = serve(index, '127.0.0.1', 0)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        url = 'http://127.0.0.1:%d/top?order_by=TVL_ETH&k=2&where=exchange==UNI' % server.server_address[1]
+        with urllib.request.urlopen(url) as response:
+            records = json.loads(response.read())
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen('http://127.0.0.1:%d/top?where=exchange>UNI' % server.server_address[1])
+        assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
+    expected = index.query(['exchange==UNI'], 'TVL_ETH', 2)
+    assert [r['pool'] for r in records] == list(expected.index)
+    assert [r['TVL_ETH'] for r in records] == list(expected['TVL_ETH'])
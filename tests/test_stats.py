@@ -0,0 +1,104 @@
+import copy
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from incremental import LPStats, StatsState, incrementalStats
+from main import LP
+from panel import panelFromLPs, panelStats
+from standin import GraphStandIn, syntheticPools
+from sweep import sweepLP
+
+
+@pytest.fixture
+def lps(workdir):
+    """
+    Fetched histories of synthetic WETH pools, half of them on each exchange
+    """
+    pools = {a: rows for a, rows in syntheticPools(nb_pools=12, nb_days=120).items()
+             if 'WETH' in (rows[0]['token0']['symbol'], rows[0]['token1']['symbol'])}
+    with GraphStandIn(pools) as graph:
+        lps = [LP(exchange=['UNI', 'SUSHI'][i % 2], pool_address=address, initial_stake=0.01, fees=0.003,
+                  start_ts=0, graph_api=graph.url(['UNI', 'SUSHI'][i % 2]), rewards_api=graph.rewardsUrl())
+               for i, address in enumerate(pools)]
+        for lp in lps:
+            lp.getHist()
+    return lps
+
+
+def assertSummariesEqual(got, expected):
+    numeric = expected.select_dtypes('number').columns
+    assert (got.index == expected.index).all()
+    np.testing.assert_allclose(got[numeric].to_numpy(dtype='float64'), expected[numeric].to_numpy(dtype='float64'),
+                               rtol=1e-12, atol=1e-15)
+    assert (got['Pair'] == expected['Pair']).all()
+
+
+def test_panel_stats_match_get_stats(lps):
+    expected = pd.concat([lp.getStats()[1] for lp in lps])
+    panel, rewards = panelFromLPs(lps)
+    _, summary = panelStats(panel, initial_stake=0.01, rewards=rewards)
+    assertSummariesEqual(summary.loc[expected.index, expected.columns], expected)
+
+
+def test_incremental_stats_match_get_stats(lps):
+    expected = pd.concat([lp.getStats()[1] for lp in lps])
+    dates = lps[0].hist_data.index
+    # a first run 60 days ago saves the closed days, the next one from a reloaded state adds the others,
+    # the last day still moving
+    earlier = []
+    for lp in lps:
+        cut = copy.copy(lp)
+        cut.hist_data = lp.hist_data[lp.hist_data.index <= dates[-60]]
+        earlier.append(cut)
+    incrementalStats(earlier, int(dates[-60]), StatsState('state'))
+    summary = incrementalStats(lps, int(dates[-1]), StatsState('state'))
+    assertSummariesEqual(summary, expected)
+    # the moving day was not saved, a rerun gives the same summary
+    assertSummariesEqual(incrementalStats(lps, int(dates[-1]), StatsState('state')), expected)
+
+
+def test_sweep_window_matches_get_stats_of_the_cut_history(lps):
+    columns = ['nbDays', 'CumulRet', 'FeesRet', 'AnnRet', 'AnnVol', 'MaxDrawdown', 'Fees/Vol', 'FeesAnn']
+    for lp in lps[:4]:
+        dates = lp.hist_data.index
+        grid = sweepLP(lp.hist_data, entries=[dates[10], dates[40]], holdings=[7, 30], stakes=[0.02])
+        assert len(grid) == 4
+        for (entry, holding, stake), window in grid.iterrows():
+            cut = copy.copy(lp)
+            cut.initial_stake = stake
+            cut.hist_data = lp.hist_data[(dates >= entry) & (dates <= window['exit'])]
+            df_hist, expected = cut.getStats()
+            assert window['nbDays'] == holding
+            np.testing.assert_allclose(window[columns].to_numpy(dtype='float64'),
+                                       expected.iloc[0][columns].to_numpy(dtype='float64'), rtol=1e-10)
+            np.testing.assert_allclose(window['NAV_ETH'], df_hist['NAV_ETH'].iloc[-1], rtol=1e-12)
+
+
+def handBuilt(nb_days=45, **columns):
+    """
+    LP with a flat WETH/Token, constant reserves, supply and fees, some days overridden by columns
+    """
+    lp = LP(exchange='UNI', pool_address='0x%040x' % 0xa000, initial_stake=0.01, fees=0.003, start_ts=0)
+    lp.token0, lp.token1, lp.rewards = 'WETH', 'TK', 0
+    hist = pd.DataFrame({'totalSupply': 1000.0, 'reserve_ETH': 50.0, 'daily_fees_ETH': 0.1, 'WETH/Token': 0.5},
+                        index=pd.Index(1640995200 + 86400 * np.arange(nb_days), name='date'))
+    for column, days in columns.items():
+        for day, value in days.items():
+            hist.iloc[day, hist.columns.get_loc(column)] = value
+    lp.hist_data = hist
+    return lp
+
+
+def test_incremental_stats_on_degenerate_histories():
+    cases = [handBuilt(),
+             # drained for a day, then a day without fees
+             handBuilt(totalSupply={20: 0.0}, daily_fees_ETH={25: np.nan}),
+             # the last day has no fees, the compounded products end on a NaN
+             handBuilt(daily_fees_ETH={-1: np.nan, 30: np.nan}),
+             handBuilt(reserve_ETH={0: 0.0})]
+    for lp in cases:
+        stats = LPStats(lp.exchange, lp.pool_address, lp.initial_stake, 'WETH_TK')
+        stats.ingest(lp.hist_data)
+        assertSummariesEqual(stats.summary(), lp.getStats()[1])
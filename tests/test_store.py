@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+
+from store import ParquetStore
+
+POOLS = ['0x%040x' % 0xa000, '0x%040X' % 0xa001]
+DAYS = ['2022-01-01', '2022-01-02', '2022-01-03']
+
+
+def summary(supplies, reserves, fees):
+    """
+    node_summary frame of three days
+    """
+    return pd.DataFrame({'ETH fees': fees, 'Supply': np.array(supplies, dtype=object),
+                         'reserve0': np.array(reserves, dtype=object),
+                         'blockHash': [b'\x01' * 32, '0x' + '02' * 32, "b'" + '\\x03' * 32 + "'"]},
+                        index=pd.Index(DAYS, name='day'))
+
+
+def test_round_trip(tmp_path):
+    store = ParquetStore(str(tmp_path))
+    big = [2 ** 256 - 1, 2 ** 255, 10 ** 18]
+    assert store.append('node_summary', 'UNI', POOLS[0], summary(big, [1, np.nan, 3], [0.1, 0.2, 0.3])) == 3
+    # a pool whose reserves are all missing in its part
+    store.append('node_summary', 'SUSHI', POOLS[1], summary([5, 6, 7], [np.nan] * 3, [1.0, np.nan, 3.0]))
+    stored = store.read('node_summary')
+    assert len(stored) == 6
+    first = stored.loc[('UNI', POOLS[0].lower())]
+    assert first['Supply'].tolist() == big
+    assert first['reserve0'].iloc[[0, 2]].tolist() == [1, 3] and pd.isna(first['reserve0'].iloc[1])
+    assert first['blockHash'].tolist() == [b'\x01' * 32, b'\x02' * 32, b'\x03' * 32]
+    second = stored.loc[('SUSHI', POOLS[1].lower())]
+    assert second['Supply'].tolist() == [5, 6, 7] and second['reserve0'].isna().all()
+    np.testing.assert_array_equal(second['ETH fees'].to_numpy(), [1.0, np.nan, 3.0])
+
+
+def test_projection_and_pool_filter(tmp_path):
+    store = ParquetStore(str(tmp_path))
+    for pool in POOLS:
+        store.append('node_summary', 'UNI', pool, summary([1, 2, 3], [4, 5, 6], [0.1, 0.2, 0.3]))
+    stored = store.read('node_summary', columns=['Supply'], pools=[POOLS[1]])
+    assert list(stored.columns) == ['Supply']
+    assert stored.index.get_level_values('pool').unique().tolist() == [POOLS[1].lower()]
+    assert stored['Supply'].tolist() == [1, 2, 3]
+
+
+def test_append_keeps_the_days_after_the_last_stored(tmp_path):
+    store = ParquetStore(str(tmp_path))
+    df = summary([1, 2, 3], [4, 5, 6], [0.1, 0.2, 0.3])
+    store.append('node_summary', 'UNI', POOLS[0], df.iloc[:2])
+    assert store.append('node_summary', 'UNI', POOLS[0], df) == 1
+    assert store.lastDay('node_summary', 'UNI', POOLS[0]) == np.datetime64('2022-01-03')
+    assert store.read('node_summary')['Supply'].tolist() == [1, 2, 3]
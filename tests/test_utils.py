@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+from gql import gql
+
+from standin import GraphStandIn, syntheticPools
+from utils import BlockDateIndex, blockToDate, client
+
+
+def test_block_date_index_matches_block_to_date(workdir):
+    path = 'data/block_date_map.csv'
+    map_table = pd.read_csv(path, index_col=0, sep='\t')
+    blocks = np.random.default_rng(0).integers(map_table['Block'].min() - 100, map_table['Block'].max() + 100, 500)
+    expected = [blockToDate(b, map_table) for b in blocks]
+    got = BlockDateIndex.fromCsv(path, mmap=True).toDates(blocks)
+    assert [e if isinstance(e, str) else None for e in expected] == [g if isinstance(g, str) else None for g in got]
+
+
+def test_mmap_rebuilt_when_an_array_is_missing_or_stale(workdir):
+    path = 'data/block_date_map.csv'
+    expected = BlockDateIndex.fromCsv(path)
+    BlockDateIndex.fromCsv(path, mmap=True)
+    os.remove(path + '.days.npy')
+    index = BlockDateIndex.fromCsv(path, mmap=True)
+    assert (index.days == expected.days).all() and (index.blocks == expected.blocks).all()
+    # a days array older than the map, e.g. left by an interrupted rebuild
+    np.save(path + '.days.npy', expected.days[:10])
+    os.utime(path + '.days.npy', (0, 0))
+    index = BlockDateIndex.fromCsv(path, mmap=True)
+    assert len(index.days) == len(expected.days)
+    assert not any(n.endswith('.tmp') for n in os.listdir('data'))
+
+
+def test_schema_introspected_once_per_endpoint():
+    pools = syntheticPools(nb_pools=1, nb_days=5)
+    query = gql('query($where: PairDayData_filter) { pairDayDatas(where: $where) { date } }')
+    with GraphStandIn(pools) as graph:
+        first, second = client(graph.url('UNI')), client(graph.url('UNI'))
+        assert graph.requests == 1
+        for cli in (first, second):
+            assert len(cli.execute(query, variable_values={'where': {}})['pairDayDatas']) == 5
+        assert graph.requests == 3
+        # a warm rerun only sends the queries, another endpoint gets its own schema
+        client(graph.url('UNI')).execute(query, variable_values={'where': {}})
+        client(graph.url('SUSHI'))
+        assert graph.requests == 5
+
+
+def test_slow_introspection_does_not_hold_other_endpoints():
+    pools = syntheticPools(nb_pools=1, nb_days=5)
+    with GraphStandIn(pools, latency=1.0) as slow, GraphStandIn(pools) as fast:
+        thread = threading.Thread(target=client, args=(slow.url(),))
+        thread.start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        client(fast.url())
+        assert time.perf_counter() - start < 0.5
+        thread.join()
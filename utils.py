@@ -1,8 +1,17 @@
 from gql import gql, Client
 from datetime import datetime
-from math import sqrt
+from functools import lru_cache
+import os
+import numpy as np
+import pandas as pd
 from gql.transport.requests import RequestsHTTPTransport
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import threading
 import time
+import instrument
+from config import GRAPH_RATE_LIMITS, BLOCK_DATE_MAP, HTTP_POOL_HOSTS, HTTP_POOL_SIZE, HTTP_RETRIES
 
 TIMESTAMP_PER_YEAR=86400*360
 
@@ -28,33 +37,234 @@ def blockToDate(block,map_table):
     return df_map.index.max()
 
 
+class BlockDateIndex:
+    def __init__(self, blocks, days):
+        """
+        Sorted block -> date lookup, same convention as blockToDate: a block belongs to the
+        last day whose first block is strictly lower
+        :param blocks: first block of each day, increasing
+        :param days: datetime64[D] array of the matching days
+        """
+        self.blocks = blocks
+        self.days = days
+
+    @classmethod
+    def fromCsv(cls, path=BLOCK_DATE_MAP, mmap=False):
+        """
+        :param path: tab separated Day/Block map
+        :param mmap: keep the arrays in .npy files next to the map and memory-map them,
+        they are rebuilt whenever the csv is newer
+        :return: BlockDateIndex
+        """
+        if mmap:
+            blocks_file, days_file = path + '.blocks.npy', path + '.days.npy'
+            if any(not os.path.exists(f) or os.path.getmtime(f) < os.path.getmtime(path)
+                   for f in (blocks_file, days_file)):
+                index = cls.fromCsv(path)
+                # written aside then renamed, an interrupted rebuild leaves no half written array
+                for file, values in ((blocks_file, index.blocks), (days_file, index.days)):
+                    with open(file + '.tmp', 'wb') as f:
+                        np.save(f, values)
+                    os.replace(file + '.tmp', file)
+            return cls(np.load(blocks_file, mmap_mode='r'), np.load(days_file, mmap_mode='r'))
+        map_table = pd.read_csv(path, index_col=0, sep='\t').sort_values('Block')
+        return cls(map_table['Block'].to_numpy(dtype='int64'), map_table.index.to_numpy(dtype='datetime64[D]'))
+
+    def toDates(self, blocks):
+        """
+        Vectorized blockToDate
+        :param blocks: array of block numbers
+        :return: object array of 'YYYY-MM-DD' strings, nan for blocks before the first day of the map
+        """
+        pos = np.searchsorted(self.blocks, np.asarray(blocks, dtype='int64'), side='left') - 1
+        dates = np.datetime_as_string(self.days[np.maximum(pos, 0)]).astype(object)
+        dates[pos < 0] = np.nan
+        return dates
+
+    def firstBlocks(self, dates):
+        """
+        :param dates: array of 'YYYY-MM-DD' days present in the map
+        :return: first block of each day
+        """
+        dates = np.asarray(dates, dtype='datetime64[D]')
+        pos = np.minimum(np.searchsorted(self.days, dates), len(self.days) - 1)
+        missing = self.days[pos] != dates
+        if missing.any():
+            raise KeyError('days not in the block map: %s' % dates[missing])
+        return np.asarray(self.blocks[pos])
+
+
+@lru_cache(maxsize=None)
+def blockDateIndex(path=BLOCK_DATE_MAP, mmap=True):
+    """
+    :return: the BlockDateIndex of the map, loaded once per process
+    """
+    return BlockDateIndex.fromCsv(path, mmap=mmap)
+
+
+
+class RateLimiter:
+    def __init__(self, rate, burst=1, name=None):
+        """
+        Token bucket shared by every thread talking to the same endpoint
+        :param rate: requests per second, None for no limit
+        :param burst: number of requests that can go out back to back
+        :param name: endpoint name the waits are counted under, see instrument.count
+        """
+        self.rate = rate
+        self.name = name
+        self.burst = burst
+        self.tokens = burst
+        self.last = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Blocks until a request is allowed
+        """
+        if self.rate is None:
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+            self.last = now
+            self.tokens -= 1
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0
+        if wait > 0:
+            instrument.count(self.name, throttle_s=wait)
+            time.sleep(wait)
+
+    def delay(self):
+        """
+        :return: seconds before acquire would let a request go, without taking a token
+        """
+        if self.rate is None:
+            return 0.0
+        with self.lock:
+            tokens = min(self.burst, self.tokens + (time.monotonic() - self.last) * self.rate)
+        return max(0.0, (1 - tokens) / self.rate)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def rateLimiter(api_url):
+    """
+    :param api_url: endpoint url
+    :return: the process wide limiter of that endpoint, rate taken from GRAPH_RATE_LIMITS
+    """
+    with _limiters_lock:
+        if api_url not in _limiters:
+            _limiters[api_url] = RateLimiter(GRAPH_RATE_LIMITS.get(api_url), name=instrument.endpointName(api_url))
+        return _limiters[api_url]
+
+
+class RateLimitedTransport(RequestsHTTPTransport):
+    """
+    Requests transport waiting on the endpoint rate limiter before each query
+    """
+
+    def execute(self, document, *args, **kwargs):
+        rateLimiter(self.url).acquire()
+        return super().execute(document, *args, **kwargs)
+
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def httpSession():
+    """
+    Process wide requests session: connections to each host are kept alive and reused by
+    every subgraph client, rewards, etherscan and node call. Each response is counted by instrument
+    :return: requests.Session
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = newSession()
+        return _session
+
+
+def newSession(retries=HTTP_RETRIES):
+    """
+    :param retries: retries of a request on connection errors and 5xx, 0 to let the caller fail over at once
+    :return: requests.Session keeping connections alive, each response counted by instrument
+    """
+    retry = Retry(total=retries, backoff_factor=0.1, status_forcelist=[500, 502, 503, 504]) if retries > 0 else 0
+    adapter = HTTPAdapter(pool_connections=HTTP_POOL_HOSTS, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+    session = requests.Session()
+    session.hooks['response'].append(instrument.onResponse)
+    for prefix in "http://", "https://":
+        session.mount(prefix, adapter)
+    return session
+
+
+_schemas = {}
+# one lock per endpoint, so that a slow introspection only holds back the clients of its own endpoint
+_schema_locks = {}
+_schemas_lock = threading.Lock()
+
 
 def client(api_url):
     """
-    Initializes a connection to subgraph
+    Initializes a connection to subgraph, the schema is introspected once per endpoint
+    and the http connections are shared with the other clients
     :param api_url: subgraph url for connection
-    is_secure: do we need to use https
     :return:
     """
-    sample_transport = RequestsHTTPTransport(
+    sample_transport = RateLimitedTransport(
         url=api_url,
         headers= {'user-agent':'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/102.0.0.0 Safari/537.36'},
         verify=True,
-        retries=10,
     )
+    sample_transport.session = httpSession()
+    with _schemas_lock:
+        lock = _schema_locks.setdefault(api_url, threading.Lock())
+    with lock:
+        if api_url not in _schemas:
+            _schemas[api_url] = Client(transport=sample_transport, fetch_schema_from_transport=True).schema
     client = Client(
+        schema=_schemas[api_url],
         transport=sample_transport,
-    fetch_schema_from_transport = True
     )
     return client
 
+def paginate(cli, query, where, cursor_field, cursor=None, first=1000):
+    """
+    Pages through a subgraph entity with a `<cursor_field>_gt` cursor rather than skip,
+    which The Graph caps at 5000
+    :param cli: subgraph client
+    :param query: query taking `$where` and `$first` variables and ordered ascending by cursor_field
+    :param where: filter of the query, the cursor condition is added to it
+    :param cursor_field: field the results are ordered by, e.g. 'id' or 'date'
+    :param cursor: start after this value, None to start from the beginning
+    :param first: page size
+    :return: generator of lists of rows
+    """
+    document = gql(query)
+    while True:
+        page_where = dict(where)
+        if cursor is not None:
+            page_where[cursor_field + '_gt'] = cursor
+        response = cli.execute(document, variable_values={'where': page_where, 'first': first})
+        rows = list(response.values())[0]
+        if len(rows) > 0:
+            yield rows
+        if len(rows) < first:
+            return
+        cursor = rows[-1][cursor_field]
+
+
 def portRet(token_perf):
     """
-    :param token_perf:     Token Perf versus WETH or base
-    :return: portfolio returns
+    Value of a 50/50 LP position against WETH, without fees. Works on scalars and numpy arrays
+    :param token_perf: Token Perf versus WETH or base, as a price ratio: 1 when the price did not move
+    :return: portfolio returns, LP value per unit invested
     """
     port50_50=0.5+0.5*token_perf
-    il= 2 * sqrt(2 + token_perf) /(2 + token_perf) -1
+    il= 2 * np.sqrt(token_perf) /(1 + token_perf) -1
     lp_return=port50_50*(1+il)
     return lp_return
 